@@ -0,0 +1,133 @@
+"""
+Process-wide, in-memory copy of the category table.
+
+The category table is tiny and almost never written, yet nearly every request
+needs a category name or ID. The cache maps Category_ID to the category row and
+normalized category name to Category_ID so those lookups never touch the
+database. It is loaded by create_app and invalidated whenever a transaction that
+wrote a Category commits; the next lookup then reloads it.
+
+Each process keeps its own copy, so writes made by another process (or with raw
+SQL) are only seen after that process reloads or restarts.
+"""
+from threading import RLock
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from api.models import Category
+
+
+class CachedCategory(NamedTuple):
+    """Read-only copy of a category row; interchangeable with Category for reads."""
+    Category_ID: int
+    Category: str
+    Description: str
+
+    def to_dict(self):
+        return {
+            "Category_ID": self.Category_ID,
+            "Category": self.Category,
+            "Description": self.Description
+        }
+
+
+def normalize_category_name(name: str) -> str:
+    """Normalize a category name the way category names are stored (upper case, trimmed)."""
+    return name.upper().strip()
+
+
+class CategoryCache:
+    def __init__(self):
+        self._lock = RLock()
+        self._by_id: Dict[int, CachedCategory] = {}
+        self._id_by_name: Dict[str, int] = {}
+        self._loaded = False
+        # Bumped on every reload or invalidation, so callers can detect changes
+        self.version = 0
+
+    def load(self):
+        """
+        (Re)load every category from the database. Requires an app context.
+        """
+        rows = Category.query.order_by(Category.Category_ID).all()
+        by_id = {row.Category_ID: CachedCategory(row.Category_ID, row.Category, row.Description)
+                 for row in rows}
+        id_by_name = {normalize_category_name(row.Category): row.Category_ID for row in rows}
+
+        with self._lock:
+            self._by_id = by_id
+            self._id_by_name = id_by_name
+            self._loaded = True
+            self.version += 1
+
+    def invalidate(self):
+        """Drop the cached rows; the next lookup reloads them."""
+        with self._lock:
+            self._loaded = False
+            self.version += 1
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    def all(self) -> List[CachedCategory]:
+        """Return every category, ordered by Category_ID."""
+        self._ensure_loaded()
+        return list(self._by_id.values())
+
+    def get(self, category_id) -> Optional[CachedCategory]:
+        """
+        Look up a category by ID. Accepts the string form too, as stored in
+        user_preference.Category_ID.
+        """
+        self._ensure_loaded()
+        category = self._by_id.get(category_id)
+        if category is None and isinstance(category_id, str) and category_id.isdigit():
+            category = self._by_id.get(int(category_id))
+        return category
+
+    def id_for_name(self, name: str) -> Optional[int]:
+        """Resolve an exact category name (case-insensitive) to its Category_ID."""
+        self._ensure_loaded()
+        return self._id_by_name.get(normalize_category_name(name))
+
+    def ids_matching(self, partial_name: str) -> List[int]:
+        """
+        Return the IDs of every category whose name contains `partial_name`
+        (case-insensitive), the in-memory equivalent of ILIKE '%name%'.
+        """
+        self._ensure_loaded()
+        needle = normalize_category_name(partial_name)
+        return [category_id for name, category_id in self._id_by_name.items() if needle in name]
+
+
+category_cache = CategoryCache()
+
+
+# ---------------------------------------------------------
+# Invalidation on category writes
+# ---------------------------------------------------------
+
+def _mark_category_write(mapper, connection, target):
+    session = inspect(target).session
+    if session is not None:
+        session.info['category_written'] = True
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event_name, _mark_category_write)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('category_written', False):
+        category_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_write(session):
+    session.info.pop('category_written', None)
@@ -0,0 +1,151 @@
+"""
+In-memory category co-occurrence matrix for category recommendations.
+
+`user_preference` is a user x category incidence matrix X. Its Gram matrix
+C = X^T X holds, for every pair of categories, the number of users who chose
+both (the diagonal is each category's user count). It is tiny (categories
+squared), so "users who like A also like..." and per-user recommendations are a
+few vector operations on it instead of a self-join over the preference table.
+
+The matrix is built by create_app from the preference bitmask index
+(api.preference_index): every distinct preference set, unpacked to a row of the
+incidence matrix and weighted by its number of users. When a transaction that
+changed preferences commits, each user's old set is subtracted from the matrix
+and the new one added (see api.preference_index.record_preference_change).
+
+Like the category cache, the matrix is per process: writes made by another
+process (or with raw SQL) are only seen after this process reloads or restarts.
+"""
+from threading import Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from api.preference_index import preference_index
+
+
+class CooccurrenceState(NamedTuple):
+    """One immutable version of the matrix and the arrays derived from it."""
+    category_ids: np.ndarray            # Category_ID of each row/column, ascending
+    columns: Dict[int, int]             # Category_ID -> row/column
+    counts: np.ndarray                  # users who chose both categories (int64, square)
+    users: int                          # users with at least one preference
+    conditional: np.ndarray             # conditional[i, j]: share of category i's users who chose j
+    popularity: np.ndarray              # share of users who chose each category
+
+
+def _derive(category_ids: np.ndarray, counts: np.ndarray, users: int) -> CooccurrenceState:
+    user_counts = np.diagonal(counts).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conditional = np.where(user_counts[:, None] > 0, counts / user_counts[:, None], 0.0)
+    popularity = user_counts / users if users else np.zeros_like(user_counts)
+    columns = {int(category_id): column for column, category_id in enumerate(category_ids.tolist())}
+    return CooccurrenceState(category_ids, columns, counts, users, conditional, popularity)
+
+
+def _empty_state() -> CooccurrenceState:
+    return _derive(np.empty(0, dtype=np.int64), np.zeros((0, 0), dtype=np.int64), 0)
+
+
+class CategoryCooccurrence:
+    def __init__(self):
+        self._lock = Lock()
+        self._state = _empty_state()
+        self._loaded = False
+
+    def load(self):
+        """(Re)build the matrix from the preference index, which must be loaded first."""
+        bit_category_ids, masks, weights = preference_index.mask_counts()
+        order = np.argsort(bit_category_ids, kind='stable')
+        category_ids = np.array(bit_category_ids, dtype=np.int64)[order]
+        # One incidence row per distinct preference set, columns in Category_ID order
+        incidence = ((masks.astype(np.uint64)[:, None] >> order.astype(np.uint64)) & np.uint64(1)).astype(np.int64)
+        counts = (incidence.T * weights) @ incidence
+        users = int(weights[masks != 0].sum())
+
+        with self._lock:
+            self._state = _derive(category_ids, counts, users)
+            self._loaded = True
+
+    def apply(self, changes: List[Tuple[List[int], List[int]]]):
+        """
+        Replace users' category sets: each change is (old Category_IDs, new Category_IDs)
+        of one user. Ignored until the matrix is loaded (the load reads committed rows).
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            state = self._state
+            category_ids, counts, users = state.category_ids, state.counts.copy(), state.users
+
+            new_ids = {int(category_id) for old, new in changes for category_id in (*old, *new)}
+            new_ids -= state.columns.keys()
+            if new_ids:
+                # A category first chosen after the load: grow the matrix, keeping IDs sorted
+                category_ids = np.array(sorted(state.columns.keys() | new_ids), dtype=np.int64)
+                positions = np.searchsorted(category_ids, state.category_ids)
+                grown = np.zeros((len(category_ids), len(category_ids)), dtype=np.int64)
+                grown[np.ix_(positions, positions)] = counts
+                counts = grown
+            columns = {int(category_id): column for column, category_id in enumerate(category_ids.tolist())}
+
+            for old, new in changes:
+                old_columns = [columns[int(category_id)] for category_id in set(old)]
+                new_columns = [columns[int(category_id)] for category_id in set(new)]
+                counts[np.ix_(old_columns, old_columns)] -= 1
+                counts[np.ix_(new_columns, new_columns)] += 1
+                users += bool(new_columns) - bool(old_columns)
+
+            self._state = _derive(category_ids, counts, users)
+
+    def recommend(self, category_ids: Iterable[int], limit: int = 5) -> List[Tuple[int, float]]:
+        """
+        Categories to suggest to a user who chose `category_ids`, best first, with
+        their score: the share of users of the user's categories who also chose it,
+        averaged over those categories. Without categories, the most popular ones.
+
+        Returns:
+            List[Tuple[int, float]]: (Category_ID, score) pairs; only categories with
+            a score above zero.
+        """
+        state = self._state
+        chosen = [state.columns[int(category_id)] for category_id in category_ids
+                  if int(category_id) in state.columns]
+        if chosen:
+            scores = state.conditional[chosen].mean(axis=0)
+            scores[chosen] = 0.0
+        else:
+            scores = state.popularity.copy()
+        return self._top(state, scores, limit)
+
+    def also_liked(self, category_id: int, limit: int = 10) -> Optional[Tuple[int, List[Tuple[int, int, float, float]]]]:
+        """
+        The categories most often chosen by users of `category_id`.
+
+        Returns:
+            Optional[Tuple[int, List[Tuple[int, int, float, float]]]]: The category's user
+            count and, best first, (Category_ID, users who chose both, share of the
+            category's users, lift) per category, where lift is that share divided by
+            the share of all users who chose it; None if no user chose the category.
+        """
+        state = self._state
+        column = state.columns.get(int(category_id))
+        if column is None or not state.counts[column, column]:
+            return None
+        shares = state.conditional[column].copy()
+        shares[column] = 0.0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lifts = np.where(state.popularity > 0, shares / state.popularity, 0.0)
+        return int(state.counts[column, column]), [
+            (other_id, int(state.counts[column, state.columns[other_id]]), share,
+             float(lifts[state.columns[other_id]]))
+            for other_id, share in self._top(state, shares, limit)
+        ]
+
+    @staticmethod
+    def _top(state: CooccurrenceState, scores: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+        order = np.argsort(-scores, kind='stable')[:max(limit, 0)]
+        return [(int(state.category_ids[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+
+category_cooccurrence = CategoryCooccurrence()
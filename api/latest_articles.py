@@ -0,0 +1,179 @@
+"""
+In-memory index of the newest articles of each category, for GET /articles/latest.
+
+Each category keeps a bounded buffer of its LATEST_PER_CATEGORY newest articles,
+newest first by (Published_At, Article_ID), holding the listing fields
+(LATEST_FIELDS; not Content), so "latest in category X" is answered without any
+SQL. Articles may be published out of order, so new ones are inserted at their
+place rather than appended, and the oldest entry falls off a full buffer. A
+buffer is `complete` while it holds every article of its category; otherwise a
+page that reaches past its oldest entry is read from the database instead, through
+the (Category_ID, Published_At DESC) index.
+
+The buffers are filled by create_app from the article table. create_articles_batch
+records the articles it stores in its transaction (record_new_articles); they are
+added here when it commits, and a rolled-back transaction changes nothing.
+
+Like the category cache, the index is per process: articles stored by another
+process (or with raw SQL) are only seen after this process reloads or restarts.
+"""
+import heapq
+from datetime import datetime
+from itertools import islice
+from threading import Lock
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from api.models import db, Article
+from api.category_cache import category_cache
+
+# Newest articles kept per category
+LATEST_PER_CATEGORY = 100
+
+
+class LatestArticle(NamedTuple):
+    """The listing fields of one article; interchangeable with Article in the serializer."""
+    Article_ID: int
+    Title: str
+    Snippet: str
+    URL: Optional[str]
+    Authors: Optional[str]
+    Category_ID: int
+    Published_At: Optional[datetime]
+
+
+# Article fields a LatestArticle (with its cached category) can serve
+LATEST_FIELDS = frozenset(LatestArticle._fields) | {"Category", "Description"}
+
+
+def recency_key(article) -> Tuple[datetime, int]:
+    """Sort key of the latest-first order; articles without Published_At sort last."""
+    return article.Published_At or datetime.min, article.Article_ID
+
+
+def _page(entries: Tuple[LatestArticle, ...], limit: int, since: Optional[datetime],
+          before: Optional[datetime], after: Optional[Tuple[datetime, int]]) -> Tuple[List[LatestArticle], bool]:
+    """
+    The first `limit` entries matching the filters, and whether that is every
+    matching article the buffer's category could contribute to the page.
+    """
+    page = []
+    for entry in entries:
+        published = entry.Published_At
+        if published is None:
+            if since is not None or before is not None:
+                continue
+        elif before is not None and published >= before:
+            continue
+        if after is not None and recency_key(entry) >= after:
+            continue
+        if since is not None and published is not None and published < since:
+            # Everything after this entry is older still
+            return page, True
+        page.append(entry)
+        if len(page) == limit:
+            return page, True
+    return page, False
+
+
+class LatestArticles:
+    def __init__(self, size: int = LATEST_PER_CATEGORY):
+        self._lock = Lock()
+        self.size = size
+        # Category_ID -> (entries newest first, whether they are all of the category's articles)
+        self._buffers: Dict[int, Tuple[Tuple[LatestArticle, ...], bool]] = {}
+        self._loaded = False
+
+    def load(self):
+        """(Re)fill the buffers from the article table. Requires an app context."""
+        from api.services import SNIPPET_LENGTH
+
+        buffers = {}
+        for category in category_cache.all():
+            rows = (
+                db.session.query(Article.Article_ID, Article.Title, func.substr(Article.Content, 1, SNIPPET_LENGTH),
+                                 Article.URL, Article.Authors, Article.Category_ID, Article.Published_At)
+                .filter(Article.Category_ID == category.Category_ID)
+                .order_by(Article.Published_At.desc(), Article.Article_ID.desc())
+                .limit(self.size)
+                .all()
+            )
+            buffers[category.Category_ID] = (tuple(LatestArticle(*row) for row in rows), len(rows) < self.size)
+
+        with self._lock:
+            self._buffers = buffers
+            self._loaded = True
+
+    def add(self, articles: Iterable[LatestArticle]):
+        """Insert newly stored articles into their categories' buffers. Ignored until loaded."""
+        with self._lock:
+            if not self._loaded:
+                return
+            by_category: Dict[int, List[LatestArticle]] = {}
+            for article in articles:
+                by_category.setdefault(article.Category_ID, []).append(article)
+
+            for category_id, new in by_category.items():
+                # A category unknown at load time may have articles the buffer never saw
+                entries, complete = self._buffers.get(category_id, ((), False))
+                merged = sorted((*entries, *new), key=recency_key, reverse=True)
+                if len(merged) > self.size:
+                    merged, complete = merged[:self.size], False
+                self._buffers[category_id] = (tuple(merged), complete)
+
+    def latest(self, category_ids: List[int], limit: int, since: Optional[datetime] = None,
+               before: Optional[datetime] = None,
+               after: Optional[Tuple[datetime, int]] = None) -> Optional[List[LatestArticle]]:
+        """
+        The newest `limit` articles of the given categories, newest first.
+
+        Args:
+            category_ids (List[int]): The categories to read.
+            limit (int): Maximum number of articles to return.
+            since (datetime, optional): Only articles published at or after this time.
+            before (datetime, optional): Only articles published before this time.
+            after (Tuple[datetime, int], optional): Only articles older than this
+                (Published_At, Article_ID) position (keyset cursor).
+
+        Returns:
+            Optional[List[LatestArticle]]: The page, or None if the buffers may not hold
+            all of it (the caller then reads the database).
+        """
+        pages = []
+        for category_id in category_ids:
+            buffer = self._buffers.get(category_id)
+            if buffer is None:
+                return None
+            entries, complete = buffer
+            page, answered = _page(entries, limit, since, before, after)
+            if not (answered or complete):
+                return None
+            pages.append(page)
+        return list(islice(heapq.merge(*pages, key=recency_key, reverse=True), limit))
+
+
+latest_articles = LatestArticles()
+
+
+def record_new_articles(articles: Iterable[LatestArticle], session: Session = None):
+    """Record articles stored by the current transaction; they are added to the buffers when it commits."""
+    session = session or db.session
+    session.info.setdefault('new_articles', []).extend(articles)
+
+
+# ---------------------------------------------------------
+# Updating on commit
+# ---------------------------------------------------------
+
+@event.listens_for(Session, 'after_commit')
+def _add_after_commit(session):
+    articles = session.info.pop('new_articles', None)
+    if articles:
+        latest_articles.add(articles)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_articles(session):
+    session.info.pop('new_articles', None)
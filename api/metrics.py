@@ -0,0 +1,365 @@
+"""
+Per-request instrumentation, exposed in Prometheus text format at /api/metrics.
+
+For every request to the API blueprint we record, labelled by route (the URL
+rule, e.g. /api/users/<string:user_id>):
+
+- latency (a histogram) and a request count by method and status,
+- the SQL statements it ran (a histogram of statements per request, so an N+1
+  shows up as requests moving to the high buckets) and their total duration,
+- the rows fetched from SQLite and the response bytes sent.
+
+Streamed responses are finished when the server closes them, so their latency,
+queries and bytes include the streaming. SQL statements are attributed through
+the pooled connection: a connection checked out while a request is running is
+tagged with that request's stats until it is returned. Statement time and rows
+are measured per execute/fetch call (not per row) by a sqlite3 Connection/Cursor
+subclass installed when connections are opened; the same cursor feeds the
+slow-query log (api.slow_queries). Everything is kept in memory per process.
+"""
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from api.slow_queries import slow_query_log
+
+METRIC_PREFIX = 'news_api'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# ---------------------------------------------------------
+# Metric types
+# ---------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RouteMetrics:
+    """Everything recorded for one (route, method)."""
+    __slots__ = ('statuses', 'latency_counts', 'latency_sum', 'statement_counts', 'statement_sum',
+                 'sql_seconds', 'rows', 'response_bytes')
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        # Non-cumulative counts per bucket; the last one is +Inf
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.statement_counts = [0] * (len(STATEMENT_BUCKETS) + 1)
+        self.statement_sum = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+    def record(self, stats: 'RequestStats', seconds: float):
+        latency_bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        statement_bucket = bisect_left(STATEMENT_BUCKETS, stats.statements)
+        with self._lock:
+            route = self._routes.get((stats.route, stats.method))
+            if route is None:
+                route = self._routes[(stats.route, stats.method)] = RouteMetrics()
+            route.statuses[stats.status] = route.statuses.get(stats.status, 0) + 1
+            route.latency_counts[latency_bucket] += 1
+            route.latency_sum += seconds
+            route.statement_counts[statement_bucket] += 1
+            route.statement_sum += stats.statements
+            route.sql_seconds += stats.sql_seconds
+            route.rows += stats.rows
+            route.response_bytes += stats.response_bytes
+
+    def render(self) -> List[str]:
+        with self._lock:
+            routes = sorted(
+                (key, (dict(route.statuses), list(route.latency_counts), route.latency_sum,
+                       list(route.statement_counts), route.statement_sum, route.sql_seconds, route.rows,
+                       route.response_bytes))
+                for key, route in self._routes.items()
+            )
+
+        families = {name: [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                    for name, kind, help_text in METRIC_FAMILIES}
+        for (route, method), (statuses, latency_counts, latency_sum, statement_counts, statement_sum,
+                              sql_seconds, rows, response_bytes) in routes:
+            for status, count in sorted(statuses.items()):
+                families[REQUESTS].append(f'{REQUESTS}{_labels(route=route, method=method, status=status)} {count}')
+            _histogram_lines(families[REQUEST_DURATION], REQUEST_DURATION, LATENCY_BUCKETS, latency_counts,
+                             latency_sum, route=route, method=method)
+            _histogram_lines(families[REQUEST_STATEMENTS], REQUEST_STATEMENTS, STATEMENT_BUCKETS, statement_counts,
+                             statement_sum, route=route, method=method)
+            labels = _labels(route=route, method=method)
+            families[SQL_DURATION].append(f'{SQL_DURATION}{labels} {_number(sql_seconds)}')
+            families[SQL_ROWS].append(f'{SQL_ROWS}{labels} {rows}')
+            families[RESPONSE_BYTES].append(f'{RESPONSE_BYTES}{labels} {response_bytes}')
+        return [line for lines in families.values() for line in lines]
+
+
+def _histogram_lines(lines: List[str], name: str, buckets: Sequence[float], counts: List[int], total,
+                     **labels):
+    cumulative = 0
+    for bound, count in zip(tuple(buckets) + (float('inf'),), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=_number(bound))} {cumulative}')
+    lines.append(f'{name}_sum{_labels(**labels)} {_number(total)}')
+    lines.append(f'{name}_count{_labels(**labels)} {cumulative}')
+
+
+REQUESTS = f'{METRIC_PREFIX}_requests_total'
+REQUEST_DURATION = f'{METRIC_PREFIX}_request_duration_seconds'
+REQUEST_STATEMENTS = f'{METRIC_PREFIX}_request_sql_statements'
+SQL_DURATION = f'{METRIC_PREFIX}_sql_duration_seconds_total'
+SQL_ROWS = f'{METRIC_PREFIX}_sql_rows_fetched_total'
+RESPONSE_BYTES = f'{METRIC_PREFIX}_response_bytes_total'
+
+METRIC_FAMILIES = (
+    (REQUESTS, 'counter', 'Requests handled.'),
+    (REQUEST_DURATION, 'histogram', 'Request latency, including streaming.'),
+    (REQUEST_STATEMENTS, 'histogram', 'SQL statements run per request.'),
+    (SQL_DURATION, 'counter', 'Time spent executing SQL statements and fetching their rows.'),
+    (SQL_ROWS, 'counter', 'Rows fetched from the database.'),
+    (RESPONSE_BYTES, 'counter', 'Response body bytes sent.'),
+)
+
+metrics_registry = MetricsRegistry()
+
+
+# ---------------------------------------------------------
+# Request stats
+# ---------------------------------------------------------
+
+class RequestStats:
+    """What one request has done so far."""
+    __slots__ = ('route', 'method', 'started', 'statements', 'sql_seconds', 'rows', 'response_bytes',
+                 'status')
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+        self.status = 0
+
+    def finish(self):
+        metrics_registry.record(self, time.perf_counter() - self.started)
+
+
+# The stats of the request running on this thread, if any
+_current = threading.local()
+
+
+def _current_stats() -> Optional[RequestStats]:
+    return getattr(_current, 'stats', None)
+
+
+# ---------------------------------------------------------
+# SQL instrumentation
+# ---------------------------------------------------------
+
+class CountingCursor(sqlite3.Cursor):
+    """
+    Times each statement (execute plus every fetch: SQLite does most of a query's work
+    while rows are fetched) and counts the rows it returns, adding both to the
+    connection's request stats. When closed, a statement that took at least the
+    slow-query threshold is reported to the slow-query log.
+    """
+    statement = None
+    parameters = None
+    seconds = 0.0
+
+    def _add_time(self, started: float):
+        elapsed = time.perf_counter() - started
+        self.seconds += elapsed
+        stats = self.connection.request_stats
+        if stats is not None:
+            stats.sql_seconds += elapsed
+
+    def _add_rows(self, count: int):
+        stats = self.connection.request_stats
+        if stats is not None:
+            stats.rows += count
+
+    def _finish_statement(self):
+        if self.seconds >= slow_query_log.threshold_seconds and self.statement is not None:
+            slow_query_log.record(self.connection, self.statement, self.parameters, self.seconds)
+        self.seconds = 0.0
+
+    def execute(self, statement, parameters=()):
+        # A cursor reused for another statement finishes the previous one
+        self._finish_statement()
+        self.statement, self.parameters = statement, parameters
+        started = time.perf_counter()
+        try:
+            return super().execute(statement, parameters)
+        finally:
+            self._add_time(started)
+
+    def executemany(self, statement, seq_of_parameters):
+        self._finish_statement()
+        self.statement, self.parameters = statement, None
+        started = time.perf_counter()
+        try:
+            return super().executemany(statement, seq_of_parameters)
+        finally:
+            self._add_time(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add_time(started)
+        if row is not None:
+            self._add_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_time(started)
+        self._add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add_time(started)
+        self._add_rows(len(rows))
+        return rows
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+
+class CountingConnection(sqlite3.Connection):
+    request_stats: Optional[RequestStats] = None
+
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+@event.listens_for(Engine, 'do_connect')
+def _use_counting_connection(dialect, connection_record, cargs, cparams):
+    if dialect.name == 'sqlite':
+        cparams.setdefault('factory', CountingConnection)
+
+
+@event.listens_for(Pool, 'checkout')
+def _tag_connection(dbapi_connection, connection_record, connection_proxy):
+    stats = _current_stats()
+    connection_record.info['request_stats'] = stats
+    if isinstance(dbapi_connection, CountingConnection):
+        dbapi_connection.request_stats = stats
+
+
+@event.listens_for(Pool, 'checkin')
+def _untag_connection(dbapi_connection, connection_record):
+    connection_record.info.pop('request_stats', None)
+    if isinstance(dbapi_connection, CountingConnection):
+        dbapi_connection.request_stats = None
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    stats = conn.info.get('request_stats')
+    if stats is not None:
+        stats.statements += 1
+
+
+# ---------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------
+
+def start_request_metrics():
+    """before_request handler: start collecting this request's stats."""
+    rule = request.url_rule
+    _current.stats = RequestStats(rule.rule if rule is not None else 'unmatched', request.method)
+
+
+def _counting_body(body: Iterable, stats: RequestStats):
+    for chunk in body:
+        stats.response_bytes += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        yield chunk
+
+
+def finish_request_metrics(response):
+    """
+    after_request handler: record the request's stats once the response is closed,
+    so streamed bodies (and the queries they run) are included.
+    """
+    stats = _current_stats()
+    if stats is None:
+        return response
+
+    stats.status = response.status_code
+    if response.is_streamed:
+        response.response = _counting_body(response.response, stats)
+    else:
+        stats.response_bytes = response.content_length or 0
+
+    def finish():
+        stats.finish()
+        if _current_stats() is stats:
+            _current.stats = None
+
+    response.call_on_close(finish)
+    return response
+
+
+def abandon_request_metrics(exc):
+    """
+    teardown_request handler: a view that raised never reaches after_request; record
+    its request as a 500.
+    """
+    stats = _current_stats()
+    if exc is not None and stats is not None and not stats.status:
+        stats.status = 500
+        stats.finish()
+        _current.stats = None
+
+
+# ---------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------
+
+def _pool_gauges(engine) -> List[str]:
+    pool = engine.pool
+    lines = []
+    for name, help_text in (('checkedout', 'Pooled connections in use.'),
+                            ('checkedin', 'Pooled connections idle.')):
+        if hasattr(pool, name):
+            metric = f'{METRIC_PREFIX}_db_pool_{name}'
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge', f'{metric} {getattr(pool, name)()}']
+    return lines
+
+
+def render_metrics(engine=None) -> str:
+    """All metrics in Prometheus text exposition format (version 0.0.4)."""
+    lines = metrics_registry.render()
+    if engine is not None:
+        lines += _pool_gauges(engine)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,150 @@
+"""
+Versioned schema migrations for existing databases.
+
+db.create_all() creates missing tables but never changes a table that already
+exists, so columns and indexes added to the models after a database was created
+are applied here. The schema version is kept in SQLite's `PRAGMA user_version`.
+upgrade() runs every migration newer than it, in order, each in its own
+transaction. Migrations are written to be idempotent, because a database created
+by create_all() from the current models already has most of what they add.
+"""
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import DateTime, bindparam, text
+
+from api.models import db, Article, CategoryStat
+from api.services import rebuild_category_stats
+from utility.helpers import url_hash, content_hash
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable
+
+
+MIGRATIONS: List[Migration] = []
+
+# Rows read per round trip when a migration backfills a column
+BACKFILL_BATCH_SIZE = 1000
+
+
+def migration(version: int, description: str):
+    """Register the decorated function as the migration to schema `version`."""
+    def register(func):
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return func
+    return register
+
+
+def _columns(connection, table: str) -> set:
+    return {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+
+
+def current_version(connection=None) -> int:
+    connection = connection or db.session.connection()
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade() -> List[Migration]:
+    """
+    Apply every pending migration to the app's database. Requires an app context.
+
+    Returns:
+        List[Migration]: The migrations that were applied, in order.
+    """
+    applied = []
+    for item in MIGRATIONS:
+        if item.version <= current_version():
+            continue
+        try:
+            connection = db.session.connection()
+            item.apply(connection)
+            connection.exec_driver_sql(f'PRAGMA user_version = {int(item.version)}')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        applied.append(item)
+    return applied
+
+
+# ---------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------
+
+@migration(1, "Add URL_Hash and Content_Hash to article for deduplication")
+def _article_hashes(connection):
+    columns = _columns(connection, 'article')
+    if 'URL_Hash' not in columns:
+        connection.exec_driver_sql('ALTER TABLE article ADD COLUMN "URL_Hash" VARCHAR(64)')
+    if 'Content_Hash' not in columns:
+        connection.exec_driver_sql('ALTER TABLE article ADD COLUMN "Content_Hash" VARCHAR(64)')
+
+    # Backfill existing articles. Only the first article with a given URL keeps its
+    # URL_Hash, so the unique index below can be created over historical duplicates.
+    seen_urls = set()
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            'SELECT "Article_ID", "URL", "Content" FROM article '
+            'WHERE "Article_ID" > :last_id AND "Content_Hash" IS NULL ORDER BY "Article_ID" LIMIT :batch'
+        ), {'last_id': last_id, 'batch': BACKFILL_BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        updates = []
+        for article_id, url, content in rows:
+            hashed_url = url_hash(url) if url else None
+            if hashed_url in seen_urls:
+                hashed_url = None
+            elif hashed_url:
+                seen_urls.add(hashed_url)
+            updates.append({'id': article_id, 'url_hash': hashed_url, 'content_hash': content_hash(content or '')})
+
+        connection.execute(text(
+            'UPDATE article SET "URL_Hash" = :url_hash, "Content_Hash" = :content_hash WHERE "Article_ID" = :id'
+        ), updates)
+        last_id = rows[-1][0]
+
+    connection.exec_driver_sql(
+        'CREATE UNIQUE INDEX IF NOT EXISTS "ix_article_URL_Hash" ON article ("URL_Hash")')
+    connection.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS "ix_article_Content_Hash" ON article ("Content_Hash")')
+
+
+@migration(2, "Add category_stats with per-category preference counts")
+def _category_stats(connection):
+    CategoryStat.__table__.create(connection, checkfirst=True)
+    rebuild_category_stats(connection)
+
+
+@migration(3, "Create the secondary indexes declared on the models")
+def _declared_indexes(connection):
+    # Covers ix_article_Category_ID, ix_user_preference_Category_ID and the NOCASE
+    # ix_user_Name_nocase, plus any other declared index an older database lacks.
+    # Indexes on columns a later migration adds are left to that migration.
+    for model_table in db.metadata.sorted_tables:
+        columns = _columns(connection, model_table.name)
+        for index in model_table.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(connection, checkfirst=True)
+
+
+@migration(4, "Add Published_At to article with a per-category recency index")
+def _article_published_at(connection):
+    if 'Published_At' not in _columns(connection, 'article'):
+        connection.exec_driver_sql('ALTER TABLE article ADD COLUMN "Published_At" DATETIME')
+
+    # The original publication times are unknown, so existing articles are stamped
+    # with the time of the migration; within it they keep their Article_ID order.
+    connection.execute(
+        text('UPDATE article SET "Published_At" = :now WHERE "Published_At" IS NULL')
+        .bindparams(bindparam('now', type_=DateTime)),
+        {'now': datetime.now(timezone.utc).replace(tzinfo=None)},
+    )
+    for index in Article.__table__.indexes:
+        if index.name == 'ix_article_Category_ID_Published_At':
+            index.create(connection, checkfirst=True)
@@ -1,4 +1,7 @@
+from datetime import datetime, timezone
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import collate
 import random
 
 db = SQLAlchemy()
@@ -35,11 +38,17 @@ class User(db.Model):
         }
 
 
+# Case-insensitive index for name prefix search: SQLite only uses an index for
+# LIKE 'abc%' (which ignores case) when the index has NOCASE collation
+db.Index('ix_user_Name_nocase', collate(User.Name, 'NOCASE'))
+
+
 class UserPreference(db.Model):
     __tablename__ = 'user_preference'
     
     User_ID = db.Column(db.String, db.ForeignKey('user.User_ID'), primary_key=True)
-    Category_ID = db.Column(db.String, db.ForeignKey('category.Category_ID'), primary_key=True)
+    # Indexed on its own for lookups by category (the primary key leads with User_ID)
+    Category_ID = db.Column(db.String, db.ForeignKey('category.Category_ID'), primary_key=True, index=True)
     
     # Add relationships without conflicting backrefs
     user_relation = db.relationship('User')
@@ -73,10 +82,21 @@ class Article(db.Model):
    
     Article_ID = db.Column(db.Integer, primary_key=True)
     Title = db.Column(db.String(200), nullable=False)
-    Content = db.Column(db.Text, nullable=False)
-    Category_ID = db.Column(db.Integer, db.ForeignKey('category.Category_ID'), nullable=False)
+    # Bodies are large and most listings only need headlines, so Content is only
+    # loaded when it is accessed or explicitly requested with load_only/undefer
+    Content = db.deferred(db.Column(db.Text, nullable=False))
+    Category_ID = db.Column(db.Integer, db.ForeignKey('category.Category_ID'), nullable=False, index=True)
     URL = db.Column(db.String(500), nullable=True)
     Authors = db.Column(db.String(500), nullable=True)
+    # SHA-256 of the normalized URL and of the body, used to drop re-delivered stories
+    URL_Hash = db.Column(db.String(64), nullable=True, unique=True, index=True)
+    Content_Hash = db.Column(db.String(64), nullable=True, index=True)
+    # When the article was published, in UTC (stored naive). Articles published at the
+    # same instant are ordered by Article_ID, i.e. by ingestion order
+    Published_At = db.Column(
+        db.DateTime, nullable=True, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None))
+    # Leading part of Content, computed in SQL when a query asks for it with with_expression
+    Snippet = db.query_expression()
    
     def to_dict(self):
         return {
@@ -85,7 +105,30 @@ class Article(db.Model):
             "Content": self.Content,
             "Category_ID": self.Category_ID,
             "URL": self.URL,
-            "Authors": self.Authors
+            "Authors": self.Authors,
+            "Published_At": self.Published_At.isoformat() + 'Z' if self.Published_At else None
         }
-    
-    
\ No newline at end of file
+
+
+# Newest articles of a category, read straight off the index in order, with
+# Article_ID breaking ties between articles published at the same instant
+db.Index('ix_article_Category_ID_Published_At',
+         Article.Category_ID, Article.Published_At.desc(), Article.Article_ID.desc())
+
+
+class ArticleSignature(db.Model):
+    """MinHash signature of an article and the near-duplicate cluster it belongs to."""
+    __tablename__ = 'article_minhash'
+
+    Article_ID = db.Column(db.Integer, db.ForeignKey('article.Article_ID'), primary_key=True)
+    Signature = db.Column(db.LargeBinary, nullable=False)
+    # Article_ID of the first article of the cluster (the article itself if it is unique)
+    Cluster_ID = db.Column(db.Integer, nullable=False, index=True)
+
+
+class CategoryStat(db.Model):
+    """Number of users who selected each category, maintained by the preference write paths."""
+    __tablename__ = 'category_stats'
+
+    Category_ID = db.Column(db.Integer, db.ForeignKey('category.Category_ID'), primary_key=True)
+    User_Count = db.Column(db.Integer, nullable=False, default=0)
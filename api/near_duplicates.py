@@ -0,0 +1,293 @@
+"""
+Near-duplicate article detection with MinHash signatures and an LSH banding index.
+
+Every article gets a MinHash signature of the 3-word shingles of its title and
+body (NUM_PERM 32-bit values, stored as a BLOB in `article_minhash`). Articles
+whose estimated Jaccard similarity is at least SIMILARITY_THRESHOLD share a
+Cluster_ID, the Article_ID of the first article of the cluster, so listings can
+collapse a syndicated story to one entry through the Cluster_ID index.
+
+To find candidates without comparing against every article, signatures are cut
+into BANDS bands of ROWS values. Two similar articles almost certainly agree on
+at least one whole band, so only articles sharing a band key are compared. The
+band keys live in memory as one sorted array per band (binary-searched), plus a
+small dict per band for articles added since the last rebuild. The index is
+rebuilt from `article_minhash` at startup and updated as articles are ingested:
+assign_clusters stages the new articles in the session, and they are added to
+the index when the transaction commits (a rolled-back transaction adds nothing,
+so its Article_IDs, which SQLite may hand out again, never reach the index).
+"""
+import re
+import zlib
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from api.models import db, Article, ArticleSignature
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+SIMILARITY_THRESHOLD = 0.7
+
+# Articles read per round trip when signatures are backfilled or loaded
+BATCH_SIZE = 2000
+
+# Permutations h -> (a * h + b) mod p. The seed is fixed because signatures are stored:
+# changing it (or NUM_PERM/SHINGLE_SIZE) requires recomputing article_minhash.
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_rng = np.random.default_rng(20240611)
+_PERM_A = _rng.integers(1, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2 ** 31, size=NUM_PERM, dtype=np.uint64)
+_EMPTY_SIGNATURE = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+# Multipliers folding the ROWS values of a band into one 64-bit key (wrapping arithmetic)
+_BAND_MIX = np.array([0x9E3779B97F4A7C15 ** i % 2 ** 64 for i in range(1, ROWS + 1)], dtype=np.uint64)
+
+
+def minhash_signature(title: str, content: str) -> np.ndarray:
+    """Compute the MinHash signature (NUM_PERM uint32 values) of an article's text."""
+    words = re.findall(r'\w+', f'{title or ""} {content or ""}'.lower())
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    shingles.discard('')
+    if not shingles:
+        return _EMPTY_SIGNATURE.copy()
+
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.count_nonzero(first == second)) / NUM_PERM
+
+
+def to_blob(signature: np.ndarray) -> bytes:
+    return signature.astype('<u4').tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype='<u4').astype(np.uint32)
+
+
+def band_keys(signatures: np.ndarray) -> np.ndarray:
+    """Fold each band of one (NUM_PERM,) or many (N, NUM_PERM) signatures into a uint64 key."""
+    bands = signatures.astype(np.uint64).reshape(*signatures.shape[:-1], BANDS, ROWS)
+    with np.errstate(over='ignore'):
+        return (bands * _BAND_MIX).sum(axis=-1, dtype=np.uint64)
+
+
+class NearDuplicateIndex:
+    def __init__(self):
+        self._lock = RLock()
+        # Per band: sorted keys and the Article_IDs in the same order
+        self._keys = np.empty((BANDS, 0), dtype=np.uint64)
+        self._ids = np.empty((BANDS, 0), dtype=np.int64)
+        # Per band: key -> Article_IDs added since the arrays were built
+        self._pending: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._pending_count = 0
+
+    def __len__(self):
+        return self._ids.shape[1] + self._pending_count
+
+    def rebuild(self, items: Iterable[Tuple[int, np.ndarray]]):
+        """Replace the index contents with (Article_ID, band keys) pairs."""
+        ids, keys = [], []
+        for article_id, article_keys in items:
+            ids.append(article_id)
+            keys.append(article_keys)
+
+        keys = np.array(keys, dtype=np.uint64).reshape(len(ids), BANDS).T
+        ids = np.array(ids, dtype=np.int64)
+        order = np.argsort(keys, axis=1, kind='stable')
+
+        with self._lock:
+            self._keys = np.take_along_axis(keys, order, axis=1)
+            self._ids = ids[order]
+            self._pending = [{} for _ in range(BANDS)]
+            self._pending_count = 0
+
+    def add(self, article_id: int, signature: np.ndarray):
+        with self._lock:
+            for band, key in enumerate(band_keys(signature).tolist()):
+                self._pending[band].setdefault(key, []).append(article_id)
+            self._pending_count += 1
+
+    def add_many(self, items: Iterable[Tuple[int, np.ndarray]]):
+        with self._lock:
+            for article_id, signature in items:
+                self.add(article_id, signature)
+
+    def candidates(self, signature: np.ndarray) -> set:
+        """Article_IDs sharing at least one band with `signature`."""
+        found = set()
+        with self._lock:
+            for band, key in enumerate(band_keys(signature).tolist()):
+                keys = self._keys[band]
+                start = np.searchsorted(keys, np.uint64(key), side='left')
+                end = np.searchsorted(keys, np.uint64(key), side='right')
+                found.update(self._ids[band, start:end].tolist())
+                found.update(self._pending[band].get(key, ()))
+        return found
+
+
+near_duplicate_index = NearDuplicateIndex()
+
+
+def assign_clusters(items: List[Tuple[int, np.ndarray]], session: Session = None) -> List[int]:
+    """
+    Choose the Cluster_ID of each new article, in order.
+
+    An article joins the cluster of its most similar indexed (or earlier in `items`)
+    article when the estimated similarity reaches SIMILARITY_THRESHOLD, otherwise it
+    starts its own cluster. Candidate signatures are read with one query. The
+    articles are added to the index when `session`'s transaction commits; the caller
+    stores the ArticleSignature rows in it.
+
+    Args:
+        items (List[Tuple[int, np.ndarray]]): (Article_ID, signature) of each new article.
+        session (Session, optional): The session storing them (default db.session).
+
+    Returns:
+        List[int]: The Cluster_ID for each item.
+    """
+    session = session or db.session
+    candidate_ids = set()
+    for _, signature in items:
+        candidate_ids |= near_duplicate_index.candidates(signature)
+
+    known = {}
+    candidate_ids = list(candidate_ids)
+    for chunk_start in range(0, len(candidate_ids), BATCH_SIZE):
+        chunk = candidate_ids[chunk_start:chunk_start + BATCH_SIZE]
+        rows = session.query(ArticleSignature.Article_ID, ArticleSignature.Signature,
+                                ArticleSignature.Cluster_ID).filter(ArticleSignature.Article_ID.in_(chunk))
+        for article_id, blob, cluster_id in rows:
+            known[article_id] = (from_blob(blob), cluster_id)
+
+    clusters = []
+    # Per band: key -> Article_IDs of the earlier items, which are not in the index yet
+    batch_bands: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+    for article_id, signature in items:
+        keys = band_keys(signature).tolist()
+        candidates = near_duplicate_index.candidates(signature)
+        for band, key in enumerate(keys):
+            candidates.update(batch_bands[band].get(key, ()))
+
+        best_cluster, best_score = article_id, SIMILARITY_THRESHOLD
+        for candidate in candidates:
+            if candidate in known and candidate != article_id:
+                score = similarity(signature, known[candidate][0])
+                if score >= best_score:
+                    best_cluster, best_score = known[candidate][1], score
+        clusters.append(best_cluster)
+        known[article_id] = (signature, best_cluster)
+        for band, key in enumerate(keys):
+            batch_bands[band].setdefault(key, []).append(article_id)
+
+    session.info.setdefault('near_duplicate_additions', []).extend(items)
+    return clusters
+
+
+def signature_rows(items: List[Tuple[int, np.ndarray]], session: Session = None) -> List[dict]:
+    """Assign clusters to new articles and build their article_minhash rows."""
+    clusters = assign_clusters(items, session)
+    return [
+        {"Article_ID": article_id, "Signature": to_blob(signature), "Cluster_ID": cluster_id}
+        for (article_id, signature), cluster_id in zip(items, clusters)
+    ]
+
+
+def backfill_signatures() -> int:
+    """
+    Compute signatures and clusters for articles that do not have one yet, in
+    Article_ID order and BATCH_SIZE articles per transaction. Requires an app context.
+
+    Returns:
+        int: Number of articles processed.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        articles = (
+            db.session.query(Article.Article_ID, Article.Title, Article.Content)
+            .outerjoin(ArticleSignature, ArticleSignature.Article_ID == Article.Article_ID)
+            .filter(ArticleSignature.Article_ID.is_(None), Article.Article_ID > last_id)
+            .order_by(Article.Article_ID)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not articles:
+            return processed
+
+        items = [(article_id, minhash_signature(title, content)) for article_id, title, content in articles]
+        try:
+            db.session.execute(insert(ArticleSignature), signature_rows(items))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+        processed += len(items)
+        last_id = articles[-1][0]
+
+
+def load_index() -> int:
+    """
+    Backfill missing signatures, then rebuild the in-memory index from article_minhash.
+    Requires an app context.
+
+    Returns:
+        int: Number of articles in the index.
+    """
+    # Each backfill batch is added to the index when it commits, so start from the stored signatures
+    near_duplicate_index.rebuild(_stored_band_keys())
+    if backfill_signatures():
+        near_duplicate_index.rebuild(_stored_band_keys())
+    return len(near_duplicate_index)
+
+
+def _stored_band_keys():
+    last_id = 0
+    while True:
+        rows = (
+            db.session.query(ArticleSignature.Article_ID, ArticleSignature.Signature)
+            .filter(ArticleSignature.Article_ID > last_id)
+            .order_by(ArticleSignature.Article_ID)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            return
+        keys = band_keys(np.stack([from_blob(blob) for _, blob in rows]))
+        for (article_id, _), article_keys in zip(rows, keys):
+            yield article_id, article_keys
+        last_id = rows[-1][0]
+
+
+def cluster_of(article_id: int) -> Optional[int]:
+    """Return the Cluster_ID of an article, or None if it has no signature."""
+    row = db.session.query(ArticleSignature.Cluster_ID).filter_by(Article_ID=article_id).first()
+    return row[0] if row else None
+
+
+# ---------------------------------------------------------
+# Updating on commit
+# ---------------------------------------------------------
+
+@event.listens_for(Session, 'after_commit')
+def _add_after_commit(session):
+    items = session.info.pop('near_duplicate_additions', None)
+    if items:
+        near_duplicate_index.add_many(items)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_additions(session):
+    session.info.pop('near_duplicate_additions', None)
@@ -0,0 +1,256 @@
+"""
+In-memory bitmask index of user preferences, for audience queries.
+
+Each category is given a bit, so a user's preference set is one small integer
+(uint16 while there are at most 16 categories, widened as categories are added,
+up to MAX_CATEGORIES). The index is a sorted array of User_IDs with a parallel
+array of masks, so "users who chose A and B" (or A or B) is one vectorized
+bitwise operation over every user, and a page of them is a binary search for
+the cursor plus a slice.
+
+The index is built by create_app from user_preference. The preference write
+paths record each user's old and new category sets in their transaction
+(record_preference_change); when it commits, the user's mask is replaced here
+and the category co-occurrence matrix is updated, and a rolled-back transaction
+changes nothing. Users who had no preferences when the index was built are kept
+in a small overflow dict until there are MAX_OVERFLOW of them, then merged into
+the arrays.
+
+Like the category cache, the index is per process: writes made by another
+process (or with raw SQL) are only seen after this process reloads or restarts.
+"""
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api.models import db
+from api.category_cache import category_cache
+
+# Largest number of categories a mask can hold
+MAX_CATEGORIES = 64
+# Users outside the sorted arrays before they are merged in
+MAX_OVERFLOW = 1024
+# Preference rows read per round trip while the index is built
+LOAD_BATCH_SIZE = 100000
+
+_PREFERENCE_ROWS_SQL = (
+    'SELECT "User_ID", CAST("Category_ID" AS INTEGER) FROM user_preference ORDER BY "User_ID"'
+)
+_PREFERENCE_CATEGORIES_SQL = 'SELECT DISTINCT CAST("Category_ID" AS INTEGER) FROM user_preference'
+
+
+def _mask_dtype(category_count: int):
+    if category_count > MAX_CATEGORIES:
+        raise ValueError(f'The preference index holds at most {MAX_CATEGORIES} categories')
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        if category_count <= np.iinfo(dtype).bits:
+            return dtype
+
+
+def _first_matches(matches: np.ndarray, start: int, limit: int) -> np.ndarray:
+    """Positions of the first `limit` True values from `start`, scanning in growing windows."""
+    found = []
+    window = max(limit * 16, 65536)
+    while start < len(matches) and limit > 0:
+        positions = start + np.flatnonzero(matches[start:start + window])[:limit]
+        found.append(positions)
+        limit -= len(positions)
+        start += window
+        window *= 2
+    return np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+
+
+class PreferenceIndex:
+    def __init__(self):
+        self._lock = Lock()
+        # Category_ID of each bit, and the reverse
+        self._category_ids: List[int] = []
+        self._bits: Dict[int, int] = {}
+        # Sorted User_IDs (bytes) and their masks
+        self._user_ids = np.empty(0, dtype='S10')
+        self._masks = np.empty(0, dtype=np.uint16)
+        # User_ID -> mask of users not in the arrays
+        self._overflow: Dict[str, int] = {}
+        self._loaded = False
+
+    def load(self):
+        """(Re)build the index from user_preference. Requires an app context."""
+        connection = db.session.connection()
+        category_ids = {category.Category_ID for category in category_cache.all()}
+        category_ids.update(row[0] for row in connection.exec_driver_sql(_PREFERENCE_CATEGORIES_SQL)
+                            if row[0] is not None)
+        category_ids = sorted(category_ids)
+        dtype = _mask_dtype(len(category_ids))
+        bit_values = np.left_shift(np.ones(len(category_ids), dtype=dtype), np.arange(len(category_ids), dtype=dtype))
+        sorted_ids = np.array(category_ids, dtype=np.int64)
+
+        # Rows come in User_ID order: OR each user's bits together. A user split between
+        # two batches is merged with the previous batch's last user.
+        user_blocks, mask_blocks = [], []
+        result = connection.exec_driver_sql(_PREFERENCE_ROWS_SQL)
+        while True:
+            rows = [row for row in result.fetchmany(LOAD_BATCH_SIZE) if row[1] is not None]
+            if not rows:
+                break
+            users = np.array([row[0] for row in rows], dtype='S')
+            bits = bit_values[np.searchsorted(sorted_ids, np.array([row[1] for row in rows], dtype=np.int64))]
+            starts = np.flatnonzero(np.concatenate(([True], users[1:] != users[:-1])))
+            users, masks = users[starts], np.bitwise_or.reduceat(bits, starts)
+            if user_blocks and user_blocks[-1][-1] == users[0]:
+                mask_blocks[-1][-1] |= masks[0]
+                users, masks = users[1:], masks[1:]
+            user_blocks.append(users)
+            mask_blocks.append(masks)
+        result.close()
+
+        with self._lock:
+            self._category_ids = category_ids
+            self._bits = {category_id: bit for bit, category_id in enumerate(category_ids)}
+            self._user_ids = np.concatenate(user_blocks) if user_blocks else np.empty(0, dtype='S10')
+            self._masks = np.concatenate(mask_blocks) if mask_blocks else np.empty(0, dtype=dtype)
+            self._overflow = {}
+            self._loaded = True
+
+    # ---------------------------------------------------------
+    # Updates
+    # ---------------------------------------------------------
+
+    def _mask_of(self, category_ids: Iterable[int]) -> int:
+        mask = 0
+        for category_id in category_ids:
+            bit = self._bits.get(category_id)
+            if bit is None:
+                # A category first chosen after the load: give it the next bit
+                bit = self._bits[category_id] = len(self._category_ids)
+                self._category_ids.append(category_id)
+                dtype = _mask_dtype(len(self._category_ids))
+                if dtype != self._masks.dtype:
+                    self._masks = self._masks.astype(dtype)
+            mask |= 1 << bit
+        return mask
+
+    def apply(self, changes: List[Tuple[str, List[int], List[int]]]):
+        """
+        Replace users' category sets: each change is (User_ID, old Category_IDs,
+        new Category_IDs). Ignored until the index is loaded.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            for user_id, _, new in changes:
+                mask = self._mask_of(new)
+                key = user_id.encode()
+                position = int(np.searchsorted(self._user_ids, key))
+                if position < len(self._user_ids) and self._user_ids[position] == key:
+                    self._masks[position] = mask
+                elif mask:
+                    self._overflow[user_id] = mask
+                else:
+                    self._overflow.pop(user_id, None)
+            if len(self._overflow) >= MAX_OVERFLOW:
+                self._merge_overflow()
+
+    def _merge_overflow(self):
+        keys = sorted(self._overflow)
+        user_ids = np.array(keys, dtype='S')
+        masks = np.array([self._overflow[key] for key in keys], dtype=self._masks.dtype)
+        positions = np.searchsorted(self._user_ids, user_ids)
+        width = max(self._user_ids.dtype.itemsize, user_ids.dtype.itemsize)
+        self._user_ids = np.insert(self._user_ids.astype(f'S{width}'), positions, user_ids)
+        self._masks = np.insert(self._masks, positions, masks)
+        self._overflow = {}
+
+    # ---------------------------------------------------------
+    # Queries
+    # ---------------------------------------------------------
+
+    def audience(self, category_ids: List[int], match_all: bool = True, limit: int = 100,
+                 after: Optional[str] = None) -> Tuple[int, List[str]]:
+        """
+        Users whose preferences include all (or any) of `category_ids`.
+
+        Args:
+            category_ids (List[int]): The categories to match.
+            match_all (bool): Require every category (True) or at least one (False).
+            limit (int): Maximum number of User_IDs to return.
+            after (str, optional): Only return users with a greater User_ID (keyset cursor).
+
+        Returns:
+            Tuple[int, List[str]]: How many users match in total, and the first `limit`
+            matching User_IDs after `after`, in User_ID order.
+        """
+        with self._lock:
+            user_ids, masks, overflow = self._user_ids, self._masks, dict(self._overflow)
+            bits = [self._bits.get(category_id) for category_id in category_ids]
+
+        known_bits = [bit for bit in bits if bit is not None]
+        if not known_bits or (match_all and len(known_bits) < len(bits)):
+            # Nobody has chosen a category that has no bit
+            return 0, []
+        wanted = 0
+        for bit in known_bits:
+            wanted |= 1 << bit
+
+        if match_all:
+            matches = (masks & masks.dtype.type(wanted)) == wanted
+            overflow_ids = [user_id for user_id, mask in overflow.items() if mask & wanted == wanted]
+        else:
+            matches = (masks & masks.dtype.type(wanted)) != 0
+            overflow_ids = [user_id for user_id, mask in overflow.items() if mask & wanted]
+        total = int(np.count_nonzero(matches)) + len(overflow_ids)
+
+        start = 0 if after is None else int(np.searchsorted(user_ids, after.encode(), side='right'))
+        page = [user_id.decode() for user_id in user_ids[_first_matches(matches, start, limit)]]
+        overflow_ids = sorted(user_id for user_id in overflow_ids if after is None or user_id > after)
+        if overflow_ids:
+            page = sorted(page + overflow_ids)
+        return total, page[:limit]
+
+    def mask_counts(self) -> Tuple[List[int], np.ndarray, np.ndarray]:
+        """
+        The Category_ID of each bit, and every distinct mask with its number of users.
+        """
+        with self._lock:
+            category_ids = list(self._category_ids)
+            masks = np.concatenate((self._masks, np.array(list(self._overflow.values()), dtype=self._masks.dtype)))
+        distinct, counts = np.unique(masks, return_counts=True)
+        return category_ids, distinct, counts
+
+
+preference_index = PreferenceIndex()
+
+
+def record_preference_change(user_id: str, old_category_ids: Iterable, new_category_ids: Iterable,
+                             session: Session = None):
+    """
+    Record that the current transaction replaced a user's categories
+    `old_category_ids` with `new_category_ids`; the preference index and the
+    category co-occurrence matrix are updated when it commits.
+    """
+    session = session or db.session
+    session.info.setdefault('preference_changes', []).append((
+        user_id,
+        [int(category_id) for category_id in old_category_ids],
+        [int(category_id) for category_id in new_category_ids],
+    ))
+
+
+# ---------------------------------------------------------
+# Updating on commit
+# ---------------------------------------------------------
+
+@event.listens_for(Session, 'after_commit')
+def _apply_after_commit(session):
+    changes = session.info.pop('preference_changes', None)
+    if changes:
+        from api.category_cooccurrence import category_cooccurrence
+        preference_index.apply(changes)
+        category_cooccurrence.apply([(old, new) for _, old, new in changes])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_changes(session):
+    session.info.pop('preference_changes', None)
@@ -0,0 +1,95 @@
+"""
+EXPLAIN QUERY PLAN checks for the hot service queries.
+
+Each check builds a query the way the service layer does and asks SQLite how it
+would run it. A check fails when a plan step scans a whole table (`SCAN <table>`
+without an index) or when the index the query is meant to use does not appear
+in the plan (SQLite then walks some other index end to end). Either usually
+means the database predates the index and has not been migrated.
+Run with `python -m utility.data.migrate --check-plans`.
+"""
+from typing import Callable, List, NamedTuple, Tuple
+
+from sqlalchemy import or_
+
+from api.models import db, Article, UserPreference
+from api.category_cache import category_cache
+import api.services as services
+
+
+def explain(query) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN detail lines of a Query or Select."""
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[3] for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def is_table_scan(detail: str) -> bool:
+    return detail.startswith('SCAN ') and ' USING ' not in detail
+
+
+def _any_category():
+    categories = category_cache.all()
+    return categories[0] if categories else None
+
+
+def _articles_by_category():
+    category = _any_category()
+    return services._article_query(category.Category if category else 'ARTS', after=0).limit(250)
+
+
+def _feed_category_page():
+    category = _any_category()
+    return services._category_articles_desc_query(category.Category_ID if category else 0, before=1000).limit(50)
+
+
+def _latest_category_page():
+    category = _any_category()
+    return services._latest_category_query(category.Category_ID if category else 0,
+                                           services.DEFAULT_LATEST_FIELDS).limit(20)
+
+
+def _users_by_name_prefix():
+    return services._users_by_name_query('Jo', starts_with=True).limit(50)
+
+
+def _users_by_category():
+    return db.session.query(UserPreference.User_ID).filter(UserPreference.Category_ID == '101')
+
+
+def _articles_by_hash():
+    return db.session.query(Article.Article_ID).filter(
+        or_(Article.URL_Hash.in_(['0' * 64]), Article.Content_Hash.in_(['0' * 64]))
+    )
+
+
+class PlanCheck(NamedTuple):
+    name: str
+    build: Callable
+    index: str
+
+
+PLAN_CHECKS: List[PlanCheck] = [
+    PlanCheck('articles by category', _articles_by_category, 'ix_article_Category_ID'),
+    PlanCheck('feed page for one category', _feed_category_page, 'ix_article_Category_ID'),
+    PlanCheck('latest articles of one category', _latest_category_page, 'ix_article_Category_ID_Published_At'),
+    PlanCheck('users by name prefix', _users_by_name_prefix, 'ix_user_Name_nocase'),
+    PlanCheck('users by preferred category', _users_by_category, 'ix_user_preference_Category_ID'),
+    PlanCheck('articles by URL/content hash', _articles_by_hash, 'ix_article_URL_Hash'),
+]
+
+
+def check_query_plans() -> List[Tuple[str, List[str], bool]]:
+    """
+    Explain every query in PLAN_CHECKS. Requires an app context.
+
+    Returns:
+        List[Tuple[str, List[str], bool]]: (check name, plan detail lines, passed) per check.
+    """
+    results = []
+    for check in PLAN_CHECKS:
+        plan = explain(check.build())
+        passed = (not any(is_table_scan(detail) for detail in plan)
+                  and any(f'INDEX {check.index} ' in f'{detail} ' for detail in plan))
+        results.append((check.name, plan, passed))
+    return results
@@ -0,0 +1,98 @@
+"""
+Per-resource version counters for HTTP conditional GET.
+
+Read-mostly endpoints are polled far more often than their data changes. Each
+resource (a table, or a group of tables one endpoint reads) has an in-memory
+version number and the time it last changed. Service functions that write a
+resource call touch() inside their transaction; the version is bumped when that
+transaction commits (and forgotten if it rolls back). Routes turn the versions
+into an ETag and Last-Modified, so a matching If-None-Match or If-Modified-Since
+is answered with 304 before any query runs.
+
+Like the category cache, versions are per process: the ETag embeds a random
+token chosen at startup, so ETags from different processes (or from before a
+restart) never match, but a write made by another process is only noticed after
+this process restarts.
+"""
+import secrets
+import time
+from threading import Lock
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api.models import db, Category
+
+CATEGORIES = 'category'
+ARTICLES = 'article'
+USERS = 'user'
+USER_PREFERENCES = 'user_preference'
+
+
+class ResourceVersions:
+    def __init__(self):
+        self._lock = Lock()
+        self._versions: Dict[str, int] = {}
+        self._modified: Dict[str, float] = {}
+        self._started = time.time()
+        # Distinguishes this process's counters from any other process's
+        self.token = secrets.token_hex(4)
+
+    def bump(self, *resources: str):
+        now = time.time()
+        with self._lock:
+            for resource in resources:
+                self._versions[resource] = self._versions.get(resource, 0) + 1
+                self._modified[resource] = now
+
+    def state(self, resources: Iterable[str]) -> Tuple[str, float]:
+        """
+        Return the ETag value (unquoted) and last modification time (epoch seconds)
+        covering all of `resources`.
+        """
+        resources = sorted(resources)
+        with self._lock:
+            versions = [self._versions.get(resource, 0) for resource in resources]
+            modified = max((self._modified.get(resource, self._started) for resource in resources),
+                           default=self._started)
+        tag = '-'.join(f'{resource}.{version}' for resource, version in zip(resources, versions))
+        return f'{self.token}-{tag}', modified
+
+
+resource_versions = ResourceVersions()
+
+
+def touch(*resources: str, session: Session = None):
+    """
+    Record that the current transaction wrote `resources`; their versions are
+    bumped when it commits.
+    """
+    session = session or db.session
+    session.info.setdefault('written_resources', set()).update(resources)
+
+
+# ---------------------------------------------------------
+# Bumping on commit
+# ---------------------------------------------------------
+
+def _touch_categories(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        touch(CATEGORIES, session=session)
+
+
+for _event_name in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event_name, _touch_categories)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    written = session.info.pop('written_resources', None)
+    if written:
+        resource_versions.bump(*written)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_writes(session):
+    session.info.pop('written_resources', None)
@@ -0,0 +1,159 @@
+"""
+Response layer for the API blueprint: JSON encoding, compression and the shared
+article serializer.
+
+- install_json_provider() makes the app encode JSON with orjson when it is
+  installed (several times faster than the stdlib encoder on article lists),
+  and with Flask's stdlib provider otherwise. Output keeps Flask's compact,
+  key-sorted form either way (orjson writes datetimes as ISO 8601).
+- compress_response() encodes large responses with br (if the brotli package is
+  installed), gzip or deflate, whichever the client accepts and we prefer.
+- serialize_articles() turns (Article, Category) rows into the API's article
+  shape, reading only the requested fields.
+"""
+import gzip
+import zlib
+from typing import Callable, Iterable, List, Tuple
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+from api.services import DEFAULT_ARTICLE_FIELDS
+from utility.helpers import format_timestamp
+
+
+# ---------------------------------------------------------
+# JSON
+# ---------------------------------------------------------
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with orjson and decodes with the stdlib."""
+    # Int keys are allowed (the stdlib turns them into strings too); keys are sorted
+    # like Flask's default provider
+    option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS) if orjson else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option), mimetype=self.mimetype
+        )
+
+
+def install_json_provider(state):
+    """Blueprint record_once callback: switch the app to orjson when it is available."""
+    if orjson is not None:
+        state.app.json = OrjsonProvider(state.app)
+
+
+# ---------------------------------------------------------
+# Compression
+# ---------------------------------------------------------
+
+# Responses smaller than this are sent as is: compressing them saves little and costs CPU
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/html', 'text/plain'}
+
+# Preferred first
+ENCODERS: List[Tuple[str, Callable[[bytes], bytes]]] = [
+    ('gzip', lambda data: gzip.compress(data, compresslevel=6)),
+    ('deflate', lambda data: zlib.compress(data, 6)),
+]
+if brotli is not None:
+    ENCODERS.insert(0, ('br', lambda data: brotli.compress(data, quality=4)))
+
+CONTENT_ENCODINGS = [name for name, _ in ENCODERS]
+
+
+def _negotiate_encoding(accept_encodings):
+    for name, encode in ENCODERS:
+        if accept_encodings[name]:
+            return name, encode
+    return None, None
+
+
+def compress_response(response):
+    """
+    after_request handler: compress a buffered response when the client accepts one of
+    CONTENT_ENCODINGS and the body is at least COMPRESSION_MIN_SIZE bytes.
+
+    Streamed responses are sent uncompressed. A strong ETag gets the encoding appended,
+    because the compressed body is a different representation.
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    name, encode = _negotiate_encoding(request.accept_encodings)
+    if name is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.set_data(encode(data))
+    response.headers['Content-Encoding'] = name
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{name}')
+    return response
+
+
+def etag_variants(tag: str) -> List[str]:
+    """Every ETag a representation with base tag `tag` may have been sent with."""
+    return [tag] + [f'{tag}-{name}' for name in CONTENT_ENCODINGS]
+
+
+# ---------------------------------------------------------
+# Articles
+# ---------------------------------------------------------
+
+_ARTICLE_FIELD_GETTERS = {
+    "Article_ID": lambda article, category: article.Article_ID,
+    "Title": lambda article, category: article.Title,
+    "Content": lambda article, category: article.Content,
+    "Snippet": lambda article, category: article.Snippet,
+    "URL": lambda article, category: article.URL or None,
+    "Authors": lambda article, category: article.Authors or None,
+    "Category_ID": lambda article, category: article.Category_ID,
+    "Category": lambda article, category: category.Category if category else None,
+    "Description": lambda article, category: category.Description if category else None,
+    "Published_At": lambda article, category: format_timestamp(article.Published_At) if article.Published_At else None,
+}
+
+
+def article_serializer(fields: Tuple[str, ...] = DEFAULT_ARTICLE_FIELDS) -> Callable:
+    """
+    Build the function converting one (Article, Category) pair into the API's article
+    dict. The field getters are looked up once, not once per article. Only the
+    requested fields are read, so deferred columns that were not loaded (such as
+    Content) are never fetched.
+    """
+    getters = [(field, _ARTICLE_FIELD_GETTERS[field]) for field in fields]
+
+    def serialize(article, category) -> dict:
+        return {field: getter(article, category) for field, getter in getters}
+
+    return serialize
+
+
+def serialize_articles(rows: Iterable[tuple], fields: Tuple[str, ...] = DEFAULT_ARTICLE_FIELDS) -> List[dict]:
+    """Serialize (Article, Category, ...) rows; extra items in a row (e.g. a score) are ignored."""
+    serialize = article_serializer(fields)
+    return [serialize(row[0], row[1]) for row in rows]
@@ -1,429 +1,1139 @@
-from flask import jsonify, request, Blueprint
-import api.services as services
-from api.services import update_user_name, update_user_preferences, delete_user_preference, get_user_preference_stats, create_user, get_all_user_preferences, delete_user
-from datetime import datetime
-import sqlite3
-from .models import User, db
-from sqlalchemy.exc import IntegrityError
-import re
-
-api_bp = Blueprint('api', __name__)
-
-@api_bp.route('/')
-def home():
-    """
-    Just a generic endpoint that we can use to test if the API is running.
-
-    Returns:
-        str: A timestamp string indicating the current time, alogn with a message.
-    """
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Get the current time
-    welcome_message = f'Welcome to the User API!  The current time: {current_time}'
-    return welcome_message, 200
-
-@api_bp.route('/connection')
-def test_connection():
-    """
-    Test the database connection.
-
-    Returns:
-        tuple: A tuple containing a JSON response with a message and an HTTP status code.
-    """
-    services.get_db_connection()
-    return jsonify({'message': 'Successfully connected to the API'}), 200
-
-
-# ---------------------------------------------------------
-# Users 
-# ---------------------------------------------------------
-
-@api_bp.route('/users')
-def get_users():
-    """
-    Retrieve a list of users with optional limit and name filter parameters.
-   
-    Query Parameters:
-        limit (int): Maximum number of users to retrieve
-        name (str): Filter users by name
-        starts_with (bool): If True, filter names starting with the provided value,
-                          if False, filter names containing the provided value
-   
-    Returns:
-        tuple: A tuple containing a JSON response with users and an HTTP status code 200.
-    """
-    # Get query parameters
-    limit = request.args.get('limit', default=None, type=int)
-    name_filter = request.args.get('name', default=None, type=str)
-    starts_with = request.args.get('starts_with', default=True, type=bool)
-   
-    # Get users based on filters
-    if name_filter:
-        user_list = services.get_users_by_name(name_filter, starts_with)
-    else:
-        # Add a default limit if none is provided
-        default_limit = 100  # or whatever number makes sense for your application
-        user_list = services.get_all_users(limit or default_limit)
-   
-    # Handle case where user_list is None or contains None values
-    if user_list is None:
-        user_list = []
-    else:
-        # Filter out any None values and convert valid users to dict
-        user_dict_list = [user.to_dict() for user in user_list if user is not None]
-    
-    return jsonify(user_dict_list), 200
-
-@api_bp.route('/users', methods=['POST'])
-def create_user_route():
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-            
-        name = data.get('Name')
-        email = data.get('Email')
-        
-        if not name or not email:
-            return jsonify({'error': 'Name and Email are required'}), 400
-        
-        # Check for existing email before trying to create
-        existing_user = User.query.filter_by(Email=email).first()
-        if existing_user:
-            return jsonify({'error': 'Email already exists'}), 409
-            
-        # Create user using service function
-        user = create_user(name=name, email=email)
-        
-        return jsonify({
-            'message': 'User created successfully',
-            'User_ID': user.User_ID,
-            'user': user.to_dict()
-        }), 201
-        
-    except IntegrityError:
-        db.session.rollback()
-        return jsonify({
-            'error': 'Database integrity error',
-            'message': 'Email must be unique'
-        }), 409
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({
-            'error': 'Failed to create user',
-            'message': str(e)
-        }), 500
-
-
-@api_bp.route('/users/<string:user_id>', methods=['DELETE'])
-def delete_user_route(user_id):
-    """
-    Delete a user and their preferences via DELETE request.
-    """
-    try:
-        deleted, user_data = delete_user(user_id)
-        
-        if deleted:
-            return jsonify({
-                'message': 'User deleted successfully',
-                'user': user_data
-            }), 200
-        else:
-            return jsonify({
-                'error': 'User not found',
-                'message': f'No user found with ID {user_id}'
-            }), 404
-            
-    except ValueError as e:
-        return jsonify({
-            'error': 'Validation error',
-            'message': str(e)
-        }), 400
-    except Exception as e:
-        print(f"Error deleting user: {str(e)}")  # For debugging
-        return jsonify({
-            'error': 'Failed to delete user',
-            'message': str(e)
-        }), 500
-
-
-@api_bp.route('/users/<string:user_id>', methods=['PUT'])
-def update_user_route(user_id):
-    """
-    Update a user's name via PUT request.
-    Expects JSON data with 'Name' field.
-    """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'error': 'No data provided',
-                'message': 'Request body is required'
-            }), 400
-            
-        new_name = data.get('Name')
-        if not new_name:
-            return jsonify({
-                'error': 'Name is required',
-                'message': 'Name field must be provided'
-            }), 400
-
-        updated_user = update_user_name(user_id, new_name)
-        
-        return jsonify({
-            'message': 'User updated successfully',
-            'user': updated_user
-        }), 200
-
-    except ValueError as e:
-        return jsonify({
-            'error': 'Validation error',
-            'message': str(e)
-        }), 400
-    except Exception as e:
-        print(f"Error updating user: {str(e)}")  # For debugging
-        return jsonify({
-            'error': 'Failed to update user',
-            'message': str(e)
-        }), 500
-    
-
-# ---------------------------------------------------------
-# Category 
-# ---------------------------------------------------------
-
-@api_bp.route('/categories')
-def get_categories():
-    """
-    Retrieve a list of categories with an optional limit parameter.
-    
-    Returns:
-        tuple: A tuple containing a JSON response with categories and an HTTP status code 200.
-    """
-    # Get the 'limit' parameter from the URL if provided, otherwise None for all records
-    limit = request.args.get('limit', default=None, type=int)
-    
-    # Get categories from the service with the specified limit
-    category_list = services.get_all_categories(limit)
-    
-    # Convert the list of Category objects to a list of dictionaries for JSON serialization
-    category_dict_list = [category.to_dict() for category in category_list]
-    return jsonify(category_dict_list), 200
-    
-
-
-# ---------------------------------------------------------
-# Article
-# ---------------------------------------------------------
-@api_bp.route('/articles')
-def get_articles():
-    limit = request.args.get('limit', default=250, type=int)
-    
-    try:
-        article_list = services.get_all_articles(limit)
-        
-        article_dict_list = []
-        for article, category in article_list:
-            article_dict = {
-                "Title": str(article.Title),
-                "Content": str(article.Content),
-                "URL": str(article.URL) if article.URL else None,
-                "Authors": str(article.Authors) if article.Authors else None,
-                "Category": str(category.Category),
-                "Description": str(category.Description)
-            }
-            article_dict_list.append(article_dict)
-        
-        response = jsonify(article_dict_list)
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-@api_bp.route('/articles/by-category-name')
-def get_articles_by_category_name():
-    category_name = request.args.get('category', default=None, type=str)
-    limit = request.args.get('limit', default=250, type=int)
-    
-    try:
-        article_list = services.get_articles_by_category_name(category_name, limit)
-        
-        article_dict_list = []
-        for article, category in article_list:
-            article_dict = {
-                "Title": str(article.Title),
-                "Content": str(article.Content),
-                "URL": str(article.URL) if article.URL else None,
-                "Authors": str(article.Authors) if article.Authors else None,
-                "Category": str(category.Category),
-                "Description": str(category.Description)
-            }
-            article_dict_list.append(article_dict)
-        
-        response = jsonify(article_dict_list)
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
- 
-    
-
-@api_bp.route('/articles', methods=['POST'])
-def create_article():
-    """
-    Create a new article.
-    
-    Request Body:
-        {
-            "title": "Article Title",
-            "content": "Article Content",
-            "category_id": 1,
-            "url": "https://example.com/article" (optional)
-        }
-    
-    Returns:
-        tuple: A tuple containing a JSON response with the created article and HTTP status code 201.
-    """
-    data = request.get_json()
-
-# ---------------------------------------------------------
-# User Preference
-# ---------------------------------------------------------
-@api_bp.route('/user_preferences', methods=['GET'])
-def get_user_preferences():
-    """
-    Retrieve a consolidated list of user preferences with optional filters.
-    Supports filtering by name and limiting results.
-    
-    Query Parameters:
-        limit (int): Maximum number of users to return
-        name (str): Filter users by name (case-insensitive partial match)
-    
-    Returns:
-        tuple: A tuple containing a JSON response with consolidated user preferences 
-        and an HTTP status code 200.
-    """
-    limit = request.args.get('limit', default=None, type=int)
-    name = request.args.get('name', default=None, type=str)
-    
-    try:
-        consolidated_preferences = get_all_user_preferences(limit=limit, name=name)
-        return jsonify({
-            "total_users": len(consolidated_preferences),
-            "users": consolidated_preferences
-        }), 200
-    except Exception as e:
-        print(f"Error in get_user_preferences: {str(e)}")  # Debug logging
-        return jsonify({
-            'error': 'Failed to retrieve user preferences',
-            'message': str(e)
-        }), 500
-
-
-@api_bp.route('/user_preferences/<string:user_id>', methods=['PUT'])
-def update_user_preference_route(user_id):
-    """
-    Update a user's preferences via PUT request.
-    Expects JSON data with 'categories' field containing a list of category names.
-    """
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'error': 'No data provided',
-                'message': 'Request body is required'
-            }), 400
-            
-        categories = data.get('categories')
-        if not categories or not isinstance(categories, list):
-            return jsonify({
-                'error': 'Categories are required',
-                'message': 'Categories field must be provided as a list of category names'
-            }), 400
-        
-        updated_preferences = update_user_preferences(user_id, categories)
-        
-        if updated_preferences:
-            return jsonify({
-                'message': 'User preferences updated successfully',
-                'preferences': updated_preferences
-            }), 200
-        else:
-            return jsonify({
-                'error': 'Failed to update preferences',
-                'message': 'Unable to create or update preferences'
-            }), 500
-    except ValueError as e:
-        return jsonify({
-            'error': 'Validation error',
-            'message': str(e)
-        }), 400
-    except Exception as e:
-        print(f"Error updating user preferences: {str(e)}")  # For debugging
-        return jsonify({
-            'error': 'Failed to update user preferences',
-            'message': str(e)
-        }), 500
-
-
-
-@api_bp.route('/user_preferences/<string:user_id>/<string:category_name>', methods=['DELETE'])
-def delete_user_preference_route(user_id, category_name):
-    """
-    Delete a specific user preference via DELETE request using category name.
-    """
-    try:
-        # Delete the preference
-        deleted, category = delete_user_preference(user_id, category_name)
-        
-        if deleted:
-            return jsonify({
-                'message': 'User preference deleted successfully',
-                'user_id': user_id,
-                'category': category
-            }), 200
-        else:
-            return jsonify({
-                'error': 'Preference not found',
-                'message': f'No preference found for user {user_id} and category {category}'
-            }), 404
-            
-    except ValueError as e:
-        return jsonify({
-            'error': 'Validation error',
-            'message': str(e)
-        }), 400
-    except Exception as e:
-        print(f"Error deleting user preference: {str(e)}")  # For debugging
-        return jsonify({
-            'error': 'Failed to delete user preference',
-            'message': str(e)
-        }), 500
-
-
-
-@api_bp.route('/user-preferences/stats')
-def get_preference_statistics():
-    """
-    Get statistics about user preferences.
-    Returns:
-        JSON response with category counts and HTTP status 200
-    """
-    try:
-        stats = services.get_user_preference_stats()
-        response = jsonify(stats)
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-#print("Available functions in services:", [func for func in dir(services) if callable(getattr(services, func)) and not func.startswith("_")])
-
-
-
+from flask import jsonify, request, Blueprint, Response, current_app, stream_with_context, make_response
+import api.services as services
+from api.services import update_user_name, update_user_preferences, delete_user_preference, get_user_preference_stats, create_user, get_all_user_preferences, delete_user
+from datetime import datetime
+from functools import wraps
+from itertools import islice
+import time
+import sqlite3
+from .models import User, db
+from sqlalchemy.exc import IntegrityError
+from utility.helpers import encode_cursor, decode_cursor, parse_timestamp, format_timestamp
+from api.resource_versions import resource_versions, CATEGORIES, ARTICLES, USERS, USER_PREFERENCES
+from api.responses import (install_json_provider, compress_response, etag_variants, article_serializer,
+                           serialize_articles)
+from api.metrics import start_request_metrics, finish_request_metrics, abandon_request_metrics, render_metrics
+from api.slow_queries import slow_query_log, MAX_SHAPES
+import re
+
+api_bp = Blueprint('api', __name__)
+
+# Per-request metrics (served at /metrics). after_request handlers run in reverse order of
+# registration, so the metrics hook sees the compressed response size.
+api_bp.before_request(start_request_metrics)
+api_bp.after_request(finish_request_metrics)
+api_bp.teardown_request(abandon_request_metrics)
+
+# Faster JSON encoding when orjson is installed, and compression of large responses
+api_bp.record_once(install_json_provider)
+api_bp.after_request(compress_response)
+
+
+def _requested_article_fields(default=services.DEFAULT_ARTICLE_FIELDS):
+    """
+    Parse the optional comma-separated 'fields' query parameter.
+
+    Returns:
+        tuple: The validated field names, or `default` (the default article fields).
+
+    Raises:
+        ValueError: If an unknown field is requested.
+    """
+    fields = request.args.get('fields', default=None, type=str)
+    if fields is None:
+        return default
+    return services.validate_article_fields([field.strip() for field in fields.split(',') if field.strip()])
+
+
+def _next_cursor(rows: list, limit, key) -> str:
+    """
+    Build the opaque cursor for the page after `rows`.
+
+    Returns None when the page came back short, i.e. there is nothing after it.
+    """
+    if not limit or len(rows) < limit:
+        return None
+    return encode_cursor(key(rows[-1]))
+
+
+TRUE_ARG_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_ARG_VALUES = ('0', 'false', 'no', 'off')
+
+
+def _flag_arg(name: str) -> bool:
+    """Read a boolean query parameter: 1/true/yes/on enable it, anything else (or absent) does not."""
+    return request.args.get(name, default='', type=str).strip().lower() in TRUE_ARG_VALUES
+
+
+def _bool_arg(name: str, default: bool) -> bool:
+    """
+    Read a boolean query parameter that must be explicit: 1/true/yes/on or
+    0/false/no/off, `default` when absent. Raises ValueError for anything else.
+    """
+    value = request.args.get(name, default=None, type=str)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in TRUE_ARG_VALUES:
+        return True
+    if value in FALSE_ARG_VALUES:
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+# Rows per chunk written to a streamed response
+STREAM_CHUNK_ROWS = 100
+
+
+def _requested_stream_format():
+    """
+    Return 'ndjson' or 'json' when the client asked for a streamed article
+    response (Accept: application/x-ndjson, or ?stream=1), otherwise None.
+    """
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    if best == 'application/x-ndjson':
+        return 'ndjson'
+    if _flag_arg('stream'):
+        return 'json'
+    return None
+
+
+def _stream_article_response(fetch_rows, stream_format: str, fields) -> Response:
+    """
+    Write (Article, Category) rows to the response as they are fetched.
+
+    NDJSON sends one article object per line; 'json' sends the same JSON array the
+    buffered endpoint returns, built incrementally.
+
+    `fetch_rows` is called once the response starts. The query must be built there,
+    not in the view: a query built in the view is bound to the view's session, which
+    is removed when the view returns, and the transaction the stream then opens on
+    it would hold a pooled connection until garbage collection. Built inside the
+    streamed context, it uses that context's session, removed when the stream ends.
+    """
+    dumps = current_app.json.dumps
+    serialize = article_serializer(fields)
+
+    def chunks():
+        iterator = iter(fetch_rows())
+        while True:
+            chunk = [dumps(serialize(article, category))
+                     for article, category in islice(iterator, STREAM_CHUNK_ROWS)]
+            if not chunk:
+                return
+            yield chunk
+
+    def generate():
+        if stream_format == 'ndjson':
+            for chunk in chunks():
+                yield '\n'.join(chunk) + '\n'
+            return
+
+        yield '['
+        separator = ''
+        for chunk in chunks():
+            yield separator + ','.join(chunk)
+            separator = ','
+        yield ']'
+
+    mimetype = 'application/x-ndjson' if stream_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def _decode_cursor_arg(expected_type: type):
+    """Decode the optional 'cursor' query parameter; raises ValueError if it is invalid."""
+    cursor = request.args.get('cursor', default=None, type=str)
+    return decode_cursor(cursor, expected_type) if cursor else None
+
+
+def _timestamp_arg(name: str):
+    """Parse an optional ISO 8601 query parameter to naive UTC; raises ValueError if it is invalid."""
+    value = request.args.get(name, default=None, type=str)
+    return parse_timestamp(value) if value else None
+
+def conditional_get(*resources: str):
+    """
+    Answer GET requests for data built from `resources` conditionally.
+
+    The ETag and Last-Modified come from the in-memory resource versions, so a
+    request whose If-None-Match (or, without it, If-Modified-Since) still matches
+    gets a 304 before the view runs, without querying or serializing anything.
+    Successful responses carry the validators and `Cache-Control: no-cache`, which
+    lets clients keep the body but makes them revalidate every time.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Read the versions before the view queries, so a concurrent write can
+            # only make the ETag older than the data, never newer
+            tag, modified = resource_versions.state(resources)
+            # Streamed and buffered article responses are different representations
+            tag = f'{tag}-{_requested_stream_format() or "buffered"}'
+            # A change within the current second could not be told apart by
+            # If-Modified-Since, so Last-Modified is only sent once it is stable
+            last_modified = int(modified) if int(modified) < int(time.time()) else None
+
+            if request.if_none_match:
+                # The client may hold a compressed variant of the representation
+                matched = [variant for variant in etag_variants(tag) if request.if_none_match.contains(variant)]
+                not_modified = bool(matched)
+            else:
+                not_modified = bool(last_modified and request.if_modified_since
+                                    and last_modified <= request.if_modified_since.timestamp())
+
+            if not_modified:
+                response = make_response('', 304)
+                response.set_etag(matched[0] if request.if_none_match else tag)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(tag)
+
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+@api_bp.route('/')
+def home():
+    """
+    Just a generic endpoint that we can use to test if the API is running.
+
+    Returns:
+        str: A timestamp string indicating the current time, alogn with a message.
+    """
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Get the current time
+    welcome_message = f'Welcome to the User API!  The current time: {current_time}'
+    return welcome_message, 200
+
+@api_bp.route('/connection')
+def test_connection():
+    """
+    Test the database connection.
+
+    Returns:
+        tuple: A tuple containing a JSON response with a message, the connection's
+        settings and connection pool statistics, and HTTP status 200 (503 if the
+        database cannot be reached).
+    """
+    try:
+        health = services.get_db_connection()
+    except Exception as e:
+        return jsonify({
+            'error': 'Database unavailable',
+            'message': str(e)
+        }), 503
+    return jsonify({'message': 'Successfully connected to the API', 'database': health}), 200
+
+
+@api_bp.route('/metrics')
+def metrics():
+    """
+    Per-route request, latency, SQL and response size metrics in Prometheus text format.
+
+    Returns:
+        Response: The metrics of this process (text/plain; version=0.0.4).
+    """
+    return Response(render_metrics(db.engine), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _slow_query_log_disabled():
+    """The 404 response of the slow-query routes while SLOW_QUERY_LOG is off, else None."""
+    if current_app.config.get('SLOW_QUERY_LOG'):
+        return None
+    return jsonify({
+        'error': 'Not found',
+        'message': 'The slow-query log is disabled (SLOW_QUERY_LOG)'
+    }), 404
+
+
+@api_bp.route('/debug/slow-queries')
+def get_slow_queries():
+    """
+    The statements that reached the slow-query threshold, grouped by statement shape.
+    Only served when the SLOW_QUERY_LOG config key is set.
+
+    Query Parameters:
+        limit (int): Number of shapes to return, by total time (default 20, at most 200)
+
+    Returns:
+        tuple: A JSON response with the threshold and, per shape, its count and timings,
+        calling service functions, slowest parameters (redacted) and EXPLAIN QUERY PLAN
+        output, and an HTTP status code 200; 404 when the log is disabled.
+    """
+    disabled = _slow_query_log_disabled()
+    if disabled:
+        return disabled
+
+    limit = request.args.get('limit', default=20, type=int)
+    if limit < 1:
+        return jsonify({
+            'error': 'Validation error',
+            'message': 'limit must be a positive integer'
+        }), 400
+    return jsonify({
+        'threshold_ms': slow_query_log.threshold_ms,
+        'queries': slow_query_log.top(min(limit, MAX_SHAPES))
+    }), 200
+
+
+@api_bp.route('/debug/slow-queries', methods=['DELETE'])
+def clear_slow_queries():
+    """Forget the recorded slow queries (404 when the log is disabled)."""
+    disabled = _slow_query_log_disabled()
+    if disabled:
+        return disabled
+    slow_query_log.clear()
+    return '', 204
+
+
+# ---------------------------------------------------------
+# Users 
+# ---------------------------------------------------------
+
+@api_bp.route('/users')
+def get_users():
+    """
+    Retrieve a list of users with optional limit and name filter parameters.
+   
+    Query Parameters:
+        limit (int): Maximum number of users to retrieve
+        name (str): Filter users by name
+        starts_with (bool): true (default) to filter names starting with the provided value,
+                          false to filter names containing it
+        cursor (str): The X-Next-Cursor header value of the previous page
+   
+    Returns:
+        tuple: A tuple containing a JSON response with users and an HTTP status code 200.
+        The X-Next-Cursor header is set when another page is available.
+    """
+    # Get query parameters
+    limit = request.args.get('limit', default=None, type=int)
+    name_filter = request.args.get('name', default=None, type=str)
+
+    try:
+        starts_with = _bool_arg('starts_with', default=True)
+        after = _decode_cursor_arg(str)
+    except ValueError as e:
+        return jsonify({'error': 'Validation error', 'message': str(e)}), 400
+   
+    # Get users based on filters
+    if name_filter:
+        user_list = services.get_users_by_name(name_filter, starts_with, limit, after)
+    else:
+        # Add a default limit if none is provided
+        default_limit = 100  # or whatever number makes sense for your application
+        limit = limit or default_limit
+        user_list = services.get_all_users(limit, after)
+   
+    # Handle case where user_list is None or contains None values
+    if user_list is None:
+        user_list = []
+
+    # Filter out any None values and convert valid users to dict
+    user_dict_list = [user.to_dict() for user in user_list if user is not None]
+
+    response = jsonify(user_dict_list)
+    next_cursor = _next_cursor(user_list, limit, lambda user: user.User_ID)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+@api_bp.route('/users', methods=['POST'])
+def create_user_route():
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+            
+        name = data.get('Name')
+        email = data.get('Email')
+        
+        if not name or not email:
+            return jsonify({'error': 'Name and Email are required'}), 400
+        
+        # Check for existing email before trying to create
+        existing_user = User.query.filter_by(Email=email).first()
+        if existing_user:
+            return jsonify({'error': 'Email already exists'}), 409
+            
+        # Create user using service function
+        user = create_user(name=name, email=email)
+        
+        return jsonify({
+            'message': 'User created successfully',
+            'User_ID': user.User_ID,
+            'user': user.to_dict()
+        }), 201
+        
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Database integrity error',
+            'message': 'Email must be unique'
+        }), 409
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Failed to create user',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/users/bulk', methods=['POST'])
+def create_users_bulk_route():
+    """
+    Create many users in one request and one transaction.
+    Expects a JSON array of {"Name", "Email"} objects (or {"users": [...]}).
+
+    Returns:
+        tuple: A JSON response with created/failed counts and one result per input
+        item, in input order, and an HTTP status code 200. Conflicting or invalid
+        items are reported individually and do not abort the batch.
+    """
+    try:
+        data = request.get_json()
+        users = data.get('users') if isinstance(data, dict) else data
+
+        if not users or not isinstance(users, list):
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Request body must be a non-empty list of users'
+            }), 400
+
+        results = services.create_users_bulk(users)
+        created = sum(1 for result in results if result['status'] == 'created')
+
+        return jsonify({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Database integrity error',
+            'message': 'Email must be unique'
+        }), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Failed to create users',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/users/<string:user_id>', methods=['DELETE'])
+def delete_user_route(user_id):
+    """
+    Delete a user and their preferences via DELETE request.
+    """
+    try:
+        deleted, user_data = delete_user(user_id)
+        
+        if deleted:
+            return jsonify({
+                'message': 'User deleted successfully',
+                'user': user_data
+            }), 200
+        else:
+            return jsonify({
+                'error': 'User not found',
+                'message': f'No user found with ID {user_id}'
+            }), 404
+            
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error deleting user: {str(e)}")  # For debugging
+        return jsonify({
+            'error': 'Failed to delete user',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/users/<string:user_id>', methods=['PUT'])
+def update_user_route(user_id):
+    """
+    Update a user's name via PUT request.
+    Expects JSON data with 'Name' field.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Request body is required'
+            }), 400
+            
+        new_name = data.get('Name')
+        if not new_name:
+            return jsonify({
+                'error': 'Name is required',
+                'message': 'Name field must be provided'
+            }), 400
+
+        updated_user = update_user_name(user_id, new_name)
+        
+        return jsonify({
+            'message': 'User updated successfully',
+            'user': updated_user
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error updating user: {str(e)}")  # For debugging
+        return jsonify({
+            'error': 'Failed to update user',
+            'message': str(e)
+        }), 500
+    
+
+@api_bp.route('/users/<string:user_id>/feed')
+def get_user_feed_route(user_id):
+    """
+    Retrieve a personalized article feed built from the user's preferred categories.
+
+    Query Parameters:
+        limit (int): Maximum number of articles to return (default 50)
+        cursor (str): The next_cursor value of the previous page
+        fields (str): Comma-separated article fields to return (e.g. Title,URL,Snippet)
+        collapse (bool): Return only one article per near-duplicate cluster
+
+    Returns:
+        tuple: A JSON response with the user's articles, newest first, and the
+        cursor for the next page (null on the last page).
+    """
+    limit = request.args.get('limit', default=50, type=int)
+
+    try:
+        before = _decode_cursor_arg(int)
+        fields = _requested_article_fields()
+        feed = services.get_user_feed(user_id, limit, before=before, fields=fields, collapse=_flag_arg('collapse'))
+
+        if feed is None:
+            return jsonify({
+                'error': 'User not found',
+                'message': f'No user found with ID {user_id}'
+            }), 404
+
+        return jsonify({
+            "User_ID": user_id,
+            "articles": serialize_articles(feed, fields),
+            "next_cursor": _next_cursor(feed, limit, lambda row: row[0].Article_ID)
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.exception('Error building user feed')
+        return jsonify({
+            'error': 'Failed to retrieve feed',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/users/<string:user_id>/recommended-categories')
+@conditional_get(USERS, USER_PREFERENCES, CATEGORIES)
+def get_recommended_categories_route(user_id):
+    """
+    Suggest categories for a user, from what users of the user's categories also chose.
+
+    Query Parameters:
+        limit (int): Maximum number of categories to return (default 5)
+
+    Returns:
+        tuple: A JSON response with the suggested categories and their scores, best
+        first, and an HTTP status code 200.
+    """
+    limit = request.args.get('limit', default=5, type=int)
+
+    try:
+        categories = services.get_recommended_categories(user_id, limit)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+
+    if categories is None:
+        return jsonify({
+            'error': 'User not found',
+            'message': f'No user found with ID {user_id}'
+        }), 404
+    return jsonify({"User_ID": user_id, "categories": categories}), 200
+
+
+# ---------------------------------------------------------
+# Category 
+# ---------------------------------------------------------
+
+@api_bp.route('/categories')
+@conditional_get(CATEGORIES)
+def get_categories():
+    """
+    Retrieve a list of categories with an optional limit parameter.
+    
+    Returns:
+        tuple: A tuple containing a JSON response with categories and an HTTP status code 200.
+    """
+    # Get the 'limit' parameter from the URL if provided, otherwise None for all records
+    limit = request.args.get('limit', default=None, type=int)
+    
+    # Get categories from the service with the specified limit
+    category_list = services.get_all_categories(limit)
+    
+    # Convert the list of Category objects to a list of dictionaries for JSON serialization
+    category_dict_list = [category.to_dict() for category in category_list]
+    return jsonify(category_dict_list), 200
+
+
+@api_bp.route('/categories/<string:category_name>/also-liked')
+@conditional_get(USER_PREFERENCES, CATEGORIES)
+def get_also_liked_categories_route(category_name):
+    """
+    The categories most often also chosen by the users of a category.
+
+    Query Parameters:
+        limit (int): Maximum number of categories to return (default 10)
+
+    Returns:
+        tuple: A JSON response with the category, its user count and the categories
+        its users also chose (users, share and lift), best first, and an HTTP status
+        code 200.
+    """
+    limit = request.args.get('limit', default=10, type=int)
+
+    try:
+        result = services.get_also_liked_categories(category_name, limit)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+
+    if result is None:
+        return jsonify({
+            'error': 'Category not found',
+            'message': f'No category named {category_name}'
+        }), 404
+    return jsonify(result), 200
+    
+
+
+# ---------------------------------------------------------
+# Article
+# ---------------------------------------------------------
+def _article_list_response(category_name=None):
+    """
+    Shared body of /articles and /articles/by-category-name: one page of articles,
+    optionally filtered by category name, buffered or streamed.
+    """
+    limit = request.args.get('limit', default=250, type=int)
+    
+    try:
+        after = _decode_cursor_arg(int)
+        fields = _requested_article_fields()
+        since, before = _timestamp_arg('since'), _timestamp_arg('before')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    collapse = _flag_arg('collapse')
+
+    try:
+        stream_format = _requested_stream_format()
+        if stream_format:
+            response = _stream_article_response(
+                lambda: services.stream_articles(category_name, limit, after, fields, collapse,
+                                                 since=since, before=before),
+                stream_format, fields)
+            response.headers.add('Access-Control-Allow-Origin', '*')
+            return response, 200
+
+        article_list = services.get_articles_by_category_name(category_name, limit, after, fields, collapse,
+                                                              since, before)
+        
+        response = jsonify(serialize_articles(article_list, fields))
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        next_cursor = _next_cursor(article_list, limit, lambda row: row[0].Article_ID)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/articles')
+@conditional_get(ARTICLES, CATEGORIES)
+def get_articles():
+    return _article_list_response()
+
+
+@api_bp.route('/articles/by-category-name')
+@conditional_get(ARTICLES, CATEGORIES)
+def get_articles_by_category_name():
+    category_name = request.args.get('category', default=None, type=str)
+    return _article_list_response(category_name)
+
+
+@api_bp.route('/articles/latest')
+@conditional_get(ARTICLES, CATEGORIES)
+def get_latest_articles():
+    """
+    Retrieve the most recently published articles, newest first. Pages within the
+    newest articles of each category are served from memory.
+
+    Query Parameters:
+        category (str): Filter by category name (case-insensitive, partial match)
+        limit (int): Maximum number of articles to return (default 20)
+        since (str): Only articles published at or after this ISO 8601 time
+        before (str): Only articles published before this ISO 8601 time
+        cursor (str): The next_cursor value of the previous page
+        fields (str): Comma-separated article fields to return
+            (default Article_ID,Title,Snippet,URL,Authors,Category,Published_At)
+
+    Returns:
+        tuple: A JSON response with the articles and the cursor for the next page
+        (null on the last page).
+    """
+    category_name = request.args.get('category', default=None, type=str)
+    limit = request.args.get('limit', default=services.DEFAULT_LATEST_LIMIT, type=int)
+
+    try:
+        fields = _requested_article_fields(default=services.DEFAULT_LATEST_FIELDS)
+        since, before = _timestamp_arg('since'), _timestamp_arg('before')
+        after = _decode_cursor_arg(list)
+        if after is not None:
+            if not (len(after) == 2 and isinstance(after[0], str) and type(after[1]) is int):
+                raise ValueError('Invalid cursor')
+            after = (parse_timestamp(after[0]), after[1])
+
+        articles = services.get_latest_articles(category_name, limit, fields, since, before, after)
+
+        return jsonify({
+            "articles": serialize_articles(articles, fields),
+            "next_cursor": _next_cursor(
+                articles, limit, lambda row: [format_timestamp(row[0].Published_At), row[0].Article_ID]
+            )
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.exception('Error retrieving latest articles')
+        return jsonify({
+            'error': 'Failed to retrieve latest articles',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/articles/<int:article_id>/duplicates')
+def get_article_duplicates(article_id):
+    """
+    Retrieve the near-duplicate cluster of an article: every stored article whose
+    title and body are estimated to be at least 70% similar to the cluster's first article.
+
+    Query Parameters:
+        fields (str): Comma-separated article fields to return (e.g. Title,URL,Snippet)
+
+    Returns:
+        tuple: A JSON response with the Cluster_ID and the cluster's articles
+        ordered by Article_ID, or 404 if the article does not exist.
+    """
+    try:
+        fields = _requested_article_fields()
+        cluster = services.get_duplicate_cluster(article_id, fields)
+    except ValueError as e:
+        return jsonify({'error': 'Validation error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to retrieve duplicates', 'message': str(e)}), 500
+
+    if cluster is None:
+        return jsonify({
+            'error': 'Article not found',
+            'message': f'No article found with ID {article_id}'
+        }), 404
+
+    cluster_id, members = cluster
+    return jsonify({
+        "Article_ID": article_id,
+        "Cluster_ID": cluster_id,
+        "articles": serialize_articles(members, fields)
+    }), 200
+
+
+@api_bp.route('/articles/search')
+def search_articles_route():
+    """
+    Full-text search over article titles and content, ranked by relevance (BM25).
+
+    Query Parameters:
+        q (str): Words to search for; all of them must match ('word*' matches a prefix)
+        category (str): Filter by category name (case-insensitive, partial match)
+        limit (int): Maximum number of articles to return (default 25)
+        cursor (str): The next_cursor value of the previous page
+        fields (str): Comma-separated article fields to return
+
+    Returns:
+        tuple: A JSON response with the matching articles, best first, and the cursor
+        for the next page (null on the last page).
+    """
+    query = request.args.get('q', default='', type=str)
+    category_name = request.args.get('category', default=None, type=str)
+    limit = request.args.get('limit', default=25, type=int)
+
+    try:
+        fields = _requested_article_fields()
+        after = _decode_cursor_arg(list)
+        if after is not None and not (len(after) == 2 and isinstance(after[0], (int, float))
+                                      and type(after[1]) is int):
+            raise ValueError('Invalid cursor')
+
+        results = services.search_articles(query, category_name, limit, after, fields)
+
+        return jsonify({
+            "query": query,
+            "articles": serialize_articles(results, fields),
+            "next_cursor": _next_cursor(results, limit, lambda row: [row[2], row[0].Article_ID])
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        current_app.logger.exception('Error searching articles')
+        return jsonify({
+            'error': 'Failed to search articles',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/articles', methods=['POST'])
+def create_article():
+    """
+    Create a new article.
+    
+    Request Body:
+        {
+            "Title": "Article Title",
+            "Content": "Article Content",
+            "Category_ID": 1,
+            "URL": "https://example.com/article" (optional),
+            "Authors": "Jane Doe" (optional),
+            "Published_At": "2024-05-01T12:30:00Z" (optional, defaults to now)
+        }
+    
+    Returns:
+        tuple: A tuple containing a JSON response with the created article's ID and HTTP
+        status code 201, or 409 with the existing article's ID if it is a duplicate.
+    """
+    try:
+        data = request.get_json()
+
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+
+        result = services.create_articles_batch([data])[0]
+
+        if result['status'] == 'invalid':
+            return jsonify({'error': 'Validation error', 'message': result['error']}), 400
+        if result['status'] == 'duplicate':
+            return jsonify({
+                'error': 'Duplicate article',
+                'message': f'Article matches an existing article by {result["reason"]}',
+                'Article_ID': result['Article_ID']
+            }), 409
+
+        return jsonify({
+            'message': 'Article created successfully',
+            'Article_ID': result['Article_ID']
+        }), 201
+
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Database integrity error',
+            'message': 'An article with this URL already exists'
+        }), 409
+    except Exception as e:
+        return jsonify({
+            'error': 'Failed to create article',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/articles/batch', methods=['POST'])
+def create_articles_batch_route():
+    """
+    Ingest many articles in one request and one transaction.
+    Expects a JSON array of article objects (or {"articles": [...]}), each shaped like
+    the body of POST /articles.
+
+    Returns:
+        tuple: A JSON response with created/duplicate/invalid counts and one result per
+        input item, in input order, and an HTTP status code 200. Duplicates (same
+        normalized URL or same content as a stored article or an earlier item) are
+        skipped and reported with the Article_ID they duplicate.
+    """
+    try:
+        data = request.get_json()
+        articles = data.get('articles') if isinstance(data, dict) else data
+
+        if not articles or not isinstance(articles, list):
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Request body must be a non-empty list of articles'
+            }), 400
+
+        results = services.create_articles_batch(articles)
+
+        return jsonify({
+            'created': sum(1 for result in results if result['status'] == 'created'),
+            'duplicates': sum(1 for result in results if result['status'] == 'duplicate'),
+            'invalid': sum(1 for result in results if result['status'] == 'invalid'),
+            'results': results
+        }), 200
+
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({
+            'error': 'Database integrity error',
+            'message': 'An article in the batch was stored concurrently; retry the batch'
+        }), 409
+    except Exception as e:
+        current_app.logger.exception('Error ingesting articles')
+        return jsonify({
+            'error': 'Failed to ingest articles',
+            'message': str(e)
+        }), 500
+
+# ---------------------------------------------------------
+# User Preference
+# ---------------------------------------------------------
+def _preference_audience_response(category_names: str, limit):
+    """The audience query branch of GET /user_preferences."""
+    match = request.args.get('match', default='all', type=str)
+    try:
+        if request.args.get('name') is not None:
+            raise ValueError('name cannot be combined with categories')
+        after = _decode_cursor_arg(str)
+        categories, total, user_ids = services.get_preference_audience(
+            category_names.split(','), match=match, limit=limit, after=after
+        )
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+
+    return jsonify({
+        "categories": [category.Category for category in categories],
+        "match": match,
+        "total_users": total,
+        "User_IDs": user_ids,
+        "next_cursor": _next_cursor(user_ids, services.preferences_page_size(limit), lambda user_id: user_id)
+    }), 200
+
+
+@api_bp.route('/user_preferences', methods=['GET'])
+def get_user_preferences():
+    """
+    Retrieve a consolidated list of user preferences with optional filters.
+    Supports filtering by name and paging through the results.
+
+    With `categories`, answers an audience query instead: the number of users whose
+    preferences include all (or any) of the categories, and a page of their User_IDs.
+    
+    Query Parameters:
+        limit (int): Maximum number of users to return (default 100, at most 1000)
+        name (str): Filter users by name (case-insensitive partial match)
+        cursor (str): The next_cursor value of the previous page
+        format (str): 'compact' to send each user's categories as integer IDs, with
+            a single Category_ID -> name dictionary for the page
+        categories (str): Comma-separated category names of an audience query
+        match (str): 'all' (default) or 'any' of the audience query's categories
+    
+    Returns:
+        tuple: A tuple containing a JSON response with consolidated user preferences 
+        and an HTTP status code 200.
+    """
+    limit = request.args.get('limit', default=None, type=int)
+    name = request.args.get('name', default=None, type=str)
+    response_format = request.args.get('format', default='full', type=str)
+    audience_categories = request.args.get('categories', default=None, type=str)
+
+    if audience_categories is not None:
+        return _preference_audience_response(audience_categories, limit)
+
+    try:
+        after = _decode_cursor_arg(str)
+        if response_format not in ('full', 'compact'):
+            raise ValueError("format must be 'full' or 'compact'")
+        page_size = services.preferences_page_size(limit)
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    
+    try:
+        if response_format == 'compact':
+            users, categories = services.get_user_preferences_compact(limit=page_size, name=name, after=after)
+            return jsonify({
+                "total_users": len(users),
+                "categories": categories,
+                "users": users,
+                "next_cursor": _next_cursor(users, page_size, lambda user: user["User_ID"])
+            }), 200
+
+        consolidated_preferences = get_all_user_preferences(limit=page_size, name=name, after=after)
+        return jsonify({
+            "total_users": len(consolidated_preferences),
+            "users": consolidated_preferences,
+            "next_cursor": _next_cursor(consolidated_preferences, page_size, lambda user: user["User_ID"])
+        }), 200
+    except Exception as e:
+        print(f"Error in get_user_preferences: {str(e)}")  # Debug logging
+        return jsonify({
+            'error': 'Failed to retrieve user preferences',
+            'message': str(e)
+        }), 500
+
+
+@api_bp.route('/user_preferences/<string:user_id>', methods=['PUT'])
+def update_user_preference_route(user_id):
+    """
+    Update a user's preferences via PUT request.
+    Expects JSON data with 'categories' field containing a list of category names.
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Request body is required'
+            }), 400
+            
+        categories = data.get('categories')
+        if not categories or not isinstance(categories, list):
+            return jsonify({
+                'error': 'Categories are required',
+                'message': 'Categories field must be provided as a list of category names'
+            }), 400
+        
+        updated_preferences = update_user_preferences(user_id, categories)
+        
+        if updated_preferences:
+            return jsonify({
+                'message': 'User preferences updated successfully',
+                'preferences': updated_preferences
+            }), 200
+        else:
+            return jsonify({
+                'error': 'Failed to update preferences',
+                'message': 'Unable to create or update preferences'
+            }), 500
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error updating user preferences: {str(e)}")  # For debugging
+        return jsonify({
+            'error': 'Failed to update user preferences',
+            'message': str(e)
+        }), 500
+
+
+
+@api_bp.route('/user_preferences/<string:user_id>/<string:category_name>', methods=['DELETE'])
+def delete_user_preference_route(user_id, category_name):
+    """
+    Delete a specific user preference via DELETE request using category name.
+    """
+    try:
+        # Delete the preference
+        deleted, category = delete_user_preference(user_id, category_name)
+        
+        if deleted:
+            return jsonify({
+                'message': 'User preference deleted successfully',
+                'user_id': user_id,
+                'category': category
+            }), 200
+        else:
+            return jsonify({
+                'error': 'Preference not found',
+                'message': f'No preference found for user {user_id} and category {category}'
+            }), 404
+            
+    except ValueError as e:
+        return jsonify({
+            'error': 'Validation error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        print(f"Error deleting user preference: {str(e)}")  # For debugging
+        return jsonify({
+            'error': 'Failed to delete user preference',
+            'message': str(e)
+        }), 500
+
+
+
+@api_bp.route('/user-preferences/stats')
+@conditional_get(USER_PREFERENCES, CATEGORIES)
+def get_preference_statistics():
+    """
+    Get statistics about user preferences.
+    Returns:
+        JSON response with category counts and HTTP status 200
+    """
+    try:
+        stats = services.get_user_preference_stats()
+        response = jsonify(stats)
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        return response, 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+#print("Available functions in services:", [func for func in dir(services) if callable(getattr(services, func)) and not func.startswith("_")])
+
+
+
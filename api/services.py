@@ -1,32 +1,167 @@
 from sqlalchemy.exc import SQLAlchemyError
-from api.models import db, User, Article, Category, UserPreference
+from api.models import db, User, Article, Category, UserPreference, ArticleSignature, CategoryStat
+from api import near_duplicates
+from api.resource_versions import touch, ARTICLES, USERS, USER_PREFERENCES
+from api.category_cache import category_cache, CachedCategory, normalize_category_name
+from api.category_cooccurrence import category_cooccurrence
+from api.preference_index import preference_index, record_preference_change
+from api.latest_articles import latest_articles, LatestArticle, LATEST_FIELDS, recency_key, record_new_articles
+from utility.helpers import normalize_url, url_hash, content_hash, parse_timestamp
 from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timezone
 from pathlib import Path
 import sqlite3
 import re
-from sqlalchemy import func
+import heapq
+import time
+from itertools import islice, groupby
+from sqlalchemy import func, text, or_, and_, table, column, literal_column, insert, delete, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import load_only, with_expression, aliased
 
 
+# ---------------------------------------------------------
+# Database Functions
+# ---------------------------------------------------------
+
+SYNCHRONOUS_MODES = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def get_db_connection() -> Dict[str, Any]:
+    """
+    Check out a pooled connection, run a trivial query on it and report its settings.
+
+    Returns:
+        Dict[str, Any]: The query latency, the connection's effective pragmas and the
+        pool's size and checked-in/checked-out/overflow counts.
+
+    Raises:
+        SQLAlchemyError: If no connection could be opened or the query failed.
+    """
+    started = time.perf_counter()
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('SELECT 1').scalar()
+        latency_ms = (time.perf_counter() - started) * 1000
+        pragmas = {
+            name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout')
+        }
+        pragmas['synchronous'] = SYNCHRONOUS_MODES.get(pragmas['synchronous'], pragmas['synchronous'])
+
+    pool = db.engine.pool
+    pool_stats = {"class": type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        if hasattr(pool, name):
+            pool_stats[name] = getattr(pool, name)()
+
+    return {
+        "latency_ms": round(latency_ms, 3),
+        "pragmas": pragmas,
+        "pool": pool_stats
+    }
+
 # ---------------------------------------------------------
 # Users Functions
 # ---------------------------------------------------------
 
-def get_all_users(limit: int = None) -> List[User]:
+def get_all_users(limit: int = None, after: Optional[str] = None) -> List[User]:
     """
-    Retrieve users from the database with a specified limit.
+    Retrieve users from the database with a specified limit, ordered by User_ID.
     
     Args:
         limit (int): Maximum number of User objects to retrieve.
+        after (str, optional): Only return users with a greater User_ID (keyset cursor).
     
     Returns:
         List[User]: A list of User objects up to the specified limit.
     """
-    return User.query.limit(limit).all()
+    query = User.query
+    if after is not None:
+        query = query.filter(User.User_ID > after)
+    return query.order_by(User.User_ID).limit(limit).all()
+
+# Trigram index over user names for substring search. Like article_fts it is an
+# external-content FTS5 table kept in sync by triggers, so every path that writes
+# a user (create_user, create_users_bulk, update_user_name, delete_user and the CSV
+# loader) updates it in the same transaction. FTS5 answers LIKE '%abc%' on it by
+# intersecting the posting lists of the pattern's trigrams. It is keyed by the
+# user table's implicit rowid, which VACUUM may renumber, so rebuild it after a
+# VACUUM (python -m utility.data.migrate --rebuild-search).
+USER_NAME_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_name_trigram USING fts5(
+        Name, content='user', content_rowid='rowid', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS user_name_trigram_insert AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_name_trigram(rowid, Name) VALUES (new.rowid, new.Name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_name_trigram_delete AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_name_trigram(user_name_trigram, rowid, Name) VALUES ('delete', old.rowid, old.Name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_name_trigram_update AFTER UPDATE OF Name ON "user" BEGIN
+        INSERT INTO user_name_trigram(user_name_trigram, rowid, Name) VALUES ('delete', old.rowid, old.Name);
+        INSERT INTO user_name_trigram(rowid, Name) VALUES (new.rowid, new.Name);
+    END""",
+)
+
+# Shorter search strings contain no trigram, so they fall back to a plain LIKE scan
+MIN_TRIGRAM_QUERY_LENGTH = 3
+
+user_name_trigram = table('user_name_trigram', column('rowid'), column('Name'))
+
+
+def init_user_name_search(rebuild: bool = False) -> bool:
+    """
+    Create the user name trigram index and its sync triggers if they do not exist yet,
+    and build the index from the existing users the first time.
+
+    Args:
+        rebuild (bool): Rebuild the index from the user table even if it exists.
 
-def get_users_by_name(name_filter: str, starts_with: bool = True) -> List[User]:
+    Returns:
+        bool: True if the index was created by this call.
+    """
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_name_trigram'")
+    ).first()
+
+    try:
+        for statement in USER_NAME_SEARCH_DDL:
+            db.session.execute(text(statement))
+        if not exists or rebuild:
+            db.session.execute(text("INSERT INTO user_name_trigram(user_name_trigram) VALUES ('rebuild')"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+    return not exists
+
+
+def _name_contains(name_filter: str):
+    """
+    Filter for users whose name contains `name_filter` (case-insensitive), answered
+    from the trigram index when the string is long enough to have trigrams.
+    """
+    pattern = f'%{name_filter}%'
+    if len(name_filter) < MIN_TRIGRAM_QUERY_LENGTH:
+        return User.Name.like(pattern)
+    return literal_column('"user".rowid').in_(
+        select(user_name_trigram.c.rowid).where(user_name_trigram.c.Name.like(pattern))
+    )
+
+
+def _users_by_name_query(name_filter: str, starts_with: bool = True, after: Optional[str] = None):
+    # LIKE ignores case in SQLite, so a prefix pattern can use ix_user_Name_nocase
     if starts_with:
-        return User.query.filter(User.Name.like(f'{name_filter}%')).all()
-    return User.query.filter(User.Name.like(f'%{name_filter}%')).all()
+        query = User.query.filter(User.Name.like(f'{name_filter}%'))
+    else:
+        query = User.query.filter(_name_contains(name_filter))
+    if after is not None:
+        query = query.filter(User.User_ID > after)
+    return query.order_by(User.User_ID)
+
+def get_users_by_name(name_filter: str, starts_with: bool = True, limit: int = None,
+                      after: Optional[str] = None) -> List[User]:
+    return _users_by_name_query(name_filter, starts_with, after).limit(limit).all()
 
 def create_user(name: str, email: str) -> User:
     """Create a new user with a unique ID in format XX-XXXXXXX"""
@@ -45,6 +180,7 @@ def create_user(name: str, email: str) -> User:
         )
         
         db.session.add(new_user)
+        touch(USERS)
         db.session.commit()
         return new_user
         
@@ -53,6 +189,93 @@ def create_user(name: str, email: str) -> User:
         raise e
 
 
+# Maximum number of users accepted by one bulk create call
+MAX_BULK_USERS = 1000
+
+
+def _allocate_user_ids(count: int) -> List[str]:
+    """
+    Generate `count` unused user IDs, checking each round of candidates against the
+    user table with a single query instead of one lookup per ID.
+    """
+    user_ids = set()
+    while len(user_ids) < count:
+        candidates = {User.generate_user_id() for _ in range(count - len(user_ids))} - user_ids
+        taken = {row[0] for row in db.session.query(User.User_ID).filter(User.User_ID.in_(candidates))}
+        user_ids |= candidates - taken
+    return list(user_ids)
+
+
+def create_users_bulk(users: List[dict]) -> List[dict]:
+    """
+    Create many users at once in a single transaction.
+
+    Email uniqueness is checked with one set-based query, IDs are allocated in batch
+    and all new rows are inserted with one executemany. Rows that are invalid or whose
+    Email already exists (in the database or earlier in the batch) are reported and
+    skipped; they do not abort the rest of the batch.
+
+    Args:
+        users (List[dict]): Items with 'Name' and 'Email' keys.
+
+    Returns:
+        List[dict]: One result per input item, in input order, with 'index', 'status'
+        ('created', 'conflict' or 'invalid') and either 'user' or 'error'.
+    """
+    if len(users) > MAX_BULK_USERS:
+        raise ValueError(f'A bulk request may contain at most {MAX_BULK_USERS} users')
+
+    results = [None] * len(users)
+    pending = []
+    batch_emails = set()
+
+    for index, item in enumerate(users):
+        name = item.get('Name') if isinstance(item, dict) else None
+        email = item.get('Email') if isinstance(item, dict) else None
+
+        if not name or not email or not isinstance(name, str) or not isinstance(email, str):
+            results[index] = {"index": index, "status": "invalid", "error": 'Name and Email are required'}
+        elif email in batch_emails:
+            results[index] = {"index": index, "status": "conflict", "error": 'Duplicate Email in request'}
+        else:
+            batch_emails.add(email)
+            pending.append((index, name, email))
+
+    try:
+        existing_emails = set()
+        if batch_emails:
+            existing_emails = {
+                row[0] for row in db.session.query(User.Email).filter(User.Email.in_(batch_emails))
+            }
+
+        new_rows = []
+        for index, name, email in pending:
+            if email in existing_emails:
+                results[index] = {"index": index, "status": "conflict", "error": 'Email already exists'}
+            else:
+                new_rows.append((index, {"Name": name, "Email": email}))
+
+        for (index, row), user_id in zip(new_rows, _allocate_user_ids(len(new_rows))):
+            row["User_ID"] = user_id
+
+        if new_rows:
+            db.session.execute(insert(User), [row for index, row in new_rows])
+            touch(USERS)
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+    for index, row in new_rows:
+        results[index] = {
+            "index": index,
+            "status": "created",
+            "user": {"User_ID": row["User_ID"], "Name": row["Name"], "Email": row["Email"]}
+        }
+    return results
+
+
 def update_user_name(user_id: str, new_name: str):
     """
     Update a user's name in the database.
@@ -71,6 +294,7 @@ def update_user_name(user_id: str, new_name: str):
             raise ValueError(f'No user found with ID {user_id}')
 
         user.Name = new_name
+        touch(USERS)
         db.session.commit()
         return user.to_dict()
     except Exception as e:
@@ -106,15 +330,20 @@ def delete_user(user_id: str) -> tuple[bool, dict]:
         }
         
         # Get associated preferences before deletion for the response
-        preferences = UserPreference.query.filter_by(User_ID=user_id).join(
-            Category,
-            UserPreference.Category_ID == Category.Category_ID
-        ).with_entities(Category.Category).all()
+        preferences = UserPreference.query.filter_by(User_ID=user_id).with_entities(
+            UserPreference.Category_ID
+        ).all()
         
-        user_data["preferences"] = [pref[0] for pref in preferences]
+        categories = [category_cache.get(pref[0]) for pref in preferences]
+        user_data["preferences"] = [category.Category for category in categories if category]
         
         # Delete user (will cascade to preferences if set up in model)
         db.session.delete(user)
+        touch(USERS)
+        if preferences:
+            _adjust_category_stats({pref[0]: -1 for pref in preferences})
+            record_preference_change(user_id, [pref[0] for pref in preferences], [])
+            touch(USER_PREFERENCES)
         db.session.commit()
         
         return True, user_data
@@ -128,42 +357,205 @@ def delete_user(user_id: str) -> tuple[bool, dict]:
 # Category Functions
 # ---------------------------------------------------------
 
-def get_all_categories(limit: int = None) -> List[Category]:
+def get_all_categories(limit: int = None) -> List[CachedCategory]:
     """
-    Retrieve categories from the database with a specified limit.
+    Retrieve categories with a specified limit. Served from the in-memory category cache.
     
     Args:
-        limit (int): Maximum number of Category objects to retrieve.
+        limit (int): Maximum number of categories to retrieve.
 
     Returns:
-        List[Category]: A list of Category objects up to the specified limit.
+        List[CachedCategory]: A list of categories up to the specified limit.
     """
     # Apply limit if specified, otherwise retrieve all categories
-    return Category.query.limit(limit).all() if limit else Category.query.all()
+    categories = category_cache.all()
+    return categories[:limit] if limit else categories
+
+
+def resolve_category_ids(category_name: str) -> List[int]:
+    """
+    Resolve a partial category name (case-insensitive) to the matching Category_IDs
+    using the category cache, so article queries can filter on Article.Category_ID alone.
+    """
+    return category_cache.ids_matching(category_name)
 
 
 # ---------------------------------------------------------
 # Article Functions
 # ---------------------------------------------------------
 
-def get_all_articles(limit: int = 250) -> List[tuple]:
+# Rows fetched per round trip when streaming article results
+STREAM_BATCH_SIZE = 500
+
+# Fields a client can ask for on the article listings (?fields=...)
+ARTICLE_FIELDS = ("Article_ID", "Title", "Content", "Snippet", "URL", "Authors",
+                  "Category_ID", "Category", "Description", "Published_At")
+DEFAULT_ARTICLE_FIELDS = ("Title", "Content", "URL", "Authors", "Category", "Description", "Published_At")
+
+# Number of characters of Content returned as Snippet
+SNIPPET_LENGTH = 200
+
+
+def validate_article_fields(fields: Optional[List[str]]) -> Tuple[str, ...]:
+    """
+    Validate a requested article field list, falling back to the default fields.
+
+    Raises:
+        ValueError: If an unknown field is requested.
+    """
+    if not fields:
+        return DEFAULT_ARTICLE_FIELDS
+
+    invalid = [field for field in fields if field not in ARTICLE_FIELDS]
+    if invalid:
+        raise ValueError(f'Invalid fields: {", ".join(invalid)}. '
+                         f'Valid fields are: {", ".join(ARTICLE_FIELDS)}')
+    return tuple(dict.fromkeys(fields))
+
+
+def _article_load_options(fields: Tuple[str, ...]) -> list:
+    """
+    Build loader options so only the columns behind the requested fields are selected.
+
+    Content stays deferred unless asked for; Snippet is cut from it in SQL so the
+    full body never leaves the database.
+    """
+    article_columns = [getattr(Article, field) for field in fields
+                       if field in ("Title", "Content", "URL", "Authors", "Published_At")]
+    options = [load_only(Article.Article_ID, Article.Category_ID, *article_columns)]
+
+    if "Snippet" in fields:
+        options.append(with_expression(Article.Snippet, func.substr(Article.Content, 1, SNIPPET_LENGTH)))
+    return options
+
+
+def _article_criteria(article, category_ids: Optional[List[int]] = None, since: Optional[datetime] = None,
+                      before: Optional[datetime] = None, index_category: bool = True) -> list:
+    """
+    The WHERE criteria of the article listing filters, on `article` (Article or an alias
+    of it): the categories, using Category_ID alone, and the publication window.
+    With index_category=False the category is compared as `Category_ID + 0`, which
+    SQLite cannot look up through an index, so it drives the query some other way.
+    """
+    criteria = []
+    if category_ids is not None:
+        category = article.Category_ID if index_category else article.Category_ID + 0
+        criteria.append(category == category_ids[0] if len(category_ids) == 1 else category.in_(category_ids))
+    if since is not None:
+        criteria.append(article.Published_At >= since)
+    if before is not None:
+        criteria.append(article.Published_At < before)
+    return criteria
+
+
+def _filter_by_category_ids(query, category_ids: List[int]):
+    """Restrict an article query to the given categories using Article.Category_ID alone."""
+    return query.filter(*_article_criteria(Article, category_ids))
+
+
+def _collapse_duplicates(query, category_ids: Optional[List[int]] = None, since: Optional[datetime] = None,
+                         before: Optional[datetime] = None):
+    """
+    Keep one article per near-duplicate cluster among the articles matching the
+    filters: the cluster's lowest Article_ID that matches them, plus articles that
+    have no signature yet. A story whose first article is in another category (or
+    outside the window) is still listed, once.
+
+    The filters must be the query's own, minus its keyset cursor, so a cluster is
+    collapsed the same way on every page. A cluster's first article has no earlier
+    member, so only later members run the NOT EXISTS, which seeks the Cluster_ID
+    index (not the category, which would walk every earlier article in it).
+    """
+    earlier_signature, earlier_article = aliased(ArticleSignature), aliased(Article)
+    earlier_match = (
+        select(earlier_signature.Article_ID)
+        .join(earlier_article, earlier_article.Article_ID == earlier_signature.Article_ID)
+        .where(earlier_signature.Cluster_ID == ArticleSignature.Cluster_ID,
+               earlier_signature.Article_ID < Article.Article_ID,
+               *_article_criteria(earlier_article, category_ids, since, before, index_category=False))
+        .exists()
+    )
+    return query.outerjoin(ArticleSignature, ArticleSignature.Article_ID == Article.Article_ID).filter(
+        or_(ArticleSignature.Cluster_ID.is_(None), ArticleSignature.Cluster_ID == Article.Article_ID, ~earlier_match)
+    )
+
+
+def _with_categories(articles):
+    """Pair each Article with its category from the category cache."""
+    for article in articles:
+        yield article, category_cache.get(article.Category_ID)
+
+
+def _filter_by_published_at(query, since: Optional[datetime] = None, before: Optional[datetime] = None):
+    """Restrict an article query to articles published at or after `since` and before `before`."""
+    return query.filter(*_article_criteria(Article, since=since, before=before))
+
+
+def _article_query(category_name: Optional[str] = None, after: Optional[int] = None,
+                   fields: Tuple[str, ...] = DEFAULT_ARTICLE_FIELDS, collapse: bool = False,
+                   since: Optional[datetime] = None, before: Optional[datetime] = None):
+    """
+    Build the Article query shared by the article listings, ordered by Article_ID.
+
+    Category names are resolved through the category cache, so the query filters on
+    Article.Category_ID and never joins the category table.
+
+    Args:
+        category_name (str, optional): Category name to filter articles (case-insensitive, partial match)
+        after (int, optional): Only return articles with a greater Article_ID (keyset cursor).
+        fields (tuple): Article fields to load; other columns are not selected.
+        collapse (bool): Return only one article per near-duplicate cluster.
+        since (datetime, optional): Only return articles published at or after this time (UTC).
+        before (datetime, optional): Only return articles published before this time (UTC).
+
+    Returns:
+        The query, or None if no category matches `category_name`.
     """
-    Retrieve articles with their associated category details up to the specified limit.
+    query = Article.query.options(*_article_load_options(fields))
+
+    category_ids = None
+    if category_name is not None:
+        category_ids = resolve_category_ids(category_name)
+        if not category_ids:
+            return None
+        query = _filter_by_category_ids(query, category_ids)
+
+    if collapse:
+        query = _collapse_duplicates(query, category_ids, since, before)
+
+    if after is not None:
+        query = query.filter(Article.Article_ID > after)
+
+    return _filter_by_published_at(query, since, before).order_by(Article.Article_ID)
+
+
+def get_all_articles(limit: int = 250, after: Optional[int] = None,
+                     fields: Optional[List[str]] = None, collapse: bool = False,
+                     since: Optional[datetime] = None, before: Optional[datetime] = None) -> List[tuple]:
+    """
+    Retrieve articles with their associated category details up to the specified limit,
+    ordered by Article_ID.
     
     Args:
         limit (int): Maximum number of articles to retrieve.
+        after (int, optional): Only return articles with a greater Article_ID (keyset cursor).
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+        collapse (bool): Return only one article per near-duplicate cluster.
+        since (datetime, optional): Only return articles published at or after this time (UTC).
+        before (datetime, optional): Only return articles published before this time (UTC).
     
     Returns:
         List[tuple]: A list of tuples containing Article and Category objects
     """
-    return (
-        db.session.query(Article, Category)
-        .join(Category, Article.Category_ID == Category.Category_ID)
-        .limit(limit)
-        .all()
-    )
+    query = _article_query(after=after, fields=validate_article_fields(fields), collapse=collapse,
+                           since=since, before=before)
+    return list(_with_categories(query.limit(limit)))
 
-def get_articles_by_category_name(category_name: Optional[str] = None, limit: int = 250) -> List[tuple]:
+def get_articles_by_category_name(category_name: Optional[str] = None, limit: int = 250,
+                                  after: Optional[int] = None,
+                                  fields: Optional[List[str]] = None,
+                                  collapse: bool = False, since: Optional[datetime] = None,
+                                  before: Optional[datetime] = None) -> List[tuple]:
     """
     Retrieve articles with their associated category details, filtered by category name.
     Supports case-insensitive and partial word matching.
@@ -172,81 +564,600 @@ def get_articles_by_category_name(category_name: Optional[str] = None, limit: in
     Args:
         category_name (str, optional): Category name to filter articles (case-insensitive, partial match)
         limit (int): Maximum number of Article objects to retrieve.
+        after (int, optional): Only return articles with a greater Article_ID (keyset cursor).
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+        collapse (bool): Return only one article per near-duplicate cluster.
+        since (datetime, optional): Only return articles published at or after this time (UTC).
+        before (datetime, optional): Only return articles published before this time (UTC).
    
     Returns:
         List[tuple]: A list of tuples containing Article and Category objects
     """
+    query = _article_query(category_name, after, validate_article_fields(fields), collapse, since, before)
+    if query is None:
+        return []
+    return list(_with_categories(query.limit(limit)))
+
+
+def stream_articles(category_name: Optional[str] = None, limit: int = 250,
+                    after: Optional[int] = None, fields: Optional[List[str]] = None,
+                    collapse: bool = False, batch_size: int = STREAM_BATCH_SIZE,
+                    since: Optional[datetime] = None, before: Optional[datetime] = None):
+    """
+    Iterate over articles lazily instead of loading the whole result.
+
+    Takes the same filters as get_articles_by_category_name, but rows are fetched
+    from the database `batch_size` at a time as the caller consumes them, so memory
+    stays flat whatever the limit is. Must be consumed inside the app context.
+
+    Returns:
+        Iterator[tuple]: An iterator of tuples containing Article and Category objects
+    """
+    query = _article_query(category_name, after, validate_article_fields(fields), collapse, since, before)
+    if query is None:
+        return iter(())
+    return _with_categories(query.limit(limit).yield_per(batch_size))
+
+
+def _category_articles_desc_query(category_id: int, before: Optional[int] = None,
+                                  fields: Tuple[str, ...] = DEFAULT_ARTICLE_FIELDS, collapse: bool = False,
+                                  collapse_category_ids: Optional[List[int]] = None):
+    """
+    One category's articles, newest Article_ID first. Clusters are collapsed over
+    `collapse_category_ids` (default: this category), so a feed merging several
+    categories lists a story shared between them once.
+    """
     query = (
-        db.session.query(Article, Category)
-        .join(Category, Article.Category_ID == Category.Category_ID)
+        Article.query
+        .options(*_article_load_options(fields))
+        .filter(Article.Category_ID == category_id)
     )
-   
+    if collapse:
+        query = _collapse_duplicates(query, collapse_category_ids or [category_id])
+    if before is not None:
+        query = query.filter(Article.Article_ID < before)
+    return query.order_by(Article.Article_ID.desc())
+
+
+def _category_article_stream(category: CachedCategory, batch_size: int, before: Optional[int] = None,
+                             fields: Tuple[str, ...] = DEFAULT_ARTICLE_FIELDS, collapse: bool = False,
+                             collapse_category_ids: Optional[List[int]] = None):
+    """
+    Yield (Article, Category) tuples for one category, newest Article_ID first.
+
+    Rows are read in batches through the Category_ID index, seeking below the last
+    Article_ID seen, so a stream only touches as many rows as its consumer pulls.
+    """
+    while True:
+        query = _category_articles_desc_query(category.Category_ID, before, fields, collapse, collapse_category_ids)
+        batch = query.limit(batch_size).all()
+
+        for article in batch:
+            yield article, category
+
+        if len(batch) < batch_size:
+            return
+        before = batch[-1].Article_ID
+
+
+def get_user_feed(user_id: str, limit: int = 50, before: Optional[int] = None,
+                  fields: Optional[List[str]] = None, collapse: bool = False) -> Optional[List[tuple]]:
+    """
+    Build a personalized feed from the categories a user has selected.
+
+    The user's categories are read once, then one newest-first article stream per
+    category is k-way merged, so only the top `limit` rows of each category are
+    ever read instead of every article in them.
+
+    Args:
+        user_id (str): The user's ID in format XX-XXXXXXX
+        limit (int): Maximum number of articles to retrieve.
+        before (int, optional): Only return articles with a lower Article_ID
+            (the next_cursor of the previous page).
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+        collapse (bool): Return only one article per near-duplicate cluster.
+
+    Returns:
+        Optional[List[tuple]]: A list of tuples containing Article and Category objects,
+        newest first, or None if the user does not exist.
+    """
+    if not user_id or not isinstance(user_id, str) or not re.match(r'^\d{2}-\d{7}$', user_id):
+        raise ValueError('Invalid user ID format. Must be XX-XXXXXXX')
+    fields = validate_article_fields(fields)
+
+    preferences = UserPreference.query.filter_by(User_ID=user_id).with_entities(
+        UserPreference.Category_ID
+    ).all()
+    categories = [category for category in (category_cache.get(pref[0]) for pref in preferences) if category]
+
+    if not categories:
+        if not User.query.filter_by(User_ID=user_id).first():
+            return None
+        return []
+
+    category_ids = [category.Category_ID for category in categories]
+    streams = [_category_article_stream(category, limit, before, fields, collapse, category_ids)
+               for category in categories]
+    merged = heapq.merge(*streams, key=lambda row: row[0].Article_ID, reverse=True)
+    return list(islice(merged, limit))
+
+
+# Default page size of the latest-articles listing
+DEFAULT_LATEST_LIMIT = 20
+# Default fields of the latest-articles listing: all of them are kept in memory
+DEFAULT_LATEST_FIELDS = ("Article_ID", "Title", "Snippet", "URL", "Authors", "Category", "Published_At")
+
+
+def _latest_category_query(category_id: int, fields: Tuple[str, ...], since: Optional[datetime] = None,
+                           before: Optional[datetime] = None, after: Optional[Tuple[datetime, int]] = None):
+    """One category's articles, newest first, read in order off ix_article_Category_ID_Published_At."""
+    query = _filter_by_published_at(
+        Article.query.options(*_article_load_options(fields)).filter(Article.Category_ID == category_id),
+        since, before,
+    )
+    if after is not None:
+        query = query.filter(tuple_(Article.Published_At, Article.Article_ID) < tuple_(*after))
+    return query.order_by(Article.Published_At.desc(), Article.Article_ID.desc())
+
+
+def get_latest_articles(category_name: Optional[str] = None, limit: int = DEFAULT_LATEST_LIMIT,
+                        fields: Optional[List[str]] = None, since: Optional[datetime] = None,
+                        before: Optional[datetime] = None,
+                        after: Optional[Tuple[datetime, int]] = None) -> List[tuple]:
+    """
+    Retrieve the most recently published articles, newest first.
+
+    Pages the in-memory latest-articles buffers can answer (listing fields only, and
+    no deeper than the buffers reach) are served without touching the database.
+    Otherwise each category is read newest-first through its Published_At index and
+    the streams are k-way merged, as in get_user_feed.
+
+    Args:
+        category_name (str, optional): Category name to filter articles (case-insensitive, partial match)
+        limit (int): Maximum number of articles to retrieve.
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+        since (datetime, optional): Only return articles published at or after this time (UTC).
+        before (datetime, optional): Only return articles published before this time (UTC).
+        after (Tuple[datetime, int], optional): Only return articles older than this
+            (Published_At, Article_ID) position (keyset cursor).
+
+    Returns:
+        List[tuple]: A list of tuples containing Article (or LatestArticle) and Category objects.
+    """
+    limit = _positive_limit(limit)
+    fields = validate_article_fields(fields) if fields else DEFAULT_LATEST_FIELDS
+    if category_name is None:
+        category_ids = [category.Category_ID for category in category_cache.all()]
+    else:
+        category_ids = resolve_category_ids(category_name)
+    if not category_ids:
+        return []
+
+    if LATEST_FIELDS.issuperset(fields):
+        cached = latest_articles.latest(category_ids, limit, since, before, after)
+        if cached is not None:
+            return list(_with_categories(cached))
+
+    streams = [_with_categories(_latest_category_query(category_id, fields, since, before, after).limit(limit))
+               for category_id in category_ids]
+    merged = heapq.merge(*streams, key=lambda row: recency_key(row[0]), reverse=True)
+    return list(islice(merged, limit))
+
+# Maximum number of articles accepted by one batch ingest call
+MAX_BATCH_ARTICLES = 500
+
+
+def _validate_article(item) -> Optional[str]:
+    """Return why an incoming article is invalid, or None if it can be stored."""
+    if not isinstance(item, dict):
+        return 'Article must be an object'
+    for field in ('Title', 'Content'):
+        if not item.get(field) or not isinstance(item.get(field), str):
+            return f'{field} is required and must be a string'
+    for field in ('URL', 'Authors'):
+        if item.get(field) is not None and not isinstance(item.get(field), str):
+            return f'{field} must be a string'
+    if item.get('URL'):
+        # urlsplit rejects some malformed URLs (e.g. a port out of range) only when normalizing
+        try:
+            normalize_url(item['URL'])
+        except ValueError as e:
+            return f'URL: {e}'
+    if item.get('Published_At') is not None:
+        try:
+            parse_timestamp(item['Published_At'])
+        except ValueError as e:
+            return f'Published_At: {e}'
+    if category_cache.get(item.get('Category_ID')) is None:
+        return f'Invalid Category_ID: {item.get("Category_ID")}'
+    return None
+
+
+def create_articles_batch(articles: List[dict]) -> List[dict]:
+    """
+    Store a batch of articles in one transaction, skipping ones already stored.
+
+    An article is a duplicate when its normalized URL hash or its content hash matches
+    an article already in the database or earlier in the batch. Existing hashes are
+    looked up with one query for the whole batch and new articles are inserted with
+    one executemany, so re-delivered feeds cost neither a query per article nor
+    extra rows. Stored articles also get their MinHash signature and near-duplicate
+    cluster in the same transaction.
+
+    Args:
+        articles (List[dict]): Items with 'Title', 'Content' and 'Category_ID', and
+            optionally 'URL', 'Authors' and 'Published_At' (ISO 8601; defaults to now).
+
+    Returns:
+        List[dict]: One result per input item, in input order, with 'index', 'status'
+        ('created', 'duplicate' or 'invalid') and 'Article_ID' or 'error'.
+    """
+    if len(articles) > MAX_BATCH_ARTICLES:
+        raise ValueError(f'A batch may contain at most {MAX_BATCH_ARTICLES} articles')
+
+    results = [None] * len(articles)
+    pending = []
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for index, item in enumerate(articles):
+        error = _validate_article(item)
+        if error:
+            results[index] = {"index": index, "status": "invalid", "error": error}
+            continue
+        pending.append((index, item, url_hash(item['URL']) if item.get('URL') else None,
+                        content_hash(item['Content'])))
+
+    url_hashes = {hashed_url for _, _, hashed_url, _ in pending if hashed_url}
+    content_hashes = {hashed_content for _, _, _, hashed_content in pending}
+
+    try:
+        # One query finds every stored article sharing a URL or content hash with the batch
+        existing_urls, existing_contents = {}, {}
+        if pending:
+            stored = db.session.query(Article.Article_ID, Article.URL_Hash, Article.Content_Hash).filter(
+                or_(Article.URL_Hash.in_(url_hashes), Article.Content_Hash.in_(content_hashes))
+            )
+            for article_id, hashed_url, hashed_content in stored:
+                existing_urls.setdefault(hashed_url, article_id)
+                existing_contents.setdefault(hashed_content, article_id)
+
+        new_rows = []
+        # hash -> input index of the first new article in this batch carrying it
+        batch_urls, batch_contents = {}, {}
+        for index, item, hashed_url, hashed_content in pending:
+            if hashed_url and hashed_url in existing_urls:
+                results[index] = {"index": index, "status": "duplicate", "reason": "url",
+                                  "Article_ID": existing_urls[hashed_url]}
+            elif hashed_content in existing_contents:
+                results[index] = {"index": index, "status": "duplicate", "reason": "content",
+                                  "Article_ID": existing_contents[hashed_content]}
+            elif hashed_url and hashed_url in batch_urls:
+                results[index] = {"index": index, "status": "duplicate", "reason": "url",
+                                  "duplicate_of": batch_urls[hashed_url]}
+            elif hashed_content in batch_contents:
+                results[index] = {"index": index, "status": "duplicate", "reason": "content",
+                                  "duplicate_of": batch_contents[hashed_content]}
+            else:
+                if hashed_url:
+                    batch_urls[hashed_url] = index
+                batch_contents[hashed_content] = index
+                new_rows.append((index, {
+                    "Title": item['Title'],
+                    "Content": item['Content'],
+                    "Category_ID": category_cache.get(item['Category_ID']).Category_ID,
+                    "URL": item.get('URL'),
+                    "Authors": item.get('Authors'),
+                    "URL_Hash": hashed_url,
+                    "Content_Hash": hashed_content,
+                    "Published_At": parse_timestamp(item['Published_At']) if item.get('Published_At') else now
+                }))
+
+        new_ids = []
+        if new_rows:
+            new_ids = db.session.execute(
+                insert(Article).returning(Article.Article_ID, sort_by_parameter_order=True),
+                [row for _, row in new_rows]
+            ).scalars().all()
+
+            signatures = [(article_id, near_duplicates.minhash_signature(row["Title"], row["Content"]))
+                          for (_, row), article_id in zip(new_rows, new_ids)]
+            db.session.execute(insert(ArticleSignature), near_duplicates.signature_rows(signatures))
+            record_new_articles(
+                LatestArticle(article_id, row["Title"], row["Content"][:SNIPPET_LENGTH], row["URL"],
+                              row["Authors"], row["Category_ID"], row["Published_At"])
+                for (_, row), article_id in zip(new_rows, new_ids)
+            )
+            touch(ARTICLES)
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+    for (index, _), article_id in zip(new_rows, new_ids):
+        results[index] = {"index": index, "status": "created", "Article_ID": article_id}
+
+    # Point duplicates within the batch at the article stored for them
+    for result in results:
+        if "duplicate_of" in result:
+            result["Article_ID"] = results[result.pop("duplicate_of")]["Article_ID"]
+    return results
+
+def get_duplicate_cluster(article_id: int, fields: Optional[List[str]] = None) -> Optional[Tuple[int, List[tuple]]]:
+    """
+    Retrieve every article in the near-duplicate cluster of an article.
+
+    Args:
+        article_id (int): Any article of the cluster.
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+
+    Returns:
+        Optional[Tuple[int, List[tuple]]]: The Cluster_ID and the cluster's (Article, Category)
+        tuples ordered by Article_ID, or None if the article does not exist.
+    """
+    cluster_id = near_duplicates.cluster_of(article_id)
+    if cluster_id is None:
+        if not db.session.query(Article.Article_ID).filter_by(Article_ID=article_id).first():
+            return None
+        cluster_id = article_id
+
+    query = (
+        Article.query
+        .options(*_article_load_options(validate_article_fields(fields)))
+        .join(ArticleSignature, ArticleSignature.Article_ID == Article.Article_ID)
+        .filter(ArticleSignature.Cluster_ID == cluster_id)
+        .order_by(Article.Article_ID)
+    )
+    members = list(_with_categories(query))
+    if not members:
+        # The article has no signature yet: it is its own cluster
+        members = list(_with_categories(
+            Article.query.options(*_article_load_options(validate_article_fields(fields)))
+            .filter_by(Article_ID=article_id)
+        ))
+    return cluster_id, members
+
+# ---------------------------------------------------------
+# Search Functions
+# ---------------------------------------------------------
+
+# FTS5 index over article Title/Content. It is an external-content table, so it
+# stores only the index and reads text from `article`; the triggers keep it in
+# sync with every insert, update and delete, whatever path writes the article.
+ARTICLE_SEARCH_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS article_fts USING fts5(
+        Title, Content, content='article', content_rowid='Article_ID', tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS article_fts_insert AFTER INSERT ON article BEGIN
+        INSERT INTO article_fts(rowid, Title, Content) VALUES (new.Article_ID, new.Title, new.Content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS article_fts_delete AFTER DELETE ON article BEGIN
+        INSERT INTO article_fts(article_fts, rowid, Title, Content)
+        VALUES ('delete', old.Article_ID, old.Title, old.Content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS article_fts_update AFTER UPDATE OF Title, Content ON article BEGIN
+        INSERT INTO article_fts(article_fts, rowid, Title, Content)
+        VALUES ('delete', old.Article_ID, old.Title, old.Content);
+        INSERT INTO article_fts(rowid, Title, Content) VALUES (new.Article_ID, new.Title, new.Content);
+    END""",
+)
+
+# BM25 column weights: a match in the title counts for more than one in the body
+SEARCH_TITLE_WEIGHT = 10.0
+SEARCH_CONTENT_WEIGHT = 1.0
+
+article_fts = table('article_fts', column('rowid'))
+
+
+def init_article_search() -> bool:
+    """
+    Create the article full-text index and its sync triggers if they do not exist yet,
+    and build the index from the existing articles the first time.
+
+    Returns:
+        bool: True if the index was created by this call.
+    """
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'article_fts'")
+    ).first()
+
+    try:
+        for statement in ARTICLE_SEARCH_DDL:
+            db.session.execute(text(statement))
+        if not exists:
+            db.session.execute(text("INSERT INTO article_fts(article_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+    return not exists
+
+
+def _fts_match_query(query: str) -> str:
+    """
+    Turn free text into an FTS5 query that matches every word.
+
+    Each word is quoted so FTS5 operators and punctuation in user input cannot cause
+    syntax errors; a trailing '*' on a word is kept as a prefix match.
+    """
+    terms = [f'"{word}"{star}' for word, star in re.findall(r'(\w+)(\*?)', query)]
+    if not terms:
+        raise ValueError('Search query must contain at least one word')
+    return ' '.join(terms)
+
+
+def search_articles(query: str, category_name: Optional[str] = None, limit: int = 25,
+                    after: Optional[Tuple[float, int]] = None,
+                    fields: Optional[List[str]] = None) -> List[tuple]:
+    """
+    Full-text search over article titles and content, best matches first.
+
+    Matching goes through the FTS5 index and is ranked by BM25, so only matching
+    articles are read instead of scanning the article table with LIKE.
+
+    Args:
+        query (str): Words to search for; all of them must match.
+        category_name (str, optional): Category name to filter articles (case-insensitive, partial match)
+        limit (int): Maximum number of articles to retrieve.
+        after (Tuple[float, int], optional): (score, Article_ID) of the last result of the
+            previous page (keyset cursor).
+        fields (List[str], optional): Article fields to load (see ARTICLE_FIELDS).
+
+    Returns:
+        List[tuple]: A list of (Article, Category, score) tuples; lower scores rank higher.
+    """
+    match_query = _fts_match_query(query)
+    fields = validate_article_fields(fields)
+    score = func.bm25(literal_column('article_fts'), SEARCH_TITLE_WEIGHT, SEARCH_CONTENT_WEIGHT)
+
+    search = (
+        db.session.query(Article, score.label('score'))
+        .select_from(article_fts)
+        .join(Article, Article.Article_ID == article_fts.c.rowid)
+        .options(*_article_load_options(fields))
+        .filter(literal_column('article_fts').op('MATCH')(match_query))
+    )
+
     if category_name is not None:
-        query = query.filter(Category.Category.ilike(f'%{category_name}%'))
-   
-    return query.limit(limit).all()
+        category_ids = resolve_category_ids(category_name)
+        if not category_ids:
+            return []
+        search = _filter_by_category_ids(search, category_ids)
+
+    if after is not None:
+        after_score, after_id = after
+        search = search.filter(or_(
+            score > after_score,
+            and_(score == after_score, Article.Article_ID > after_id)
+        ))
+
+    results = search.order_by(score, Article.Article_ID).limit(limit).all()
+    return [(article, category_cache.get(article.Category_ID), row_score) for article, row_score in results]
 
 # ---------------------------------------------------------
 # User Preference Functions
 # ---------------------------------------------------------
 
-def get_all_user_preferences(limit: int = None, name: str = None) -> List[dict]:
+# Users per /user_preferences page when no limit is given, and the largest page allowed
+DEFAULT_PREFERENCES_PAGE_SIZE = 100
+MAX_PREFERENCES_PAGE_SIZE = 1000
+
+
+def _user_preference_rows(limit: int, name: Optional[str] = None, after: Optional[str] = None):
+    """
+    Yield (User_ID, Name, [Category_ID, ...]) for one page of users that have preferences.
+
+    The page of users and their preferences are read with a single query of plain
+    columns: the users are picked by a subquery (filtered, ordered by User_ID and
+    limited) that is joined to user_preference, and consecutive rows of the same
+    user are grouped as they arrive. Category IDs are returned as integers.
+    """
+    page = db.session.query(User.User_ID, User.Name).filter(User.preferences.any())
+    if name:
+        page = page.filter(_name_contains(name))
+    if after is not None:
+        page = page.filter(User.User_ID > after)
+    page = page.order_by(User.User_ID).limit(limit).subquery()
+
+    rows = (
+        db.session.query(page.c.User_ID, page.c.Name, UserPreference.Category_ID)
+        .join(UserPreference, UserPreference.User_ID == page.c.User_ID)
+        .order_by(page.c.User_ID, UserPreference.Category_ID)
+    )
+    for (user_id, user_name), user_rows in groupby(rows, key=lambda row: (row[0], row[1])):
+        yield user_id, user_name, [int(row[2]) for row in user_rows]
+
+
+def preferences_page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PREFERENCES_PAGE_SIZE
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PREFERENCES_PAGE_SIZE)
+
+
+def get_all_user_preferences(limit: int = None, name: str = None, after: Optional[str] = None) -> List[dict]:
     """
-    Retrieve consolidated user preferences from the database with optional filters.
+    Retrieve consolidated user preferences from the database with optional filters,
+    ordered by User_ID. Only users with at least one preference are returned.
    
     Args:
-        limit (int): Maximum number of users to retrieve preferences for.
+        limit (int): Maximum number of users to retrieve preferences for
+            (default DEFAULT_PREFERENCES_PAGE_SIZE, at most MAX_PREFERENCES_PAGE_SIZE).
         name (str): Filter users by name (case-insensitive partial match)
+        after (str, optional): Only return users with a greater User_ID (keyset cursor).
     Returns:
         List[dict]: A list of dictionaries containing user information and their preferences.
     """
-    # First, get the filtered user IDs if name is provided
-    user_query = db.session.query(User.User_ID)
-    if name:
-        user_query = user_query.filter(User.Name.ilike(f'%{name}%'))
-    if limit:
-        user_query = user_query.limit(limit)
-    filtered_user_ids = user_query.all()
-    
-    # If name filter is applied and no users found, return empty list
-    if name and not filtered_user_ids:
-        return []
-    
-    # Get preferences for filtered users
-    query = db.session.query(
-        UserPreference,
-        Category.Category,
-        User.Name
-    ).join(
-        Category,
-        UserPreference.Category_ID == Category.Category_ID
-    ).join(
-        User,
-        UserPreference.User_ID == User.User_ID
-    )
-    
-    if filtered_user_ids:
-        user_ids = [uid[0] for uid in filtered_user_ids]
-        query = query.filter(UserPreference.User_ID.in_(user_ids))
-
-    results = query.all()
-    
-    # Group preferences by user
-    user_preferences = {}
-    for pref, category, user_name in results:
-        if pref.User_ID not in user_preferences:
-            user_preferences[pref.User_ID] = {
-                "User_ID": pref.User_ID,
-                "Name": user_name,
-                "Preferences": []
-            }
-        
-        user_preferences[pref.User_ID]["Preferences"].append({
-            "Category_ID": pref.Category_ID,
-            "Category": category
+    results = []
+    for user_id, user_name, category_ids in _user_preference_rows(preferences_page_size(limit), name, after):
+        categories = [category_cache.get(category_id) for category_id in category_ids]
+        results.append({
+            "User_ID": user_id,
+            "Name": user_name,
+            "Preferences": [{
+                "Category_ID": str(category.Category_ID),
+                "Category": category.Category
+            } for category in categories if category is not None]
         })
-    
-    return list(user_preferences.values())
+    return results
+
+
+AUDIENCE_MATCH_MODES = ('all', 'any')
+
+
+def get_preference_audience(category_names: List[str], match: str = 'all', limit: int = None,
+                            after: Optional[str] = None) -> Tuple[List[CachedCategory], int, List[str]]:
+    """
+    Size an audience: the users whose preferences include all (or any) of some
+    categories, answered from the in-memory preference bitmask index.
+
+    Args:
+        category_names (List[str]): Exact category names (case-insensitive).
+        match (str): 'all' to require every category, 'any' for at least one.
+        limit (int): Maximum number of User_IDs to return
+            (default DEFAULT_PREFERENCES_PAGE_SIZE, at most MAX_PREFERENCES_PAGE_SIZE).
+        after (str, optional): Only return users with a greater User_ID (keyset cursor).
+
+    Returns:
+        Tuple[List[CachedCategory], int, List[str]]: The resolved categories, the number
+        of matching users, and one page of their User_IDs in User_ID order.
+    """
+    if match not in AUDIENCE_MATCH_MODES:
+        raise ValueError("match must be 'all' or 'any'")
+    normalized_names = list(dict.fromkeys(normalize_category_name(name) for name in category_names if name.strip()))
+    if not normalized_names:
+        raise ValueError('categories must name at least one category')
+    invalid_names = [name for name in normalized_names if category_cache.id_for_name(name) is None]
+    if invalid_names:
+        raise ValueError(f'Invalid category names: {", ".join(invalid_names)}')
+
+    categories = [category_cache.get(category_cache.id_for_name(name)) for name in normalized_names]
+    total, user_ids = preference_index.audience([category.Category_ID for category in categories],
+                                                match_all=match == 'all', limit=preferences_page_size(limit),
+                                                after=after)
+    return categories, total, user_ids
+
+
+def get_user_preferences_compact(limit: int = None, name: str = None,
+                                 after: Optional[str] = None) -> Tuple[List[dict], Dict[int, str]]:
+    """
+    Same page as get_all_user_preferences, in a compact shape: each user carries only
+    the integer IDs of their categories, and the names are sent once per page.
+
+    Returns:
+        Tuple[List[dict], Dict[int, str]]: The users ({User_ID, Name, Category_IDs}) and
+        the Category_ID -> category name dictionary for the categories on the page.
+    """
+    users, categories = [], {}
+    for user_id, user_name, category_ids in _user_preference_rows(preferences_page_size(limit), name, after):
+        known_ids = []
+        for category_id in category_ids:
+            category = category_cache.get(category_id)
+            if category is not None:
+                categories[category_id] = category.Category
+                known_ids.append(category_id)
+        users.append({"User_ID": user_id, "Name": user_name, "Category_IDs": known_ids})
+    return users, categories
 
 
 def update_user_preferences(user_id: str, category_names: List[str]) -> List[dict]:
@@ -269,22 +1180,19 @@ def update_user_preferences(user_id: str, category_names: List[str]) -> List[dic
     if not user:
         raise ValueError(f'No user found with ID {user_id}')
     
-    # Normalize input category names
-    normalized_names = [name.upper().strip() for name in category_names]
-    
-    # Get categories by names, using uppercase comparison
-    existing_categories = Category.query.filter(
-        Category.Category.in_(normalized_names)
-    ).all()
-    
-    if len(existing_categories) != len(category_names):
-        found_names = {cat.Category for cat in existing_categories}
-        invalid_names = set(normalized_names) - found_names
+    # Normalize input category names and resolve them through the category cache
+    normalized_names = list(dict.fromkeys(normalize_category_name(name) for name in category_names))
+    invalid_names = [name for name in normalized_names if category_cache.id_for_name(name) is None]
+    if invalid_names:
         raise ValueError(f'Invalid category names: {", ".join(invalid_names)}')
+
+    existing_categories = [category_cache.get(category_cache.id_for_name(name)) for name in normalized_names]
     
     try:
-        # Remove existing preferences
-        UserPreference.query.filter_by(User_ID=user_id).delete()
+        # Remove existing preferences, keeping their categories for the stats update
+        old_category_ids = db.session.execute(
+            delete(UserPreference).where(UserPreference.User_ID == user_id).returning(UserPreference.Category_ID)
+        ).scalars().all()
         
         # Create new preferences using category IDs from found categories
         new_preferences = [
@@ -292,28 +1200,23 @@ def update_user_preferences(user_id: str, category_names: List[str]) -> List[dic
             for cat in existing_categories
         ]
         db.session.bulk_save_objects(new_preferences)
+
+        deltas = {int(category_id): -1 for category_id in old_category_ids}
+        for cat in existing_categories:
+            deltas[cat.Category_ID] = deltas.get(cat.Category_ID, 0) + 1
+        _adjust_category_stats(deltas)
+        record_preference_change(user_id, old_category_ids, [cat.Category_ID for cat in existing_categories])
+        touch(USER_PREFERENCES)
         
         # Commit the transaction
         db.session.commit()
         
-        # Get updated preferences with category information
-        results = db.session.query(
-            UserPreference,
-            Category.Category
-        ).join(
-            Category,
-            UserPreference.Category_ID == Category.Category_ID
-        ).filter(
-            UserPreference.User_ID == user_id
-        ).all()
-        
-        if results:
-            return [{
-                "User_ID": pref.User_ID,
-                "Category_ID": pref.Category_ID,
-                "Category": category
-            } for pref, category in results]
-        return []
+        # The new preferences are exactly the resolved categories
+        return [{
+            "User_ID": user_id,
+            "Category_ID": cat.Category_ID,
+            "Category": cat.Category
+        } for cat in existing_categories]
             
     except Exception as e:
         db.session.rollback()
@@ -336,13 +1239,8 @@ def delete_user_preference(user_id: str, category_name: str):
         if not user_id or not isinstance(user_id, str) or not re.match(r'^\d{2}-\d{7}$', user_id):
             raise ValueError('Invalid user ID format. Must be XX-XXXXXXX')
         
-        # Normalize category name
-        normalized_category = category_name.upper().strip()
-        
-        # First find the category by name
-        category = Category.query.filter(
-            Category.Category == normalized_category
-        ).first()
+        # First find the category by name in the category cache
+        category = category_cache.get(category_cache.id_for_name(category_name))
         
         if not category:
             raise ValueError(f'Invalid category name: {category_name}')
@@ -355,6 +1253,11 @@ def delete_user_preference(user_id: str, category_name: str):
         
         if preference:
             db.session.delete(preference)
+            _adjust_category_stats({category.Category_ID: -1})
+            # The user's other categories, for the in-memory preference structures
+            remaining = [row[0] for row in db.session.query(UserPreference.Category_ID).filter_by(User_ID=user_id)]
+            record_preference_change(user_id, remaining + [category.Category_ID], remaining)
+            touch(USER_PREFERENCES)
             db.session.commit()
             return True, category.Category
         return False, category.Category
@@ -363,28 +1266,193 @@ def delete_user_preference(user_id: str, category_name: str):
         db.session.rollback()
         raise e
 
+# ---------------------------------------------------------
+# Category Recommendation Functions
+# ---------------------------------------------------------
+
+def _positive_limit(limit: int) -> int:
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return limit
+
+
+def get_recommended_categories(user_id: str, limit: int = 5) -> Optional[List[Dict]]:
+    """
+    Suggest categories a user has not chosen, from the category co-occurrence matrix:
+    each is scored by the share of users of the user's categories who also chose it,
+    averaged over those categories. Users without preferences get the most popular
+    categories. Costs one indexed read of the user's preferences.
+
+    Args:
+        user_id (str): The user's ID in format XX-XXXXXXX
+        limit (int): Maximum number of categories to return.
+
+    Returns:
+        Optional[List[Dict]]: Categories (Category_ID, Category, Score), best first, or
+        None if the user does not exist.
+    """
+    if not user_id or not isinstance(user_id, str) or not re.match(r'^\d{2}-\d{7}$', user_id):
+        raise ValueError('Invalid user ID format. Must be XX-XXXXXXX')
+    limit = _positive_limit(limit)
+
+    preferences = UserPreference.query.filter_by(User_ID=user_id).with_entities(
+        UserPreference.Category_ID
+    ).all()
+    if not preferences and not User.query.filter_by(User_ID=user_id).first():
+        return None
+
+    results = []
+    for category_id, score in category_cooccurrence.recommend([pref[0] for pref in preferences], limit):
+        category = category_cache.get(category_id)
+        if category is not None:
+            results.append({
+                "Category_ID": category.Category_ID,
+                "Category": category.Category,
+                "Score": round(score, 4)
+            })
+    return results
+
+
+def get_also_liked_categories(category_name: str, limit: int = 10) -> Optional[Dict]:
+    """
+    The categories most often chosen by the users of one category, read from the
+    category co-occurrence matrix without touching the database.
+
+    Args:
+        category_name (str): Exact category name (case-insensitive).
+        limit (int): Maximum number of categories to return.
+
+    Returns:
+        Optional[Dict]: The category (Category_ID, Category, User_Count) and its
+        'also_liked' categories (Category_ID, Category, Users who chose both, Share of
+        the category's users, Lift over the category's overall share), best first;
+        None if the category does not exist.
+    """
+    limit = _positive_limit(limit)
+    category = category_cache.get(category_cache.id_for_name(category_name))
+    if category is None:
+        return None
+
+    user_count, also_liked = category_cooccurrence.also_liked(category.Category_ID, limit) or (0, [])
+    results = []
+    for other_id, users, share, lift in also_liked:
+        other = category_cache.get(other_id)
+        if other is not None:
+            results.append({
+                "Category_ID": other.Category_ID,
+                "Category": other.Category,
+                "Users": users,
+                "Share": round(share, 4),
+                "Lift": round(lift, 4)
+            })
+    return {
+        "Category_ID": category.Category_ID,
+        "Category": category.Category,
+        "User_Count": user_count,
+        "also_liked": results
+    }
+
+# ---------------------------------------------------------
+# Preference Statistics Functions
+# ---------------------------------------------------------
+
+# Recompute category_stats from user_preference. Plain SQL so that the CSV loader,
+# which writes user_preference through sqlite3 directly, can run it as well.
+REBUILD_CATEGORY_STATS_SQL = (
+    'DELETE FROM category_stats',
+    'INSERT INTO category_stats ("Category_ID", "User_Count") '
+    'SELECT CAST("Category_ID" AS INTEGER), COUNT(*) FROM user_preference GROUP BY CAST("Category_ID" AS INTEGER)',
+)
+
+
+def _adjust_category_stats(deltas: Dict[int, int]):
+    """
+    Add per-category user count changes to category_stats in the current
+    transaction, so the counts commit or roll back with the preference rows.
+    """
+    changes = [{"Category_ID": int(category_id), "User_Count": delta}
+               for category_id, delta in deltas.items() if delta]
+    if not changes:
+        return
+    statement = sqlite_insert(CategoryStat)
+    statement = statement.on_conflict_do_update(
+        index_elements=[CategoryStat.Category_ID],
+        set_={"User_Count": CategoryStat.User_Count + statement.excluded.User_Count}
+    )
+    db.session.execute(statement, changes)
+
+
+def verify_category_stats() -> List[Dict]:
+    """
+    Compare category_stats with a full count of user_preference.
+
+    Returns:
+        List[Dict]: One entry per category whose stored count is wrong, with its
+        Category_ID, the Stored count and the Expected count; empty if they agree.
+    """
+    expected = dict(
+        db.session.query(func.cast(UserPreference.Category_ID, db.Integer), func.count())
+        .group_by(func.cast(UserPreference.Category_ID, db.Integer))
+        .all()
+    )
+    stored = dict(db.session.query(CategoryStat.Category_ID, CategoryStat.User_Count).all())
+
+    return [
+        {"Category_ID": category_id, "Stored": stored.get(category_id, 0), "Expected": expected.get(category_id, 0)}
+        for category_id in sorted(expected.keys() | stored.keys())
+        if stored.get(category_id, 0) != expected.get(category_id, 0)
+    ]
+
+
+def rebuild_category_stats(connection=None):
+    """
+    Recompute category_stats from user_preference.
+
+    Args:
+        connection (optional): SQLAlchemy connection to run on (e.g. inside a migration).
+            Defaults to the session's connection, which is committed.
+    """
+    if connection is not None:
+        for statement in REBUILD_CATEGORY_STATS_SQL:
+            connection.exec_driver_sql(statement)
+        return
+
+    try:
+        for statement in REBUILD_CATEGORY_STATS_SQL:
+            db.session.execute(text(statement))
+        touch(USER_PREFERENCES)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+
 def get_user_preference_stats() -> List[Dict]:
     """
     Get count of users for each preference category.
+
+    Counts are read from category_stats, which the preference write paths keep up
+    to date, so this costs one row per category rather than a scan of user_preference.
+
     Returns:
         List[Dict]: List of categories with their user counts
     """
     stats = (
-        db.session.query(
-            Category.Category_ID,
-            Category.Category,
-            func.count(UserPreference.User_ID).label('user_count')
-        )
-        .join(UserPreference, Category.Category_ID == UserPreference.Category_ID)
-        .group_by(Category.Category_ID, Category.Category)
+        db.session.query(CategoryStat.Category_ID, CategoryStat.User_Count)
+        .filter(CategoryStat.User_Count > 0)
+        .order_by(CategoryStat.Category_ID)
         .all()
     )
-    
-    return [
-        {
-            "Category_ID": stat[0],
-            "Category": stat[1],
-            "User_Count": stat[2]
-        }
-        for stat in stats
-    ]
\ No newline at end of file
+
+    # Category names come from the category cache instead of a join
+    results = []
+    for category_id, user_count in stats:
+        category = category_cache.get(category_id)
+        if category is not None:
+            results.append({
+                "Category_ID": category.Category_ID,
+                "Category": category.Category,
+                "User_Count": user_count
+            })
+
+    return results
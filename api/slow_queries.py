@@ -0,0 +1,193 @@
+"""
+Slow-query log, served at /api/debug/slow-queries.
+
+Every SQL statement whose execution time (execute plus fetching its rows) reaches
+the threshold is logged and aggregated by statement shape: the SQL text with
+runs of bound parameters collapsed, so `IN (?, ?, ?)` and a 900-item IN list are
+the same shape. Per shape we keep the count and timings, the service functions
+that ran it (the api/services.py frames on the stack), the parameters of
+its slowest run (redacted to their types, since they may hold emails and
+names) and, captured once when the shape is first seen, its EXPLAIN QUERY PLAN
+output.
+
+Statements are timed by the sqlite3 cursor installed by api.metrics, which
+reports to this log when it is closed. The log and its routes are off unless
+the SLOW_QUERY_LOG config key is set; the threshold is then the
+SLOW_QUERY_THRESHOLD_MS config key (default 100). Everything is kept in memory
+per process.
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_LOG = False
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 100
+# Distinct shapes kept; when full, the shape with the least total time makes room
+MAX_SHAPES = 200
+# Bound parameters kept per sample; longer lists are truncated
+MAX_SAMPLE_PARAMETERS = 20
+
+_PARAMETER_RUN = re.compile(r'\?(?:\s*,\s*\?)+')
+_WHITESPACE = re.compile(r'\s+')
+_API_DIR = os.path.dirname(os.path.abspath(__file__))
+_SERVICES_FILE = os.path.join(_API_DIR, 'services.py')
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace normalized and runs of `?` collapsed to `?, ...`."""
+    return _PARAMETER_RUN.sub('?, ...', _WHITESPACE.sub(' ', statement).strip())
+
+
+def _code_name(code) -> str:
+    """The code object's qualified name (co_qualname, Python 3.11+), or its plain name before 3.11."""
+    return getattr(code, 'co_qualname', code.co_name)
+
+
+def _calling_function() -> str:
+    """
+    The api/services.py functions running the statement, outermost first (e.g.
+    `api.services.get_articles > _with_categories`), or failing that the nearest
+    function in the api package. Only called for slow statements.
+    """
+    services_frames = []
+    nearest_api = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename == _SERVICES_FILE:
+            services_frames.append(_code_name(code))
+        elif (not services_frames and nearest_api is None and code.co_filename.startswith(_API_DIR)
+              and frame.f_globals.get('__name__') not in (__name__, 'api.metrics')):
+            nearest_api = f"{frame.f_globals.get('__name__')}.{_code_name(code)}"
+        frame = frame.f_back
+    if services_frames:
+        return 'api.services.' + ' > '.join(reversed(services_frames))
+    return nearest_api or 'unknown'
+
+
+def _sample_value(value) -> Optional[str]:
+    """A placeholder for a bound value: its type (and size), never the value itself."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str):
+        return f'<str, {len(value)} chars>'
+    return f'<{type(value).__name__}>'
+
+
+def _sample_parameters(parameters):
+    """The first MAX_SAMPLE_PARAMETERS bound parameters, redacted by _sample_value."""
+    if parameters is None:
+        return []
+    if isinstance(parameters, dict):
+        return {name: _sample_value(value) for name, value in list(parameters.items())[:MAX_SAMPLE_PARAMETERS]}
+    return [_sample_value(value) for value in parameters[:MAX_SAMPLE_PARAMETERS]]
+
+
+def _parameter_count(parameters) -> int:
+    return 0 if parameters is None else len(parameters)
+
+
+def explain_statement(connection: sqlite3.Connection, statement: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines of a raw statement, run on a plain (uncounted) cursor."""
+    cursor = sqlite3.Cursor(connection)
+    try:
+        return [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters or ())]
+    except sqlite3.Error as e:
+        return [f'EXPLAIN QUERY PLAN failed: {e}']
+    finally:
+        cursor.close()
+
+
+class SlowQuery:
+    """Everything recorded for one statement shape."""
+    __slots__ = ('shape', 'count', 'total_seconds', 'max_seconds', 'callers', 'slowest_parameters',
+                 'slowest_parameter_count', 'plan')
+
+    def __init__(self, shape: str, plan: List[str]):
+        self.shape = shape
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.callers: Dict[str, int] = {}
+        self.slowest_parameters = []
+        self.slowest_parameter_count = 0
+        self.plan = plan
+
+    def to_dict(self) -> dict:
+        from api.query_plans import is_table_scan
+        return {
+            'statement': self.shape,
+            'count': self.count,
+            'total_ms': round(self.total_seconds * 1000, 3),
+            'mean_ms': round(self.total_seconds * 1000 / self.count, 3),
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'callers': dict(sorted(self.callers.items(), key=lambda item: -item[1])),
+            'slowest_parameters': self.slowest_parameters,
+            'slowest_parameter_count': self.slowest_parameter_count,
+            'plan': self.plan,
+            'table_scan': any(is_table_scan(detail) for detail in self.plan),
+            'temp_b_tree': any('USE TEMP B-TREE' in detail for detail in self.plan),
+        }
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: Optional[float] = DEFAULT_SLOW_QUERY_THRESHOLD_MS):
+        self._lock = threading.Lock()
+        self._queries: Dict[str, SlowQuery] = {}
+        self.threshold_seconds = float('inf')
+        self.configure(threshold_ms)
+
+    def configure(self, threshold_ms: Optional[float]):
+        """Set the threshold in milliseconds; None turns the log off."""
+        self.threshold_seconds = float('inf') if threshold_ms is None else float(threshold_ms) / 1000
+
+    @property
+    def threshold_ms(self) -> Optional[float]:
+        return None if self.threshold_seconds == float('inf') else self.threshold_seconds * 1000
+
+    def record(self, connection: sqlite3.Connection, statement: str, parameters, seconds: float):
+        """Record one slow statement. Called on the thread that ran it, before its cursor closes."""
+        shape = statement_shape(statement)
+        caller = _calling_function()
+        with self._lock:
+            known = shape in self._queries
+        # Explain outside the lock; two threads racing on a new shape both explain it, harmlessly
+        plan = None if known else explain_statement(connection, statement, parameters)
+
+        with self._lock:
+            query = self._queries.get(shape)
+            if query is None:
+                if len(self._queries) >= MAX_SHAPES:
+                    del self._queries[min(self._queries.values(), key=lambda q: q.total_seconds).shape]
+                query = self._queries[shape] = SlowQuery(shape, plan or [])
+            query.count += 1
+            query.total_seconds += seconds
+            query.callers[caller] = query.callers.get(caller, 0) + 1
+            if seconds >= query.max_seconds:
+                query.max_seconds = seconds
+                query.slowest_parameters = _sample_parameters(parameters)
+                query.slowest_parameter_count = _parameter_count(parameters)
+
+        logger.warning('Slow query (%.1f ms) in %s: %s; parameters: %r', seconds * 1000, caller, shape,
+                       _sample_parameters(parameters))
+
+    def top(self, limit: int = 20) -> List[dict]:
+        """The slowest shapes by total time, slowest first."""
+        with self._lock:
+            queries = sorted(self._queries.values(), key=lambda q: q.total_seconds, reverse=True)[:limit]
+            return [query.to_dict() for query in queries]
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+
+
+slow_query_log = SlowQueryLog()
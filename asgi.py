@@ -0,0 +1,311 @@
+"""
+ASGI entry point: serves the same Flask app from an asyncio event loop.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    hypercorn asgi:app
+
+Connections are owned by the event loop, so clients that are slow to send their
+request or read their response, and requests waiting for their turn, cost no
+thread. Only the part that runs Flask (routes, services, DB access) runs on a
+worker thread, from a bounded pool:
+
+- ASGI_WORKER_THREADS: requests running at once (default 16). Keep it within the
+  storage profile's pool_size + max_overflow so no request waits for a connection.
+- ASGI_MAX_PENDING: requests allowed to wait for a worker (default 10000); more
+  are answered 503 at once.
+- ASGI_QUEUE_TIMEOUT: seconds a request may wait for a worker before it is
+  answered 503 (default 30).
+- ASGI_MAX_BODY_SIZE: largest request body accepted, in bytes (default 10 MB).
+
+Each setting is read from the Flask config (create_asgi_app(config)), then from an
+environment variable of the same name. The sync create_app() in run.py is unchanged.
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from run import create_app
+
+DEFAULT_WORKER_THREADS = 16
+DEFAULT_MAX_PENDING = 10000
+DEFAULT_QUEUE_TIMEOUT = 30.0
+DEFAULT_MAX_BODY_SIZE = 10 * 1024 * 1024
+
+# Response chunks buffered between a worker thread and the event loop
+_CHUNK_QUEUE_SIZE = 8
+_END = object()
+
+
+class _Disconnected(Exception):
+    pass
+
+
+def _setting(config, name: str, default, convert):
+    value = config.get(name, os.environ.get(name))
+    return default if value is None else convert(value)
+
+
+class AsgiBridge:
+    """ASGI 3 application running a WSGI app on a bounded thread pool."""
+
+    def __init__(self, wsgi_app, worker_threads: int = DEFAULT_WORKER_THREADS,
+                 max_pending: int = DEFAULT_MAX_PENDING, queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE):
+        self.wsgi_app = wsgi_app
+        self.worker_threads = worker_threads
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.max_body_size = max_body_size
+        self.executor = ThreadPoolExecutor(max_workers=worker_threads, thread_name_prefix='asgi-worker')
+        self.pending = 0
+        # Created lazily: it must belong to the server's event loop
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            # No websocket routes
+            await send({'type': 'websocket.close', 'code': 1000})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Wait off the loop: running workers may need it to relay their last chunks
+                await asyncio.to_thread(self.executor.shutdown, wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # ---------------------------------------------------------
+    # HTTP
+    # ---------------------------------------------------------
+
+    async def _http(self, scope, receive, send):
+        try:
+            body = await self._read_body(receive)
+        except _Disconnected:
+            # The client left mid-upload: never run a handler on a truncated body
+            return
+        if body is None:
+            await self._plain_response(send, 413, b'Request body too large')
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.worker_threads)
+        if self.pending >= self.max_pending:
+            await self._plain_response(send, 503, b'Server busy', retry_after=True)
+            return
+
+        self.pending += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            await self._plain_response(send, 503, b'Server busy', retry_after=True)
+            return
+        finally:
+            self.pending -= 1
+
+        try:
+            await self._run_wsgi(scope, body, receive, send)
+        finally:
+            self._slots.release()
+
+    async def _read_body(self, receive):
+        """
+        The whole request body, or None if it exceeds max_body_size.
+
+        Raises:
+            _Disconnected: If the client disconnects before the body is complete.
+        """
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise _Disconnected()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def _plain_response(self, send, status: int, text: bytes, retry_after: bool = False):
+        headers = [(b'content-type', b'text/plain; charset=utf-8'), (b'content-length', str(len(text)).encode())]
+        if retry_after:
+            headers.append((b'retry-after', b'1'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': text})
+
+    async def _run_wsgi(self, scope, body: bytes, receive, send):
+        """
+        Run the WSGI app on a worker thread and relay its response.
+
+        The whole WSGI call, including iterating a streamed response, stays on one
+        worker thread (Flask's request context must be pushed and popped on the same
+        thread). Chunks are handed to the event loop through a small bounded queue, so
+        a slow client pauses the worker instead of buffering the whole response.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=_CHUNK_QUEUE_SIZE)
+        disconnected = threading.Event()
+        environ = self._environ(scope, body)
+
+        def put(item):
+            if disconnected.is_set():
+                raise _Disconnected()
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def run():
+            response_start = {}
+            started = False
+
+            def emit(data: bytes):
+                nonlocal started
+                if not started:
+                    put(response_start)
+                    started = True
+                if data:
+                    put(bytes(data))
+
+            def start_response(status, headers, exc_info=None):
+                response_start['status'] = int(status.split(' ', 1)[0])
+                response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                             for name, value in headers]
+                return emit
+
+            iterable = self.wsgi_app(environ, start_response)
+            try:
+                for data in iterable:
+                    emit(data)
+                emit(b'')
+            except _Disconnected:
+                pass
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+                if not disconnected.is_set():
+                    put(_END)
+
+        future = loop.run_in_executor(self.executor, run)
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected, chunks))
+        response_started = False
+        try:
+            while True:
+                getter = asyncio.ensure_future(chunks.get())
+                done, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    item = getter.result()
+                elif not chunks.empty():
+                    # The worker has finished; relay what it queued
+                    item = await getter
+                else:
+                    # The worker stopped without an end marker (client gone, or it raised)
+                    getter.cancel()
+                    future.result()
+                    return
+                if item is _END:
+                    if response_started:
+                        await send({'type': 'http.response.body', 'body': b''})
+                    else:
+                        await self._plain_response(send, 500, b'Internal Server Error')
+                    break
+                if disconnected.is_set():
+                    continue
+                if isinstance(item, dict):
+                    await send({'type': 'http.response.start', 'status': item['status'], 'headers': item['headers']})
+                    response_started = True
+                else:
+                    await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+            await future
+        finally:
+            watcher.cancel()
+            if not future.done():
+                # Cancelled, or sending failed: stop the worker instead of leaving it
+                # blocked on the queue, holding a thread of the pool
+                self._release_worker(disconnected, chunks)
+
+    async def _watch_disconnect(self, receive, disconnected: threading.Event, chunks: asyncio.Queue):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                self._release_worker(disconnected, chunks)
+                return
+
+    @staticmethod
+    def _release_worker(disconnected: threading.Event, chunks: asyncio.Queue):
+        """Tell the worker its client is gone, and unblock it if it is waiting for room in the queue."""
+        disconnected.set()
+        while not chunks.empty():
+            chunks.get_nowait()
+
+    @staticmethod
+    def _environ(scope, body: bytes) -> dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]) if server[1] is not None else '',
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                continue
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+
+def create_asgi_app(config=None) -> AsgiBridge:
+    """
+    Create the API app (see run.create_app) wrapped for ASGI servers.
+
+    Args:
+        config (dict, optional): Config overrides passed to create_app, including the
+            ASGI_* settings described in this module's docstring.
+    """
+    flask_app = create_app(config)
+    return AsgiBridge(
+        flask_app,
+        worker_threads=_setting(flask_app.config, 'ASGI_WORKER_THREADS', DEFAULT_WORKER_THREADS, int),
+        max_pending=_setting(flask_app.config, 'ASGI_MAX_PENDING', DEFAULT_MAX_PENDING, int),
+        queue_timeout=_setting(flask_app.config, 'ASGI_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT, float),
+        max_body_size=_setting(flask_app.config, 'ASGI_MAX_BODY_SIZE', DEFAULT_MAX_BODY_SIZE, int),
+    )
+
+
+def __getattr__(name):
+    # `asgi:app` is created on first access, so importing this module (e.g. for
+    # AsgiBridge) does not open the default database
+    if name == 'app':
+        global app
+        app = create_asgi_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,6 +6,9 @@ from api.routes import api_bp
 from pathlib import Path
 from flask_sqlalchemy import SQLAlchemy
 from api.models import db, User, Article, Category, UserPreference
+from api.slow_queries import DEFAULT_SLOW_QUERY_LOG, DEFAULT_SLOW_QUERY_THRESHOLD_MS, slow_query_log
+from utility.config import (DEFAULT_DATABASE_PATH, DEFAULT_STORAGE_PROFILE, get_storage_profile,
+                            install_storage_profile)
 
 # Using Blueprints to organize routes in a Flask application
 # https://flask.palletsprojects.com/en/2.0.x/blueprints/
@@ -41,17 +44,39 @@ def create_app():
 
 
 
-def create_app():
+def create_app(config=None):
+   """
+   Create the API app.
+
+   Args:
+      config (dict, optional): Config overrides, e.g. DATABASE_PATH, STORAGE_PROFILE
+         (a name from utility.config.STORAGE_PROFILES or a StorageProfile) or
+         SLOW_QUERY_LOG (True turns the slow-query log and its routes on) and
+         SLOW_QUERY_THRESHOLD_MS.
+   """
    app = Flask(__name__)
-   CORS(app)
+   # Expose the pagination and cache validator headers so browser clients can read them
+   CORS(app, expose_headers=['X-Next-Cursor', 'ETag'])
 
    # Database setup
-   DATABASE_PATH = Path(__file__).parent / "data" / "News_Aggregator.db"
-   app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE_PATH}'
+   app.config['DATABASE_PATH'] = DEFAULT_DATABASE_PATH
+   app.config['STORAGE_PROFILE'] = DEFAULT_STORAGE_PROFILE
+   app.config['SLOW_QUERY_LOG'] = DEFAULT_SLOW_QUERY_LOG
+   app.config['SLOW_QUERY_THRESHOLD_MS'] = DEFAULT_SLOW_QUERY_THRESHOLD_MS
+   app.config.update(config or {})
+   storage_profile = get_storage_profile(app.config['STORAGE_PROFILE'])
+   app.config.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{app.config['DATABASE_PATH']}")
+   app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', storage_profile.engine_options())
    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-   # Initialize SQLAlchemy with the app
+   # Statements slower than this are logged (per process, served at /api/debug/slow-queries);
+   # off unless enabled, since the log and its routes are unauthenticated
+   slow_query_log.configure(app.config['SLOW_QUERY_THRESHOLD_MS'] if app.config['SLOW_QUERY_LOG'] else None)
+
+   # Initialize SQLAlchemy with the app; every pooled connection gets the profile's pragmas
    db.init_app(app)
+   with app.app_context():
+       install_storage_profile(db.engine, storage_profile)
 
    # Import models (after db initialization)
    from api.models import User, Article, Category, UserPreference
@@ -63,6 +88,36 @@ def create_app():
    # Create tables
    with app.app_context():
        db.create_all()
+
+       # Bring existing databases up to the current schema
+       from api.migrations import upgrade
+       upgrade()
+
+       # Full-text search index over articles (kept in sync by triggers)
+       from api.services import init_article_search, init_user_name_search
+       init_article_search()
+
+       # Trigram index for substring search on user names (also kept in sync by triggers)
+       init_user_name_search()
+
+       # Categories are resolved in memory; the cache reloads itself after category writes
+       from api.category_cache import category_cache
+       category_cache.load()
+
+       # Bitmask index of user preferences (audience queries), and the category
+       # co-occurrence matrix behind the category recommendations, built from it
+       from api.preference_index import preference_index
+       from api.category_cooccurrence import category_cooccurrence
+       preference_index.load()
+       category_cooccurrence.load()
+
+       # Newest articles of each category, serving GET /articles/latest from memory
+       from api.latest_articles import latest_articles
+       latest_articles.load()
+
+       # Near-duplicate index: signs articles stored before it existed, then loads the LSH bands
+       from api.near_duplicates import load_index
+       load_index()
        
    return app
 
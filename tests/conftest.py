@@ -0,0 +1,66 @@
+# Shared fixtures: an app on a temporary SQLite database with a few categories
+from contextlib import contextmanager
+
+import pytest
+
+from api.models import db, Category
+from api.category_cache import category_cache
+from api.category_cooccurrence import category_cooccurrence
+from api.latest_articles import latest_articles
+from api.preference_index import preference_index
+from run import create_app
+
+CATEGORIES = {1: "POLITICS", 2: "BUSINESS", 3: "SPORTS", 4: "TECH"}
+
+# Long enough for stable MinHash signatures; variants of it are near-duplicates
+STORY = " ".join(f"word{i}" for i in range(300))
+
+
+def reload_memory_indexes():
+    """Rebuild the per-process structures from the database, as create_app does."""
+    category_cache.load()
+    preference_index.load()
+    category_cooccurrence.load()
+    latest_articles.load()
+
+
+@pytest.fixture
+def app_config():
+    """Config overrides for the `app` fixture; parametrize it to change them."""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app({"DATABASE_PATH": str(tmp_path / "news.db"), **app_config})
+    with app.app_context():
+        db.session.add_all([Category(Category_ID=category_id, Category=name, Description=name.title())
+                            for category_id, name in CATEGORIES.items()])
+        db.session.commit()
+        reload_memory_indexes()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@contextmanager
+def failing_commit():
+    """Within the block, session commits fail, so services roll their transaction back."""
+    def fail():
+        raise RuntimeError("commit failed")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(db.session, "commit", fail)
+        yield
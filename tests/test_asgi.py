@@ -0,0 +1,194 @@
+# Unit tests for the ASGI bridge
+import asyncio
+import threading
+
+from asgi import AsgiBridge
+
+# Long enough to run into the bridge's bounded chunk queue
+CHUNKS = [f"chunk {n}\n".encode() for n in range(50)]
+
+
+def run_async(coroutine, timeout=10):
+    """Run `coroutine` on a fresh event loop in a thread; fail instead of hanging on a deadlock."""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = asyncio.run(coroutine)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the event loop did not finish (deadlock?)"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+class StreamingApp:
+    """A WSGI app streaming CHUNKS, recording its calls, bodies and whether its iterable was closed."""
+
+    def __init__(self):
+        self.bodies = []
+        self.closed = threading.Event()
+
+    def __call__(self, environ, start_response):
+        self.bodies.append(environ["wsgi.input"].read())
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return self.Body(self.closed)
+
+    class Body:
+        def __init__(self, closed):
+            self.closed = closed
+
+        def __iter__(self):
+            return iter(CHUNKS)
+
+        def close(self):
+            self.closed.set()
+
+
+def http_scope(method="GET", path="/"):
+    return {"type": "http", "method": method, "path": path, "query_string": b"", "headers": []}
+
+
+def recorder(sent):
+    """A send callable appending each message to `sent`."""
+    async def send(message):
+        sent.append(message)
+    return send
+
+
+def request_messages(*messages):
+    """A receive callable returning `messages`, then waiting (the client stays connected)."""
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+    return queue.get, queue
+
+
+def test_request_is_relayed_to_the_wsgi_app():
+    wsgi_app = StreamingApp()
+    bridge = AsgiBridge(wsgi_app, worker_threads=2)
+    sent = []
+
+    async def main():
+        receive, _ = request_messages({"type": "http.request", "body": b"he", "more_body": True},
+                                      {"type": "http.request", "body": b"llo"})
+        await bridge(http_scope("POST"), receive, recorder(sent))
+
+    run_async(main())
+    assert wsgi_app.bodies == [b"hello"]
+    assert sent[0]["type"] == "http.response.start" and sent[0]["status"] == 200
+    assert (b"content-type", b"text/plain") in sent[0]["headers"]
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == b"".join(CHUNKS)
+    assert sent[-1] == {"type": "http.response.body", "body": b""}
+    assert wsgi_app.closed.is_set()
+
+
+def test_flask_app_through_the_bridge(app):
+    sent = []
+
+    async def main():
+        receive, _ = request_messages({"type": "http.request", "body": b""})
+        await AsgiBridge(app)(http_scope(path="/api/categories"), receive, recorder(sent))
+
+    run_async(main())
+    assert sent[0]["status"] == 200
+    assert b"POLITICS" in b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def test_client_disconnecting_mid_upload_never_reaches_the_app():
+    wsgi_app = StreamingApp()
+    sent = []
+
+    async def main():
+        receive, _ = request_messages({"type": "http.request", "body": b"partial", "more_body": True},
+                                      {"type": "http.disconnect"})
+        await AsgiBridge(wsgi_app)(http_scope("POST"), receive, recorder(sent))
+
+    run_async(main())
+    assert wsgi_app.bodies == []
+    assert sent == []
+
+
+def test_client_disconnecting_mid_response_stops_the_worker():
+    wsgi_app = StreamingApp()
+    sent = []
+
+    async def main():
+        receive, messages = request_messages({"type": "http.request", "body": b""})
+        first_chunk = asyncio.Event()
+
+        async def send(message):
+            sent.append(message)
+            if message.get("more_body"):
+                first_chunk.set()
+                # A slow client: the worker fills the queue meanwhile
+                await asyncio.sleep(0.05)
+
+        task = asyncio.create_task(AsgiBridge(wsgi_app, worker_threads=1)(http_scope(), receive, send))
+        await first_chunk.wait()
+        messages.put_nowait({"type": "http.disconnect"})
+        await task
+
+    run_async(main())
+    assert wsgi_app.closed.wait(5)
+    assert len(sent) < len(CHUNKS)
+
+
+def test_cancelled_request_releases_its_worker():
+    wsgi_app = StreamingApp()
+    bridge = AsgiBridge(wsgi_app, worker_threads=1)
+
+    async def main():
+        receive, _ = request_messages({"type": "http.request", "body": b""})
+        started = asyncio.Event()
+
+        async def send(message):
+            # A client that never reads: the worker blocks on the full queue
+            started.set()
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(bridge(http_scope(), receive, send))
+        await started.wait()
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # The only worker thread is free again
+        return await asyncio.get_running_loop().run_in_executor(bridge.executor, lambda: "free")
+
+    assert run_async(main()) == "free"
+    assert wsgi_app.closed.wait(5)
+
+
+def test_lifespan_shutdown_waits_for_running_requests_without_blocking_the_loop():
+    wsgi_app = StreamingApp()
+    bridge = AsgiBridge(wsgi_app, worker_threads=1)
+    sent, lifespan_sent = [], []
+
+    async def main():
+        receive, _ = request_messages({"type": "http.request", "body": b""})
+        started = asyncio.Event()
+
+        async def send(message):
+            sent.append(message)
+            started.set()
+            # A slow client, which needs the loop to keep running during shutdown
+            await asyncio.sleep(0.01)
+
+        async def lifespan_send(message):
+            lifespan_sent.append(message["type"])
+
+        lifespan_receive, lifespan_messages = request_messages({"type": "lifespan.startup"})
+        lifespan = asyncio.create_task(bridge({"type": "lifespan"}, lifespan_receive, lifespan_send))
+        request = asyncio.create_task(bridge(http_scope(), receive, send))
+        await started.wait()
+        lifespan_messages.put_nowait({"type": "lifespan.shutdown"})
+        await asyncio.gather(lifespan, request)
+
+    run_async(main())
+    assert lifespan_sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert b"".join(message.get("body", b"") for message in sent[1:]) == b"".join(CHUNKS)
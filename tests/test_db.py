@@ -1 +1,123 @@
 # Unit tests for database operations
+import sqlite3
+from contextlib import closing
+
+from sqlalchemy import text
+
+from api.models import db, User
+from api.resource_versions import resource_versions, touch, ARTICLES, USERS
+
+
+def version_tag(*resources):
+    return resource_versions.state(resources)[0]
+
+
+# ---------------------------------------------------------
+# Resource versions
+# ---------------------------------------------------------
+
+def test_versions_are_bumped_on_commit_only(app_context):
+    users, articles = version_tag(USERS), version_tag(ARTICLES)
+
+    db.session.add(User(User_ID="00-0000001", Name="Rolled Back", Email="rolled-back@example.com"))
+    db.session.flush()
+    touch(USERS)
+    assert version_tag(USERS) == users
+    db.session.rollback()
+    assert version_tag(USERS) == users
+
+    # The rolled-back touch is forgotten, not carried into the next transaction
+    assert User.query.count() == 0
+    db.session.commit()
+    assert version_tag(USERS) == users
+
+    db.session.add(User(User_ID="00-0000002", Name="Committed", Email="committed@example.com"))
+    touch(USERS)
+    db.session.commit()
+    assert version_tag(USERS) != users
+    assert version_tag(ARTICLES) == articles
+
+
+# ---------------------------------------------------------
+# category_stats command
+# ---------------------------------------------------------
+
+def test_category_stats_command_reports_and_rebuilds(app, monkeypatch, capsys):
+    from utility.data import category_stats
+    from api import services
+
+    with app.app_context():
+        user = services.create_user("Counted", "counted@example.com")
+        services.update_user_preferences(user.User_ID, ["BUSINESS"])
+        # A write that bypasses the service layer leaves the counts stale
+        db.session.execute(text("UPDATE category_stats SET User_Count = User_Count + 5 WHERE Category_ID = 2"))
+        db.session.commit()
+
+    database = app.config["DATABASE_PATH"]
+    monkeypatch.setattr("sys.argv", ["category_stats", "--db", database])
+    assert category_stats.main() == 1
+    assert "Category 2: stored 6, expected 1" in capsys.readouterr().out
+
+    monkeypatch.setattr("sys.argv", ["category_stats", "--db", database, "--rebuild"])
+    assert category_stats.main() == 0
+    with app.app_context():
+        assert services.verify_category_stats() == []
+
+
+# ---------------------------------------------------------
+# Migrations
+# ---------------------------------------------------------
+
+# The schema of databases created before migrations existed (user_version 0)
+ORIGINAL_SCHEMA = """
+CREATE TABLE user ("User_ID" VARCHAR(10) PRIMARY KEY, "Name" VARCHAR(100) NOT NULL,
+                   "Email" VARCHAR(120) NOT NULL UNIQUE);
+CREATE TABLE category ("Category_ID" INTEGER PRIMARY KEY, "Category" VARCHAR(100) NOT NULL,
+                       "Description" VARCHAR(100) NOT NULL);
+CREATE TABLE user_preference ("User_ID" VARCHAR REFERENCES user ("User_ID"),
+                              "Category_ID" VARCHAR REFERENCES category ("Category_ID"),
+                              PRIMARY KEY ("User_ID", "Category_ID"));
+CREATE TABLE article ("Article_ID" INTEGER PRIMARY KEY, "Title" VARCHAR(200) NOT NULL, "Content" TEXT NOT NULL,
+                      "Category_ID" INTEGER NOT NULL REFERENCES category ("Category_ID"),
+                      "URL" VARCHAR(500), "Authors" VARCHAR(500));
+"""
+
+
+def test_migration_backfills_article_hashes(tmp_path):
+    from api.migrations import MIGRATIONS
+    from api import services
+    from run import create_app
+    from utility.helpers import content_hash, url_hash
+
+    path = tmp_path / "original.db"
+    with closing(sqlite3.connect(path)) as connection:
+        connection.executescript(ORIGINAL_SCHEMA)
+        connection.execute("INSERT INTO category VALUES (1, 'POLITICS', 'Politics')")
+        connection.executemany("INSERT INTO article VALUES (?, ?, ?, 1, ?, NULL)", [
+            (1, "First", "Body one", "https://example.com/a"),
+            # A historical duplicate of the first URL, once normalized
+            (2, "Second", "Body two", "http://www.example.com/a/?utm_source=feed"),
+            (3, "Third", "Body three", None),
+        ])
+        connection.commit()
+
+    app = create_app({"DATABASE_PATH": str(path)})
+    with app.app_context():
+        rows = db.session.execute(text(
+            'SELECT "Article_ID", "URL_Hash", "Content_Hash" FROM article ORDER BY "Article_ID"')).all()
+        assert [tuple(row) for row in rows] == [
+            (1, url_hash("https://example.com/a"), content_hash("Body one")),
+            (2, None, content_hash("Body two")),
+            (3, None, content_hash("Body three")),
+        ]
+        assert db.session.execute(text("PRAGMA user_version")).scalar() == MIGRATIONS[-1].version
+
+        # Ingest deduplicates against the backfilled hashes
+        results = services.create_articles_batch([
+            {"Title": "Again", "Content": "New body", "Category_ID": 1, "URL": "https://EXAMPLE.com/a"},
+            {"Title": "Again", "Content": "Body  three", "Category_ID": 1},
+        ])
+        assert [(result["status"], result["Article_ID"]) for result in results] == [("duplicate", 1),
+                                                                                     ("duplicate", 3)]
+        db.session.remove()
+        db.engine.dispose()
@@ -1 +1,401 @@
 # Unit tests for API routes
+from urllib.parse import quote
+
+import pytest
+
+from tests.conftest import STORY, failing_commit
+
+
+def post_article(client, title, content, category_id):
+    response = client.post("/api/articles", json={"Title": title, "Content": content, "Category_ID": category_id})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["Article_ID"]
+
+
+def listed_ids(response):
+    assert response.status_code == 200, response.get_json()
+    return [article["Article_ID"] for article in response.get_json()]
+
+
+# ---------------------------------------------------------
+# Near-duplicate collapsing
+# ---------------------------------------------------------
+
+def test_collapsed_category_listing_keeps_stories_headed_elsewhere(client):
+    head = post_article(client, "Story", STORY, 1)
+    copy = post_article(client, "Story", STORY + " extra", 2)
+
+    url = "/api/articles/by-category-name?fields=Article_ID&category=BUSINESS"
+    assert listed_ids(client.get(url)) == [copy]
+    assert listed_ids(client.get(url + "&collapse=1")) == [copy]
+    assert listed_ids(client.get("/api/articles?fields=Article_ID&collapse=1")) == [head]
+
+
+# ---------------------------------------------------------
+# Bulk user creation
+# ---------------------------------------------------------
+
+def test_bulk_user_route_counts_each_result(client):
+    response = client.post("/api/users/bulk", json=[{"Name": "Ann", "Email": "ann@example.com"},
+                                                    {"Name": "Ann Again", "Email": "ann@example.com"},
+                                                    {"Name": "No Email"}])
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert (body["created"], body["failed"]) == (1, 2)
+    assert [result["status"] for result in body["results"]] == ["created", "conflict", "invalid"]
+
+    # The {"users": [...]} form; the stored email now conflicts
+    response = client.post("/api/users/bulk", json={"users": [{"Name": "Ann", "Email": "ann@example.com"}]})
+    assert response.get_json()["results"][0]["error"] == "Email already exists"
+    assert [user["Email"] for user in client.get("/api/users").get_json()] == ["ann@example.com"]
+
+    for data in ([], {"users": []}, {"Name": "Ann", "Email": "ann@example.com"}):
+        assert client.post("/api/users/bulk", json=data).status_code == 400
+
+
+# ---------------------------------------------------------
+# Conditional GET
+# ---------------------------------------------------------
+
+def create_user(client, name, email):
+    response = client.post("/api/users", json={"Name": name, "Email": email})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["User_ID"]
+
+
+def etag_of(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_json()
+    return response.headers["ETag"]
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_unchanged_resource_answers_304(client):
+    etag = etag_of(client, "/api/categories")
+
+    response = revalidate(client, "/api/categories", etag)
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_committed_write_changes_the_etag(client):
+    url = "/api/articles?fields=Article_ID"
+    etag = etag_of(client, url)
+    post_article(client, "Story", STORY, 1)
+
+    response = revalidate(client, url, etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert revalidate(client, url, response.headers["ETag"]).status_code == 304
+
+
+def test_rolled_back_write_keeps_the_etag(client):
+    user_id = create_user(client, "Rolled Back", "rolled-back@example.com")
+    url = "/api/user-preferences/stats"
+    etag = etag_of(client, url)
+
+    with failing_commit():
+        response = client.put(f"/api/user_preferences/{user_id}", json={"categories": ["BUSINESS"]})
+    assert response.status_code == 500
+
+    assert revalidate(client, url, etag).status_code == 304
+    assert client.get(url).get_json() == []
+
+
+def test_deleted_user_is_not_revalidated(client):
+    # A user without preferences: deleting them writes no user_preference rows
+    user_id = create_user(client, "Short Lived", "short-lived@example.com")
+    url = f"/api/users/{user_id}/recommended-categories"
+    etag = etag_of(client, url)
+
+    assert client.delete(f"/api/users/{user_id}").status_code == 200
+    assert revalidate(client, url, etag).status_code == 404
+
+
+# ---------------------------------------------------------
+# Cursor paging
+# ---------------------------------------------------------
+
+def walk_pages(client, url, items=None, key="Article_ID"):
+    """
+    Follow next_cursor (in the body under `items`, or the X-Next-Cursor header for
+    list responses) from the first page to the last, returning every item's `key`.
+    """
+    keys, cursor = [], None
+    while True:
+        response = client.get(f"{url}&cursor={quote(cursor)}" if cursor else url)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        if items is None:
+            page, cursor = body, response.headers.get("X-Next-Cursor")
+        else:
+            page, cursor = body[items], body["next_cursor"]
+        keys.extend(item if key is None else item[key] for item in page)
+        if cursor is None:
+            return keys
+
+
+@pytest.fixture
+def library(client):
+    """Users with preferences, and articles published out of order (with ties) in two categories."""
+    user_ids = [create_user(client, f"Reader {n}", f"reader{n}@example.com") for n in range(5)]
+    sports_ids = user_ids[1::2]
+    for user_id in user_ids:
+        categories = ["BUSINESS", "SPORTS"] if user_id in sports_ids else ["BUSINESS"]
+        assert client.put(f"/api/user_preferences/{user_id}", json={"categories": categories}).status_code == 200
+
+    published = ["2024-03-01T09:00:00Z", "2024-03-02T09:00:00Z", "2024-02-01T09:00:00Z", "2024-03-05T09:00:00Z",
+                 "2024-03-02T09:00:00Z", "2024-03-01T09:00:00Z", "2024-01-15T09:00:00Z"]
+    response = client.post("/api/articles/batch", json={"articles": [
+        {"Title": f"News {n}", "Content": " ".join(f"news{n}x{i}" for i in range(50)),
+         "Category_ID": 2 + n % 2, "Published_At": published_at}
+        for n, published_at in enumerate(published)
+    ]})
+    assert response.status_code == 200, response.get_json()
+    articles = [(result["Article_ID"], 2 + n % 2, published_at)
+                for n, (result, published_at) in enumerate(zip(response.get_json()["results"], published))]
+    return sorted(user_ids), sorted(sports_ids), articles
+
+
+def newest_first(articles, category_id=None):
+    return [article_id for article_id, _, _ in sorted(
+        (article for article in articles if category_id in (None, article[1])),
+        key=lambda article: (article[2], article[0]), reverse=True)]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 8])
+def test_cursor_paging_has_no_gaps_or_duplicates(client, library, limit):
+    user_ids, sports_ids, articles = library
+    article_ids = sorted(article_id for article_id, _, _ in articles)
+    business_ids = [article_id for article_id, category_id, _ in articles if category_id == 2]
+
+    assert walk_pages(client, f"/api/articles?fields=Article_ID&limit={limit}") == article_ids
+    assert walk_pages(client, f"/api/articles?fields=Article_ID&limit={limit}&collapse=1") == article_ids
+    assert walk_pages(client, f"/api/articles/by-category-name?fields=Article_ID&category=BUSINESS"
+                              f"&limit={limit}") == business_ids
+    assert walk_pages(client, f"/api/articles/latest?fields=Article_ID&limit={limit}", "articles") \
+        == newest_first(articles)
+    assert walk_pages(client, f"/api/articles/latest?fields=Article_ID&category=BUSINESS&limit={limit}",
+                      "articles") == newest_first(articles, 2)
+    assert walk_pages(client, f"/api/users/{sports_ids[0]}/feed?fields=Article_ID&limit={limit}", "articles") \
+        == sorted(article_ids, reverse=True)
+
+    assert walk_pages(client, f"/api/users?limit={limit}", key="User_ID") == user_ids
+    assert walk_pages(client, f"/api/user_preferences?limit={limit}", "users", "User_ID") == user_ids
+    assert walk_pages(client, f"/api/user_preferences?limit={limit}&format=compact", "users", "User_ID") \
+        == user_ids
+    assert walk_pages(client, f"/api/user_preferences?categories=SPORTS&limit={limit}", "User_IDs", None) \
+        == sports_ids
+
+
+# ---------------------------------------------------------
+# Article search
+# ---------------------------------------------------------
+
+@pytest.mark.parametrize("limit", [1, 2, 5, 6])
+def test_search_score_cursor_pages_without_gaps_or_duplicates(client, limit):
+    # Equal bodies give equal scores, so paging also has to break ties on Article_ID
+    response = client.post("/api/articles/batch", json={"articles": [
+        {"Title": f"Report {n}", "Content": "rain " * (n % 3 + 1) + f"filler{n} words", "Category_ID": 1 + n % 2}
+        for n in range(6)
+    ]})
+    assert response.status_code == 200, response.get_json()
+
+    url = "/api/articles/search?q=rain&fields=Article_ID"
+    best_first = [article["Article_ID"] for article in client.get(url).get_json()["articles"]]
+    assert len(best_first) == 6
+    assert walk_pages(client, f"{url}&limit={limit}", "articles") == best_first
+    assert walk_pages(client, f"{url}&category=POLITICS&limit={limit}", "articles") \
+        == [article_id for article_id in best_first if article_id % 2]
+
+
+def test_search_rejects_bad_input(client):
+    from utility.helpers import encode_cursor
+
+    assert client.get("/api/articles/search?q=%3F%21").status_code == 400
+    for cursor in (["best", 1], [1.5], [1.5, "1"]):
+        response = client.get(f"/api/articles/search?q=rain&cursor={quote(encode_cursor(cursor))}")
+        assert response.status_code == 400
+        assert response.get_json()["message"] == "Invalid cursor"
+
+
+# ---------------------------------------------------------
+# User name search
+# ---------------------------------------------------------
+
+def found_names(client, query):
+    response = client.get(f"/api/users?{query}")
+    assert response.status_code == 200, response.get_json()
+    return sorted(user["Name"] for user in response.get_json())
+
+
+def test_user_name_search_by_prefix_and_substring(client):
+    for n, name in enumerate(["Smithers Ann", "Bob Blacksmith", "Alice Smithson", "Carol Jones"]):
+        create_user(client, name, f"searched{n}@example.com")
+
+    assert found_names(client, "name=smith") == ["Smithers Ann"]
+    assert found_names(client, "name=smith&starts_with=true") == ["Smithers Ann"]
+    # Substrings of 3 or more characters are answered from the trigram index
+    assert found_names(client, "name=smith&starts_with=false") == ["Alice Smithson", "Bob Blacksmith",
+                                                                     "Smithers Ann"]
+    assert found_names(client, "name=SMITH&starts_with=0") == ["Alice Smithson", "Bob Blacksmith",
+                                                               "Smithers Ann"]
+    # Shorter ones fall back to LIKE
+    assert found_names(client, "name=ne&starts_with=false") == ["Carol Jones"]
+    assert found_names(client, "name=ne") == []
+
+    response = client.get("/api/users?name=smith&starts_with=maybe")
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "starts_with must be true or false"
+
+
+# ---------------------------------------------------------
+# Article ingest
+# ---------------------------------------------------------
+
+def test_batch_route_reports_each_item(client):
+    stored = post_article(client, "Story", STORY, 1)
+    response = client.post("/api/articles/batch", json={"articles": [
+        {"Title": "Bad port", "Content": "Body one", "Category_ID": 1, "URL": "http://x.com:99999/a"},
+        {"Title": "Copy", "Content": STORY, "Category_ID": 2},
+        {"Title": "New", "Content": "Body two", "Category_ID": 2, "URL": "https://example.com/new"},
+    ]})
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert (body["created"], body["duplicates"], body["invalid"]) == (1, 1, 1)
+    assert [result["status"] for result in body["results"]] == ["invalid", "duplicate", "created"]
+    assert body["results"][1]["Article_ID"] == stored
+
+    # A single article with a bad URL is a validation error, not a server error
+    response = client.post("/api/articles", json={"Title": "Bad port", "Content": "Body", "Category_ID": 1,
+                                                  "URL": "http://x.com:99999/a"})
+    assert response.status_code == 400
+    assert response.get_json()["message"].startswith("URL: ")
+
+
+# ---------------------------------------------------------
+# Slow-query log
+# ---------------------------------------------------------
+
+def test_caller_names_fall_back_to_co_name_before_python_3_11():
+    from types import SimpleNamespace
+    from api.slow_queries import _code_name
+
+    assert _code_name(SimpleNamespace(co_name="load")) == "load"
+    assert _code_name(SimpleNamespace(co_name="load", co_qualname="Index.load")) == "Index.load"
+
+
+def test_slow_query_log_is_off_by_default(client):
+    assert client.get("/api/debug/slow-queries").status_code == 404
+
+
+@pytest.mark.parametrize("app_config", [{"SLOW_QUERY_LOG": True, "SLOW_QUERY_THRESHOLD_MS": 0}])
+def test_slow_query_log_records_every_statement_at_0_ms(client):
+    assert client.delete("/api/debug/slow-queries").status_code == 204
+    create_user(client, "Zelda Fitzgerald", "zelda@example.com")
+    assert found_names(client, "name=zeld&starts_with=false") == ["Zelda Fitzgerald"]
+
+    response = client.get("/api/debug/slow-queries?limit=200")
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    assert body["threshold_ms"] == 0
+    # Parameters are redacted to their types
+    assert "zeld" not in response.get_data(as_text=True).lower()
+
+    search = next(query for query in body["queries"] if "user_name_trigram" in query["statement"])
+    assert set(search) == {"statement", "count", "total_ms", "mean_ms", "max_ms", "callers",
+                           "slowest_parameters", "slowest_parameter_count", "plan", "table_scan", "temp_b_tree"}
+    assert search["statement"].endswith('WHERE user_name_trigram."Name" LIKE ?) ORDER BY user."User_ID"')
+    assert search["count"] == 1
+    assert list(search["callers"]) == ["api.services.get_users_by_name"]
+    # The LIKE pattern "%zeld%"
+    assert (search["slowest_parameters"], search["slowest_parameter_count"]) == (["<str, 6 chars>"], 1)
+    assert "SCAN user_name_trigram VIRTUAL TABLE INDEX 0:L0" in search["plan"]
+
+    insert = next(query for query in body["queries"] if query["statement"].startswith("INSERT INTO user "))
+    assert "?, ..." in insert["statement"]
+    assert insert["callers"] == {"api.services.create_user": 1}
+
+
+# ---------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------
+
+def scrape(client):
+    """The /api/metrics samples as {(name, {label: value} items): value}."""
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.content_type == "text/plain; version=0.0.4; charset=utf-8"
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        if line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        name, _, labels = series.partition("{")
+        labels = tuple(sorted(tuple(label.split("=", 1)) for label in labels.rstrip("}").split(",") if label))
+        samples[name, tuple((key, value.strip('"')) for key, value in labels)] = float(value)
+    return samples
+
+
+def grown(before, after, name, **labels):
+    """How much the sample `name` with exactly `labels` grew between two scrapes."""
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    return after.get(key, 0) - before.get(key, 0)
+
+
+def served(response):
+    """Read and close `response`, as a server does; requests are recorded when closed."""
+    body = response.get_data()
+    response.close()
+    return response.status_code, body
+
+
+def test_metrics_count_requests_by_route_method_and_status(client):
+    user_id = create_user(client, "Measured", "measured@example.com")
+    route = "/api/user_preferences/<string:user_id>"
+    before = scrape(client)
+
+    responses = [served(client.put(f"/api/user_preferences/{user_id}", json={"categories": ["BUSINESS"]})),
+                 served(client.put("/api/user_preferences/00-0000000", json={"categories": ["BUSINESS"]}))]
+    with failing_commit():
+        responses.append(served(client.put(f"/api/user_preferences/{user_id}", json={"categories": ["SPORTS"]})))
+    assert [status for status, _ in responses] == [200, 400, 500]
+
+    after = scrape(client)
+    for status in (200, 400, 500):
+        assert grown(before, after, "news_api_requests_total", route=route, method="PUT", status=status) == 1
+    assert grown(before, after, "news_api_requests_total", route=route, method="GET", status=200) == 0
+    assert grown(before, after, "news_api_response_bytes_total", route=route, method="PUT") \
+        == sum(len(body) for _, body in responses)
+
+    labels = {"route": route, "method": "PUT"}
+    for histogram in ("news_api_request_duration_seconds", "news_api_request_sql_statements"):
+        assert grown(before, after, f"{histogram}_count", **labels) == 3
+        assert grown(before, after, f"{histogram}_bucket", **labels, le="+Inf") == 3
+        buckets = [value for (name, sample_labels), value in after.items()
+                   if name == f"{histogram}_bucket" and ("route", route) in sample_labels]
+        assert buckets == sorted(buckets)
+    # Each of them looked the user up, so none is in the 0-statement bucket
+    assert grown(before, after, "news_api_request_sql_statements_bucket", **labels, le="0") == 0
+    assert grown(before, after, "news_api_request_sql_statements_sum", **labels) >= 3
+    assert grown(before, after, "news_api_sql_duration_seconds_total", **labels) > 0
+
+
+def test_metrics_include_streamed_bodies(client):
+    for n in range(3):
+        post_article(client, f"Story {n}", f"Body {n}", 1)
+    before = scrape(client)
+
+    status, body = served(client.get("/api/articles?stream=1"))
+    assert status == 200 and body.count(b'"Title"') == 3
+
+    after = scrape(client)
+    labels = {"route": "/api/articles", "method": "GET"}
+    assert grown(before, after, "news_api_requests_total", **labels, status=200) == 1
+    assert grown(before, after, "news_api_response_bytes_total", **labels) == len(body)
+    # The rows are fetched while streaming
+    assert grown(before, after, "news_api_sql_rows_fetched_total", **labels) >= 3
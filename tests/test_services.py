@@ -1 +1,446 @@
  # Unit tests for service layer
+import pytest
+from sqlalchemy import text
+
+import api.services as services
+from api import near_duplicates
+from api.latest_articles import latest_articles
+from api.models import db, Article, User
+from utility.helpers import parse_timestamp
+from tests.conftest import CATEGORIES, STORY, failing_commit, reload_memory_indexes
+
+
+def store(*articles):
+    """Store articles (dicts) through create_articles_batch and return their Article_IDs."""
+    results = services.create_articles_batch(list(articles))
+    assert all(result["status"] == "created" for result in results), results
+    return [result["Article_ID"] for result in results]
+
+
+def article(title, content, category_id, published_at=None):
+    item = {"Title": title, "Content": content, "Category_ID": category_id}
+    if published_at:
+        item["Published_At"] = published_at
+    return item
+
+
+def ids(rows):
+    return [row[0].Article_ID for row in rows]
+
+
+# ---------------------------------------------------------
+# Bulk user creation
+# ---------------------------------------------------------
+
+def stored_emails():
+    return sorted(email for email, in db.session.query(User.Email))
+
+
+def test_bulk_users_report_each_item(app_context):
+    existing = services.create_user("Existing", "taken@example.com")
+
+    results = services.create_users_bulk([
+        {"Name": "Ann", "Email": "ann@example.com"},
+        {"Name": "Taken", "Email": "taken@example.com"},
+        {"Name": "Ann Again", "Email": "ann@example.com"},
+        {"Name": "", "Email": "blank@example.com"},
+        {"Name": "No Email"},
+        {"Name": "Not text", "Email": 42},
+        "not a user",
+        {"Name": "Bob", "Email": "bob@example.com"},
+    ])
+    assert [(result["index"], result["status"], result.get("error")) for result in results] == [
+        (0, "created", None),
+        (1, "conflict", "Email already exists"),
+        # Only the first of a batch's duplicate emails is created
+        (2, "conflict", "Duplicate Email in request"),
+        (3, "invalid", "Name and Email are required"),
+        (4, "invalid", "Name and Email are required"),
+        (5, "invalid", "Name and Email are required"),
+        (6, "invalid", "Name and Email are required"),
+        (7, "created", None),
+    ]
+    created = [results[0]["user"], results[7]["user"]]
+    assert [(user["Name"], user["Email"]) for user in created] == [("Ann", "ann@example.com"),
+                                                                    ("Bob", "bob@example.com")]
+    user_ids = {user["User_ID"] for user in created}
+    assert len(user_ids) == 2 and existing.User_ID not in user_ids
+    assert {db.session.get(User, user_id).Name for user_id in user_ids} == {"Ann", "Bob"}
+    # The bulk insert reaches the name search index too
+    assert [user.Name for user in services.get_users_by_name("bob", starts_with=False)] == ["Bob"]
+    assert stored_emails() == ["ann@example.com", "bob@example.com", "taken@example.com"]
+
+
+def test_bulk_users_are_created_in_one_transaction(app_context):
+    users = [{"Name": f"User {n}", "Email": f"user{n}@example.com"} for n in range(3)]
+    with failing_commit(), pytest.raises(RuntimeError):
+        services.create_users_bulk(users)
+    assert stored_emails() == []
+
+    assert [result["status"] for result in services.create_users_bulk(users)] == ["created"] * 3
+    assert stored_emails() == [user["Email"] for user in users]
+
+
+def test_bulk_users_are_limited_per_request(app_context):
+    with pytest.raises(ValueError):
+        services.create_users_bulk([{"Name": "User", "Email": f"user{n}@example.com"}
+                                    for n in range(services.MAX_BULK_USERS + 1)])
+    assert stored_emails() == []
+
+
+# ---------------------------------------------------------
+# Article ingest
+# ---------------------------------------------------------
+
+def statuses(results):
+    return [(result["status"], result.get("reason"), result.get("Article_ID")) for result in results]
+
+
+def test_batch_skips_articles_with_a_stored_url_or_content(app_context):
+    stored, = store(dict(article("Story", STORY, 1), URL="https://example.com/news/story"))
+
+    results = services.create_articles_batch([
+        # The same URL once normalized: scheme, www., case, trailing slash, tracking parameters, fragment
+        dict(article("Retitled", "Rewritten body", 2), URL="http://www.Example.com/news/story/?utm_source=feed#top"),
+        # The same body with different whitespace, under another URL
+        dict(article("Copy", "  " + STORY.replace(" ", "\n  ") + " ", 1), URL="https://mirror.example.org/story"),
+        dict(article("New", "A different body", 3), URL="https://example.com/news/story?page=2"),
+    ])
+    assert statuses(results[:2]) == [("duplicate", "url", stored), ("duplicate", "content", stored)]
+    assert results[2]["status"] == "created"
+    assert db.session.query(Article).count() == 2
+
+
+def test_batch_points_duplicates_within_it_at_the_stored_article(app_context):
+    results = services.create_articles_batch([
+        dict(article("First", "Body one", 1), URL="https://example.com/a"),
+        dict(article("Again", "Body two", 1), URL="https://example.com/a/"),
+        article("Same body", "Body  one", 2),
+    ])
+    created = results[0]["Article_ID"]
+    assert statuses(results) == [("created", None, created), ("duplicate", "url", created),
+                                 ("duplicate", "content", created)]
+
+
+def test_invalid_items_do_not_fail_the_batch(app_context):
+    results = services.create_articles_batch([
+        dict(article("Bad port", "Body one", 1), URL="http://x.com:99999/a"),
+        article("", "No title", 1),
+        article("Unknown category", "Body two", 99),
+        dict(article("Bad time", "Body three", 1), Published_At="yesterday"),
+        "not an article",
+        dict(article("Good", "Body four", 1), URL="https://example.com/good"),
+    ])
+    assert [result["status"] for result in results] == ["invalid"] * 5 + ["created"]
+    assert results[0]["error"].startswith("URL: ")
+    assert results[2]["error"] == "Invalid Category_ID: 99"
+    assert [row.Title for row in db.session.query(Article)] == ["Good"]
+
+
+# ---------------------------------------------------------
+# Article search
+# ---------------------------------------------------------
+
+def searched_titles(query, category_name=None, **kwargs):
+    return [row[0].Title for row in services.search_articles(query, category_name, **kwargs)]
+
+
+def test_search_ranks_by_bm25_with_titles_weighted_higher(app_context):
+    store(article("Budget talks stall", "Ministers met again without agreement on spending.", 1),
+          article("Markets today", "Shares rose. The budget was mentioned once among many other topics "
+                                   "such as trade, jobs, energy prices and interest rates.", 2),
+          article("Weekly roundup", "Budget, budget, budget: the budget dominated the week.", 1),
+          article("Football", "The match ended in a draw.", 3))
+
+    # A title match outweighs repeated mentions in the content; a short, dense body beats a passing mention
+    assert searched_titles("budget") == ["Budget talks stall", "Weekly roundup", "Markets today"]
+    rows = services.search_articles("budget")
+    assert [row[2] for row in rows] == sorted(row[2] for row in rows)
+    # Every word must match, and 'word*' matches a prefix
+    assert searched_titles("budget week") == ["Weekly roundup"]
+    assert searched_titles("budg*") == searched_titles("budget")
+    assert searched_titles("election") == []
+
+
+def test_search_filters_by_category_name(app_context):
+    store(article("Budget talks stall", "Ministers disagree on the budget.", 1),
+          article("Budget season", "Companies plan their budget.", 2))
+
+    assert searched_titles("budget", "politics") == ["Budget talks stall"]
+    assert searched_titles("budget", "BUSI") == ["Budget season"]
+    assert searched_titles("budget", "no such category") == []
+
+
+def test_search_quotes_user_input(app_context):
+    store(article("Budget talks stall", "Ministers disagree on the budget.", 1))
+
+    # FTS5 operators and punctuation are searched for as words, not parsed
+    assert searched_titles('budget" OR NEAR(talks') == []
+    assert searched_titles("talks: (budget)") == ["Budget talks stall"]
+    with pytest.raises(ValueError):
+        services.search_articles("?!")
+
+
+# ---------------------------------------------------------
+# Near-duplicate collapsing
+# ---------------------------------------------------------
+
+@pytest.fixture
+def story(app_context):
+    """One story told in POLITICS (the cluster head), twice in BUSINESS, and an unrelated SPORTS article."""
+    head, first, second = store(
+        article("Story", STORY, 1, "2024-01-01T00:00:00Z"),
+        article("Story", STORY + " extra", 2, "2024-01-02T00:00:00Z"),
+        article("Story", STORY + " more", 2, "2024-01-03T00:00:00Z"),
+    )
+    other, = store(article("Match report", " ".join(f"goal{i}" for i in range(300)), 3, "2024-01-04T00:00:00Z"))
+    assert near_duplicates.cluster_of(first) == near_duplicates.cluster_of(second) == head
+    return head, first, second, other
+
+
+def test_collapse_keeps_the_first_article_of_the_filtered_listing(story):
+    head, first, second, other = story
+
+    assert ids(services.get_articles_by_category_name("BUSINESS")) == [first, second]
+    # The cluster head is in POLITICS; the story still appears once in BUSINESS
+    assert ids(services.get_articles_by_category_name("BUSINESS", collapse=True)) == [first]
+    assert ids(services.get_articles_by_category_name("POLITICS", collapse=True)) == [head]
+    assert ids(services.get_all_articles(collapse=True)) == [head, other]
+
+
+def test_collapse_pages_without_resurfacing_cluster_members(story):
+    head, first, second, other = story
+
+    assert ids(services.get_articles_by_category_name("BUSINESS", after=first, collapse=True)) == []
+    assert ids(services.get_all_articles(after=head, collapse=True)) == [other]
+
+
+def test_collapse_applies_the_published_at_filter_first(story):
+    head, first, second, other = story
+
+    since = parse_timestamp("2024-01-03T00:00:00Z")
+    assert ids(services.get_articles_by_category_name("BUSINESS", collapse=True, since=since)) == [second]
+    assert ids(services.get_all_articles(collapse=True, since=since)) == [second, other]
+
+
+def test_feed_collapse_is_over_the_users_categories(story):
+    head, first, second, other = story
+    user = services.create_user("Feed Reader", "feed@example.com")
+
+    services.update_user_preferences(user.User_ID, ["BUSINESS", "SPORTS"])
+    assert ids(services.get_user_feed(user.User_ID, collapse=True)) == [other, first]
+
+    services.update_user_preferences(user.User_ID, ["POLITICS", "BUSINESS"])
+    assert ids(services.get_user_feed(user.User_ID)) == [second, first, head]
+    assert ids(services.get_user_feed(user.User_ID, collapse=True)) == [head]
+
+
+def test_rolled_back_articles_stay_out_of_the_near_duplicate_index(app_context):
+    signature = near_duplicates.minhash_signature("Story", STORY)
+    with failing_commit(), pytest.raises(RuntimeError):
+        store(article("Story", STORY, 1))
+    assert near_duplicates.near_duplicate_index.candidates(signature) == set()
+
+    # SQLite may hand the rolled-back Article_ID to an unrelated article...
+    unrelated, = store(article("Other", " ".join(f"other{i}" for i in range(300)), 2))
+    # ...which a later copy of the story must not be clustered with
+    copy, = store(article("Story", STORY, 1))
+    assert near_duplicates.cluster_of(copy) == copy
+    assert near_duplicates.cluster_of(unrelated) == unrelated
+    assert copy in near_duplicates.near_duplicate_index.candidates(signature)
+
+
+# ---------------------------------------------------------
+# Preference structures
+# ---------------------------------------------------------
+
+@pytest.fixture
+def readers(app_context):
+    """Three users and their preferences, by User_ID."""
+    preferences = [["POLITICS", "BUSINESS"], ["BUSINESS", "SPORTS"], ["BUSINESS"]]
+    user_ids = []
+    for n, categories in enumerate(preferences):
+        user = services.create_user(f"Reader {n}", f"reader{n}@example.com")
+        services.update_user_preferences(user.User_ID, categories)
+        user_ids.append(user.User_ID)
+    return user_ids
+
+
+def preference_writes(user_ids):
+    """Update, delete and rolled-back preference writes, yielding after each."""
+    first, second, third = user_ids
+    services.update_user_preferences(first, ["SPORTS", "TECH"])
+    yield "update"
+    services.delete_user_preference(second, "BUSINESS")
+    yield "delete preference"
+    services.delete_user(third)
+    yield "delete user"
+    with failing_commit(), pytest.raises(RuntimeError):
+        services.update_user_preferences(first, ["POLITICS"])
+    yield "rolled-back update"
+    with failing_commit(), pytest.raises(RuntimeError):
+        services.delete_user(second)
+    yield "rolled-back delete"
+
+
+def counted_preferences():
+    """Category_ID -> number of users who chose it, counted in SQL."""
+    return dict(db.session.execute(text(
+        "SELECT CAST(Category_ID AS INTEGER), COUNT(*) FROM user_preference GROUP BY 1"
+    )).all())
+
+
+def test_category_stats_follow_preference_writes(readers):
+    assert services.verify_category_stats() == []
+    for step in preference_writes(readers):
+        assert services.verify_category_stats() == [], step
+        stats = {row["Category_ID"]: row["User_Count"] for row in services.get_user_preference_stats()}
+        assert stats == counted_preferences(), step
+
+
+def counted_pairs():
+    """(Category_ID, Category_ID) -> number of users who chose both, counted in SQL."""
+    return dict(((first, second), users) for first, second, users in db.session.execute(text(
+        "SELECT CAST(a.Category_ID AS INTEGER), CAST(b.Category_ID AS INTEGER), COUNT(*) "
+        "FROM user_preference a JOIN user_preference b ON a.User_ID = b.User_ID GROUP BY 1, 2"
+    )).all())
+
+
+def cooccurrence_pairs():
+    """The same pairs, read from the co-occurrence matrix through get_also_liked_categories."""
+    pairs = {}
+    for category_id, name in CATEGORIES.items():
+        result = services.get_also_liked_categories(name, limit=len(CATEGORIES))
+        if result["User_Count"]:
+            pairs[category_id, category_id] = result["User_Count"]
+        for other in result["also_liked"]:
+            pairs[category_id, other["Category_ID"]] = other["Users"]
+    return pairs
+
+
+def test_cooccurrence_matrix_follows_preference_writes(readers):
+    assert cooccurrence_pairs() == counted_pairs()
+    for step in preference_writes(readers):
+        assert cooccurrence_pairs() == counted_pairs(), step
+
+
+def test_recommendations_score_categories_by_shared_users(readers):
+    first, second, third = readers
+    # first chose POLITICS and BUSINESS; of BUSINESS's three users one chose SPORTS
+    assert services.get_recommended_categories(first) == [
+        {"Category_ID": 3, "Category": "SPORTS", "Score": round((0 + 1 / 3) / 2, 4)}
+    ]
+    services.delete_user(second)
+    assert services.get_recommended_categories(first) == []
+    assert services.get_recommended_categories("00-0000000") is None
+
+
+AUDIENCES = [["BUSINESS"], ["BUSINESS", "SPORTS"], ["POLITICS", "TECH"], ["SPORTS", "TECH"]]
+
+
+def counted_audience(names, match):
+    """The User_IDs whose preferences include all (or any) of the categories, from SQL."""
+    category_ids = [next(category_id for category_id, name in CATEGORIES.items() if name == wanted)
+                    for wanted in names]
+    required = len(category_ids) if match == "all" else 1
+    return list(db.session.execute(text(
+        f"SELECT User_ID FROM user_preference WHERE CAST(Category_ID AS INTEGER) IN "
+        f"({', '.join(map(str, category_ids))}) GROUP BY User_ID HAVING COUNT(*) >= :required ORDER BY User_ID"
+    ), {"required": required}).scalars())
+
+
+def audience_pages(names, match, limit):
+    """Every User_ID of an audience, read a page of `limit` at a time."""
+    user_ids, after = [], None
+    while True:
+        _, total, page = services.get_preference_audience(names, match, limit, after)
+        user_ids.extend(page)
+        if len(page) < limit:
+            return total, user_ids
+        after = page[-1]
+
+
+def assert_audiences_match_sql(step):
+    for names in AUDIENCES:
+        for match in ("all", "any"):
+            expected = counted_audience(names, match)
+            _, total, user_ids = services.get_preference_audience(names, match)
+            assert (total, user_ids) == (len(expected), expected), (step, names, match)
+            assert audience_pages(names, match, 1) == (len(expected), expected), (step, names, match)
+
+
+@pytest.mark.parametrize("layout", ["overflow", "arrays", "merged"])
+def test_preference_index_follows_preference_writes(readers, layout, monkeypatch):
+    if layout == "arrays":
+        # Users loaded from the table live in the sorted arrays, not the overflow
+        reload_memory_indexes()
+    elif layout == "merged":
+        # Every write merges the overflow into the arrays
+        monkeypatch.setattr("api.preference_index.MAX_OVERFLOW", 1)
+    assert_audiences_match_sql("initial")
+    for step in preference_writes(readers):
+        assert_audiences_match_sql(step)
+
+
+# ---------------------------------------------------------
+# Latest articles
+# ---------------------------------------------------------
+
+# (Category_ID, Published_At), stored out of order and with ties
+NEWS = [(2, "2024-03-01T09:00:00Z"), (3, "2024-03-02T09:00:00Z"), (2, "2024-02-01T09:00:00Z"),
+        (2, "2024-03-05T09:00:00Z"), (3, "2024-03-02T09:00:00Z"), (2, "2024-03-01T09:00:00Z"),
+        (3, "2024-01-15T09:00:00Z"), (2, "2024-03-04T09:00:00Z")]
+
+
+def news(n, category_id, published_at):
+    return article(f"News {n}", " ".join(f"news{n}x{i}" for i in range(50)), category_id, published_at)
+
+
+@pytest.fixture
+def small_buffers(app_context, monkeypatch):
+    """Buffers of three articles, so deeper pages fall back to the database."""
+    monkeypatch.setattr(latest_articles, "size", 3)
+    latest_articles.load()
+    store(*(news(n, category_id, published_at) for n, (category_id, published_at) in enumerate(NEWS)))
+
+
+def counted_latest(category_id=None, since=None, before=None):
+    """Article_IDs newest first, from SQL."""
+    query = db.session.query(Article.Article_ID)
+    if category_id is not None:
+        query = query.filter(Article.Category_ID == category_id)
+    if since is not None:
+        query = query.filter(Article.Published_At >= since)
+    if before is not None:
+        query = query.filter(Article.Published_At < before)
+    return [row[0] for row in query.order_by(Article.Published_At.desc(), Article.Article_ID.desc())]
+
+
+def latest_pages(category_name, limit, since=None, before=None):
+    """Every Article_ID of the latest listing, read a page of `limit` at a time."""
+    article_ids, after = [], None
+    while True:
+        page = services.get_latest_articles(category_name, limit, since=since, before=before, after=after)
+        article_ids.extend(ids(page))
+        if len(page) < limit:
+            return article_ids
+        after = (page[-1][0].Published_At, page[-1][0].Article_ID)
+
+
+def test_latest_articles_match_sql_at_every_page_size(small_buffers):
+    since, before = parse_timestamp("2024-03-01T09:00:00Z"), parse_timestamp("2024-03-05T00:00:00Z")
+    for category_id, category_name in [(None, None), (2, "BUSINESS"), (3, "SPORTS"), (4, "TECH")]:
+        for limit in range(1, len(NEWS) + 2):
+            assert latest_pages(category_name, limit) == counted_latest(category_id), (category_name, limit)
+            assert (latest_pages(category_name, limit, since, before)
+                    == counted_latest(category_id, since, before)), (category_name, limit)
+
+
+def test_rolled_back_articles_stay_out_of_the_latest_buffers(small_buffers):
+    with failing_commit(), pytest.raises(RuntimeError):
+        store(news("ghost", 2, "2024-04-01T09:00:00Z"))
+    assert ids(services.get_latest_articles("BUSINESS", 3)) == counted_latest(2)[:3]
+
+    newest, = store(news("newest", 2, "2024-04-02T09:00:00Z"))
+    assert ids(services.get_latest_articles("BUSINESS", 3)) == counted_latest(2)[:3]
+    assert ids(services.get_latest_articles(None, 1)) == [newest]
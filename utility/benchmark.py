@@ -0,0 +1,470 @@
+"""
+Performance benchmarks for the service layer and the API routes.
+
+Every service function is called inside an app context and every route through
+the Flask test client, against seeded datasets of three sizes. Each case records:
+
+- latency percentiles (p50/p95/p99, ms) and throughput (calls/s) over the timed runs,
+- SQL statements executed per call,
+- peak Python memory allocated by one call (tracemalloc, in a separate untimed run).
+
+Datasets are generated (utility/data/generate_data.py) from a fixed seed and
+cached under data/benchmarks/. Each
+run works on a fresh copy of the cached file, so write cases always start from
+the same data. Results are written to a JSON file; given a baseline (an earlier
+results file), cases whose p95 latency, query count or peak memory grew are
+reported as regressions and the command exits with status 1.
+
+Usage (from the project root):
+    python -m utility.benchmark                                   # all datasets, all cases
+    python -m utility.benchmark --datasets small --cases articles  # cases whose name contains 'articles'
+    python -m utility.benchmark --save-baseline                   # store this run as the baseline
+    python -m utility.benchmark --baseline data/benchmarks/baseline.json
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import event
+
+from utility.config import DEFAULT_DATABASE_PATH
+from utility.data.generate_data import Scale, generate
+
+BENCHMARK_DIR = DEFAULT_DATABASE_PATH.parent / "benchmarks"
+DEFAULT_RESULTS_PATH = BENCHMARK_DIR / "results.json"
+DEFAULT_BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+DEFAULT_ITERATIONS = 50
+DEFAULT_WARMUP = 5
+# A case regresses when its p95 grows by more than this fraction of the baseline...
+DEFAULT_TOLERANCE = 0.2
+# ...and by more than this many milliseconds (sub-millisecond cases are mostly noise)
+MIN_LATENCY_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_KIB = 64
+SEED = 20240601
+
+
+DATASETS = {
+    "small": Scale(users=1000, articles=2000),
+    "medium": Scale(users=10000, articles=20000),
+    "large": Scale(users=100000, articles=200000),
+}
+
+
+# ---------------------------------------------------------
+# Datasets
+# ---------------------------------------------------------
+
+def prepare_dataset(name: str, rebuild: bool = False) -> Path:
+    """Return a fresh working copy of dataset `name`, generating it first if needed."""
+    cached = BENCHMARK_DIR / f"{name}.db"
+    if rebuild or not cached.exists():
+        print(f"Generating {name} dataset ({DATASETS[name].users} users, {DATASETS[name].articles} articles)...")
+        for path in (cached, cached.with_name(cached.name + "-wal"), cached.with_name(cached.name + "-shm")):
+            path.unlink(missing_ok=True)
+        generate(cached, DATASETS[name].users, DATASETS[name].articles, SEED)
+        # Fold the WAL into the main file so the cached dataset is a single file
+        with closing(sqlite3.connect(cached)) as connection:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    working = BENCHMARK_DIR / f"{name}.run.db"
+    for stale in (working.with_name(working.name + "-wal"), working.with_name(working.name + "-shm")):
+        stale.unlink(missing_ok=True)
+    shutil.copyfile(cached, working)
+    return working
+
+
+# ---------------------------------------------------------
+# Cases
+# ---------------------------------------------------------
+
+# Words for the articles the ingest cases post
+WORDS = ("market", "election", "storm", "league", "budget", "vaccine", "startup", "court", "festival",
+         "climate", "transfer", "senate", "earnings", "museum", "drought", "merger", "playoff", "satellite",
+         "protest", "recipe", "tariff", "orbit", "harvest", "verdict", "summit", "premiere", "outbreak")
+
+
+class Fixtures:
+    """Existing rows the cases work with, chosen deterministically from the dataset."""
+
+    def __init__(self, app):
+        from api.models import db, Article, User, UserPreference
+        from api.category_cache import category_cache
+
+        self.app = app
+        self.client = app.test_client()
+        with app.app_context():
+            user = (User.query.join(UserPreference, UserPreference.User_ID == User.User_ID)
+                    .order_by(User.User_ID).first())
+            self.user_id = user.User_ID
+            self.name_prefix = user.Name[:2]
+            self.name_substring = user.Name[1:4]
+            self.category_ids = [category.Category_ID for category in category_cache.all()]
+            self.category_names = [category.Category for category in category_cache.all()[:4]]
+            article = Article.query.order_by(Article.Article_ID.desc()).first()
+            self.article_id = article.Article_ID
+            # Two words of a stored title, so searches have matches
+            self.search_terms = " ".join(article.Title.split()[:2])
+
+    def new_user(self, i: int, tag: str) -> str:
+        """Create a user with two preferences (untimed setup for the delete cases)."""
+        from api import services
+
+        with self.app.app_context():
+            result = services.create_users_bulk([{"Name": f"Setup {tag} {i}", "Email": f"setup-{tag}-{i}@example.com"}])
+            user_id = result[0]["user"]["User_ID"]
+            services.update_user_preferences(user_id, self.category_names[:2])
+        return user_id
+
+    def new_articles(self, i: int, tag: str, count: int) -> List[dict]:
+        """Articles no earlier call has stored (untimed setup for the ingest cases)."""
+        rnd = random.Random(f"{tag}-{i}")
+        return [{"Title": f"Benchmark {tag} {i}.{n}",
+                 "Content": " ".join(rnd.choices(WORDS, k=200)),
+                 "Category_ID": rnd.choice(self.category_ids),
+                 "URL": f"https://bench.example.com/{tag}/{i}/{n}"}
+                for n in range(count)]
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable
+    # Untimed preparation for each call; its return value is passed to run
+    setup: Optional[Callable] = None
+
+
+def _service_cases() -> List[Case]:
+    from api import services
+
+    def preferences_for(fx, i):
+        return fx.category_names[:2] if i % 2 else fx.category_names[2:4]
+
+    return [
+        Case("get_db_connection", lambda fx, i, _: services.get_db_connection()),
+        Case("get_all_users", lambda fx, i, _: services.get_all_users(100)),
+        Case("get_users_by_name prefix", lambda fx, i, _: services.get_users_by_name(fx.name_prefix, True, 50)),
+        Case("get_users_by_name substring",
+             lambda fx, i, _: services.get_users_by_name(fx.name_substring, False, 50)),
+        Case("create_user", lambda fx, i, _: services.create_user(f"Bench {i}", f"bench-service-{i}@example.com")),
+        Case("create_users_bulk", lambda fx, i, _: services.create_users_bulk(
+            [{"Name": f"Bulk {i}.{n}", "Email": f"bulk-service-{i}-{n}@example.com"} for n in range(100)])),
+        Case("update_user_name", lambda fx, i, _: services.update_user_name(fx.user_id, f"Renamed {i}")),
+        Case("delete_user", lambda fx, i, user_id: services.delete_user(user_id),
+             setup=lambda fx, i: fx.new_user(i, "service-delete")),
+        Case("get_all_categories", lambda fx, i, _: services.get_all_categories()),
+        Case("get_recommended_categories", lambda fx, i, _: services.get_recommended_categories(fx.user_id)),
+        Case("get_also_liked_categories",
+             lambda fx, i, _: services.get_also_liked_categories(fx.category_names[0])),
+        Case("resolve_category_ids", lambda fx, i, _: services.resolve_category_ids(fx.category_names[0][:3])),
+        Case("get_all_articles", lambda fx, i, _: services.get_all_articles(250)),
+        Case("get_all_articles collapsed", lambda fx, i, _: services.get_all_articles(250, collapse=True)),
+        Case("get_articles_by_category_name",
+             lambda fx, i, _: services.get_articles_by_category_name(fx.category_names[0], 250)),
+        Case("get_latest_articles", lambda fx, i, _: services.get_latest_articles()),
+        Case("get_latest_articles by category",
+             lambda fx, i, _: services.get_latest_articles(fx.category_names[0])),
+        Case("stream_articles", lambda fx, i, _: sum(1 for _ in services.stream_articles(limit=5000))),
+        Case("get_user_feed", lambda fx, i, _: services.get_user_feed(fx.user_id, 50)),
+        Case("create_articles_batch",
+             lambda fx, i, articles: services.create_articles_batch(articles),
+             setup=lambda fx, i: fx.new_articles(i, "service", 50)),
+        Case("get_duplicate_cluster", lambda fx, i, _: services.get_duplicate_cluster(fx.article_id)),
+        Case("search_articles", lambda fx, i, _: services.search_articles(fx.search_terms, limit=25)),
+        Case("get_all_user_preferences", lambda fx, i, _: services.get_all_user_preferences(100)),
+        Case("get_all_user_preferences by name",
+             lambda fx, i, _: services.get_all_user_preferences(100, name=fx.name_substring)),
+        Case("get_user_preferences_compact", lambda fx, i, _: services.get_user_preferences_compact(100)),
+        Case("update_user_preferences",
+             lambda fx, i, _: services.update_user_preferences(fx.user_id, preferences_for(fx, i))),
+        Case("delete_user_preference",
+             lambda fx, i, user_id: services.delete_user_preference(user_id, fx.category_names[1]),
+             setup=lambda fx, i: fx.new_user(i, "service-preference")),
+        Case("get_user_preference_stats", lambda fx, i, _: services.get_user_preference_stats()),
+        Case("get_preference_audience all",
+             lambda fx, i, _: services.get_preference_audience(fx.category_names[:2], 'all', 1000)),
+        Case("get_preference_audience any",
+             lambda fx, i, _: services.get_preference_audience(fx.category_names[:2], 'any', 1000)),
+        Case("verify_category_stats", lambda fx, i, _: services.verify_category_stats()),
+    ]
+
+
+def _route_cases() -> List[Case]:
+    def preferences_for(fx, i):
+        return {"categories": fx.category_names[:2] if i % 2 else fx.category_names[2:4]}
+
+    return [
+        Case("GET /api/", lambda fx, i, _: fx.client.get("/api/")),
+        Case("GET /api/connection", lambda fx, i, _: fx.client.get("/api/connection")),
+        Case("GET /api/metrics", lambda fx, i, _: fx.client.get("/api/metrics")),
+        Case("GET /api/debug/slow-queries", lambda fx, i, _: fx.client.get("/api/debug/slow-queries?limit=200")),
+        Case("DELETE /api/debug/slow-queries", lambda fx, i, _: fx.client.delete("/api/debug/slow-queries")),
+        Case("GET /api/users", lambda fx, i, _: fx.client.get("/api/users?limit=100")),
+        Case("GET /api/users?name", lambda fx, i, _: fx.client.get(f"/api/users?name={fx.name_prefix}&limit=50")),
+        Case("GET /api/users?name substring",
+             lambda fx, i, _: fx.client.get(f"/api/users?name={fx.name_substring}&starts_with=false&limit=50")),
+        Case("POST /api/users", lambda fx, i, _: fx.client.post(
+            "/api/users", json={"Name": f"Bench {i}", "Email": f"bench-route-{i}@example.com"})),
+        Case("POST /api/users/bulk", lambda fx, i, _: fx.client.post("/api/users/bulk", json={
+            "users": [{"Name": f"Bulk {i}.{n}", "Email": f"bulk-route-{i}-{n}@example.com"} for n in range(100)]})),
+        Case("PUT /api/users/<id>",
+             lambda fx, i, _: fx.client.put(f"/api/users/{fx.user_id}", json={"Name": f"Renamed {i}"})),
+        Case("DELETE /api/users/<id>", lambda fx, i, user_id: fx.client.delete(f"/api/users/{user_id}"),
+             setup=lambda fx, i: fx.new_user(i, "route-delete")),
+        Case("GET /api/users/<id>/feed", lambda fx, i, _: fx.client.get(f"/api/users/{fx.user_id}/feed")),
+        Case("GET /api/users/<id>/recommended-categories",
+             lambda fx, i, _: fx.client.get(f"/api/users/{fx.user_id}/recommended-categories")),
+        Case("GET /api/categories", lambda fx, i, _: fx.client.get("/api/categories")),
+        Case("GET /api/categories/<name>/also-liked",
+             lambda fx, i, _: fx.client.get(f"/api/categories/{fx.category_names[0]}/also-liked")),
+        Case("GET /api/articles", lambda fx, i, _: fx.client.get("/api/articles?limit=250")),
+        Case("GET /api/articles gzip",
+             lambda fx, i, _: fx.client.get("/api/articles?limit=250", headers={"Accept-Encoding": "gzip"})),
+        Case("GET /api/articles stream", lambda fx, i, _: fx.client.get("/api/articles?limit=5000&stream=1")),
+        Case("GET /api/articles/by-category-name", lambda fx, i, _: fx.client.get(
+            f"/api/articles/by-category-name?category={fx.category_names[0]}&limit=250")),
+        Case("GET /api/articles/latest", lambda fx, i, _: fx.client.get("/api/articles/latest")),
+        Case("GET /api/articles/latest?category", lambda fx, i, _: fx.client.get(
+            "/api/articles/latest", query_string={"category": fx.category_names[0]})),
+        Case("GET /api/articles/<id>/duplicates",
+             lambda fx, i, _: fx.client.get(f"/api/articles/{fx.article_id}/duplicates")),
+        Case("GET /api/articles/search", lambda fx, i, _: fx.client.get(
+            "/api/articles/search", query_string={"q": fx.search_terms})),
+        Case("POST /api/articles", lambda fx, i, articles: fx.client.post("/api/articles", json=articles[0]),
+             setup=lambda fx, i: fx.new_articles(i, "route-single", 1)),
+        Case("POST /api/articles/batch",
+             lambda fx, i, articles: fx.client.post("/api/articles/batch", json={"articles": articles}),
+             setup=lambda fx, i: fx.new_articles(i, "route-batch", 50)),
+        Case("GET /api/user_preferences", lambda fx, i, _: fx.client.get("/api/user_preferences?limit=100")),
+        Case("GET /api/user_preferences compact",
+             lambda fx, i, _: fx.client.get("/api/user_preferences?limit=100&format=compact")),
+        Case("PUT /api/user_preferences/<id>",
+             lambda fx, i, _: fx.client.put(f"/api/user_preferences/{fx.user_id}", json=preferences_for(fx, i))),
+        Case("DELETE /api/user_preferences/<id>/<category>", lambda fx, i, user_id: fx.client.delete(
+            f"/api/user_preferences/{user_id}/{fx.category_names[1]}"),
+             setup=lambda fx, i: fx.new_user(i, "route-preference")),
+        Case("GET /api/user-preferences/stats", lambda fx, i, _: fx.client.get("/api/user-preferences/stats")),
+        Case("GET /api/user_preferences?categories", lambda fx, i, _: fx.client.get(
+            "/api/user_preferences", query_string={"categories": ",".join(fx.category_names[:2]), "limit": 1000})),
+    ]
+
+
+def all_cases() -> Dict[str, Case]:
+    cases = {f"service {case.name}": case for case in _service_cases()}
+    cases.update({f"route {case.name}": case for case in _route_cases()})
+    return cases
+
+
+# ---------------------------------------------------------
+# Measuring
+# ---------------------------------------------------------
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _call(fx: Fixtures, case: Case, kind: str, i: int):
+    prepared = case.setup(fx, i) if case.setup else None
+    if kind == "route":
+        def call():
+            response = case.run(fx, i, prepared)
+            try:
+                # Consume streamed bodies so their queries are part of the call
+                response.get_data()
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{case.name} answered {response.status_code}: {response.get_data(as_text=True)}")
+            finally:
+                response.close()
+    else:
+        def call():
+            with fx.app.app_context():
+                case.run(fx, i, prepared)
+    return call
+
+
+def measure(fx: Fixtures, case: Case, kind: str, statements: List[int], iterations: int, warmup: int) -> dict:
+    """Run one case `warmup + iterations` times, then once more under tracemalloc."""
+    for i in range(warmup):
+        _call(fx, case, kind, i)()
+
+    timings = []
+    query_counts = []
+    for i in range(warmup, warmup + iterations):
+        call = _call(fx, case, kind, i)
+        statements[0] = 0
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+        query_counts.append(statements[0])
+
+    call = _call(fx, case, kind, warmup + iterations)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(timings, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+        "throughput_per_s": round(len(timings) / sum(timings), 1),
+        "queries_per_call": round(statistics.fmean(query_counts), 2),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def run_dataset(name: str, cases: Dict[str, Case], iterations: int, warmup: int, rebuild: bool = False) -> dict:
+    from run import create_app
+    from api.models import db, Article, User, UserPreference
+
+    path = prepare_dataset(name, rebuild)
+    # The slow-query log is on, as it would be where its routes are benchmarked
+    app = create_app({"DATABASE_PATH": path, "SLOW_QUERY_LOG": True})
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        engine = db.engine
+        size = {
+            "users": User.query.count(),
+            "preferences": UserPreference.query.count(),
+            "articles": Article.query.count(),
+        }
+    event.listen(engine, "before_cursor_execute", count_statement)
+
+    fx = Fixtures(app)
+    results = {}
+    try:
+        for case_name, case in cases.items():
+            kind = case_name.split(" ", 1)[0]
+            results[case_name] = measure(fx, case, kind, statements, iterations, warmup)
+            metrics = results[case_name]
+            print(f"  {case_name:<52} p50 {metrics['p50_ms']:>9.3f} ms  p95 {metrics['p95_ms']:>9.3f} ms  "
+                  f"{metrics['throughput_per_s']:>9.1f}/s  {metrics['queries_per_call']:>6g} q  "
+                  f"{metrics['peak_memory_kib']:>9.1f} KiB")
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+        engine.dispose()
+    return {"size": size, "cases": results}
+
+
+# ---------------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------------
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    List the regressions of `results` against `baseline` (both results files): cases
+    whose p95 latency or peak memory grew by more than `tolerance` (and by more than
+    MIN_LATENCY_DELTA_MS / MIN_MEMORY_DELTA_KIB), or that run more SQL statements.
+    Cases missing from either side are ignored.
+    """
+    regressions = []
+    for dataset, current in results["datasets"].items():
+        previous_cases = baseline.get("datasets", {}).get(dataset, {}).get("cases", {})
+        for case_name, metrics in current["cases"].items():
+            previous = previous_cases.get(case_name)
+            if previous is None:
+                continue
+            where = f"{dataset}: {case_name}"
+            if (metrics["p95_ms"] > previous["p95_ms"] * (1 + tolerance)
+                    and metrics["p95_ms"] - previous["p95_ms"] > MIN_LATENCY_DELTA_MS):
+                regressions.append(f"{where}: p95 {previous['p95_ms']} ms -> {metrics['p95_ms']} ms")
+            if metrics["queries_per_call"] > previous["queries_per_call"]:
+                regressions.append(f"{where}: queries per call {previous['queries_per_call']} -> "
+                                   f"{metrics['queries_per_call']}")
+            if (metrics["peak_memory_kib"] > previous["peak_memory_kib"] * (1 + tolerance)
+                    and metrics["peak_memory_kib"] - previous["peak_memory_kib"] > MIN_MEMORY_DELTA_KIB):
+                regressions.append(f"{where}: peak memory {previous['peak_memory_kib']} KiB -> "
+                                   f"{metrics['peak_memory_kib']} KiB")
+    return regressions
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the News Aggregator services and routes.")
+    parser.add_argument("--datasets", nargs="+", choices=list(DATASETS), default=list(DATASETS),
+                        help="Datasets to run against (default: all)")
+    parser.add_argument("--cases", nargs="+", default=None,
+                        help="Only run cases whose name contains one of these strings")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Untimed calls per case")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS_PATH, help="Results file to write")
+    parser.add_argument("--baseline", type=Path, default=None, help="Results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Also write the results to {DEFAULT_BASELINE_PATH}")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative growth of p95 latency and peak memory")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate the cached datasets")
+    args = parser.parse_args()
+
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+
+    cases = all_cases()
+    if args.cases:
+        cases = {name: case for name, case in cases.items() if any(part in name for part in args.cases)}
+        if not cases:
+            parser.error("no case matches --cases")
+
+    results = {
+        "environment": _environment(),
+        "settings": {"iterations": args.iterations, "warmup": args.warmup},
+        "datasets": {},
+    }
+    for name in args.datasets:
+        print(f"Dataset {name}")
+        results["datasets"][name] = run_dataset(name, cases, args.iterations, args.warmup, args.rebuild)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        DEFAULT_BASELINE_PATH.write_text(json.dumps(results, indent=2))
+        print(f"Baseline written to {DEFAULT_BASELINE_PATH}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION  {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,92 @@
 # Configuration settings for the application
+"""
+SQLite storage profiles.
+
+A profile bundles the per-connection pragmas and the connection pool settings
+the app's engine is created with. `production` (the default) runs the database
+in WAL mode, so readers never wait for a writer and a writer only waits for
+another writer (up to busy_timeout). Pick a profile with the STORAGE_PROFILE
+config key or environment variable, or pass a StorageProfile to create_app.
+"""
+import os
+from pathlib import Path
+from typing import List, NamedTuple, Union
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_PATH = Path(__file__).parents[1] / "data" / "News_Aggregator.db"
+DEFAULT_STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "production")
+
+
+class StorageProfile(NamedTuple):
+    journal_mode: str = "WAL"
+    # NORMAL only syncs at WAL checkpoints: a power loss can drop the last commits
+    # but never corrupts the database
+    synchronous: str = "NORMAL"
+    cache_size_kib: int = 64 * 1024
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout_ms: int = 5000
+    temp_store: str = "MEMORY"
+    # Connections kept open, and extra ones allowed under load
+    pool_size: int = 8
+    max_overflow: int = 16
+    pool_timeout: float = 10.0
+
+    def pragmas(self) -> List[str]:
+        """The PRAGMA statements run on every new connection."""
+        return [
+            f"PRAGMA journal_mode={self.journal_mode}",
+            f"PRAGMA synchronous={self.synchronous}",
+            f"PRAGMA cache_size=-{int(self.cache_size_kib)}",
+            f"PRAGMA mmap_size={int(self.mmap_size)}",
+            f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}",
+            f"PRAGMA temp_store={self.temp_store}",
+        ]
+
+    def engine_options(self) -> dict:
+        """SQLALCHEMY_ENGINE_OPTIONS for this profile."""
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            # Pooled connections are handed to whichever request thread checks them out
+            "connect_args": {"check_same_thread": False, "timeout": self.busy_timeout_ms / 1000},
+        }
+
+
+STORAGE_PROFILES = {
+    "production": StorageProfile(),
+    # Smaller footprint for local work
+    "development": StorageProfile(cache_size_kib=16 * 1024, mmap_size=0, pool_size=4, max_overflow=4),
+    # CSV loads (utility/data/load_data.py): one connection with a big cache
+    "bulk_load": StorageProfile(cache_size_kib=256 * 1024, pool_size=1, max_overflow=0),
+    # SQLite's own defaults (rollback journal), for comparison
+    "legacy": StorageProfile(journal_mode="DELETE", synchronous="FULL", cache_size_kib=2000, mmap_size=0,
+                             busy_timeout_ms=0, temp_store="DEFAULT", pool_size=5, max_overflow=10,
+                             pool_timeout=30.0),
+}
+
+
+def get_storage_profile(profile: Union[str, StorageProfile]) -> StorageProfile:
+    """Resolve a profile name (or pass a StorageProfile through)."""
+    if isinstance(profile, StorageProfile):
+        return profile
+    try:
+        return STORAGE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown storage profile {profile!r}; expected one of {', '.join(STORAGE_PROFILES)}")
+
+
+def install_storage_profile(engine: Engine, profile: StorageProfile):
+    """Run the profile's pragmas on every connection the engine opens."""
+    statements = profile.pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
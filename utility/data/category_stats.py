@@ -0,0 +1,54 @@
+"""
+Check the category_stats counts against user_preference, and optionally rebuild them.
+
+category_stats is updated incrementally by the API's preference write paths and
+recomputed by the CSV loader. Rows written any other way (e.g. by hand in the
+sqlite3 shell) leave it out of date; this command finds and repairs that.
+
+Usage (from the project root):
+    python -m utility.data.category_stats            # report mismatches, exit 1 if any
+    python -m utility.data.category_stats --rebuild  # recompute the counts if they differ
+    python -m utility.data.category_stats --db data/News_Aggregator.db
+
+The database is opened with a bare app (see utility.data.migrate), without the
+API's startup work, and must already be migrated.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from utility.data.load_data import DEFAULT_DB_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify (and rebuild) the category_stats table.")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="SQLite database file")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute category_stats if it is out of date")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        parser.error(f"database not found: {args.db}")
+
+    from utility.data.migrate import create_migration_app
+    from api.services import verify_category_stats, rebuild_category_stats
+
+    with create_migration_app(args.db).app_context():
+        mismatches = verify_category_stats()
+        for row in mismatches:
+            print(f"Category {row['Category_ID']}: stored {row['Stored']}, expected {row['Expected']}")
+
+        if not mismatches:
+            print("category_stats is up to date")
+            return 0
+        if not args.rebuild:
+            print(f"{len(mismatches)} categor{'y' if len(mismatches) == 1 else 'ies'} out of date; "
+                  f"run with --rebuild to fix")
+            return 1
+
+        rebuild_category_stats()
+        print("category_stats rebuilt")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
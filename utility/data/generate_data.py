@@ -0,0 +1,400 @@
+"""
+Generate a synthetic News Aggregator database at a chosen scale.
+
+Scale 1 matches the shipped CSVs (1,000 users, about 4,000 preferences) plus
+ARTICLES_PER_SCALE articles; scale 2500 gives about 2.5M users and 10M
+preferences. Output is deterministic for a given seed and scale.
+
+- Categories are the shipped ones. Their popularity follows a Zipf distribution
+  (exponent --zipf), ranked by how often users chose them in User_Preference.csv.
+- The number of preferences per user follows the histogram of User_Preference.csv.
+- User IDs use the XX-XXXXXXX format of User.generate_user_id; names are built
+  from the first and last names in User.csv.
+- Article bodies have log-normally distributed lengths and Zipf-distributed words
+  (the category descriptions' words first, then generated ones). A small share of
+  articles are lightly edited copies of earlier ones (syndicated stories), so
+  near-duplicate clustering has something to find.
+- Articles are published PUBLISHED_INTERVAL apart on average from PUBLISHED_START,
+  in Article_ID order give or take up to PUBLISHED_JITTER, so recency and
+  Article_ID order mostly agree without being the same.
+
+Rows are written with executemany in large transactions and the secondary
+indexes are created after the load. The app then finishes the database as it
+would at startup: migrations, the search indexes and the MinHash signatures.
+
+Usage (from the project root):
+    python -m utility.data.generate_data --scale 10
+    python -m utility.data.generate_data --scale 2500 --db data/large.db --force
+    python -m utility.data.generate_data --users 50000 --articles 200000 --seed 7
+"""
+import argparse
+import csv
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+
+from utility.config import DEFAULT_DATABASE_PATH
+from utility.data.load_data import DATA_DIR, category_key, connect, rebuild_category_stats
+from utility.helpers import content_hash, url_hash
+
+DEFAULT_SEED = 42
+USERS_PER_SCALE = 1000
+ARTICLES_PER_SCALE = 40
+DEFAULT_ZIPF_EXPONENT = 1.0
+# Rows per transaction
+CHUNK_SIZE = 50000
+
+VOCABULARY_SIZE = 5000
+WORD_ZIPF_EXPONENT = 1.05
+# Body length in words: log-normal around the median, clipped
+MEDIAN_BODY_WORDS = 350
+BODY_WORDS_SIGMA = 0.6
+MIN_BODY_WORDS, MAX_BODY_WORDS = 40, 2500
+# Share of body words drawn from the article's own category description
+CATEGORY_WORD_SHARE = 0.15
+# Share of articles that are edited copies of an earlier article
+DUPLICATE_RATE = 0.02
+DUPLICATE_EDIT_RATE = 0.05
+# Publication times: one article every PUBLISHED_INTERVAL on average, each moved by up to PUBLISHED_JITTER
+PUBLISHED_START = datetime(2024, 1, 1)
+PUBLISHED_INTERVAL = timedelta(minutes=1)
+PUBLISHED_JITTER = timedelta(minutes=30)
+
+OUTLETS = ("dailywire.example.com", "metro-news.example.org", "globalpost.example.net", "thecourier.example.com",
+           "newsdesk.example.io", "herald.example.co.uk")
+_SYLLABLES = ("ka", "lo", "mi", "ren", "tor", "va", "sel", "un", "dra", "pe", "qua", "sti", "mo", "ber", "li",
+              "an", "gro", "fe", "zu", "tal", "ni", "col", "ra", "ves")
+
+
+class Scale(NamedTuple):
+    users: int
+    articles: int
+
+
+def scale_size(scale: float) -> Scale:
+    return Scale(users=max(1, round(USERS_PER_SCALE * scale)), articles=max(0, round(ARTICLES_PER_SCALE * scale)))
+
+
+# ---------------------------------------------------------
+# Distributions from the shipped CSVs
+# ---------------------------------------------------------
+
+class SourceData(NamedTuple):
+    categories: List[Tuple[int, str, str]]
+    # Category_IDs, most popular first
+    popularity_order: List[int]
+    # Probability of a user having 0, 1, 2, ... preferences
+    preference_counts: np.ndarray
+    first_names: List[str]
+    last_names: List[str]
+
+
+def read_source_data(data_dir: Path = DATA_DIR) -> SourceData:
+    with open(data_dir / "Category.csv", newline="", encoding="utf-8") as file:
+        categories = [(category_key(row["Category_ID"]), row["Category"], row["Description"])
+                      for row in csv.DictReader(file)]
+    with open(data_dir / "User.csv", newline="", encoding="utf-8") as file:
+        users = list(csv.DictReader(file))
+    with open(data_dir / "User_Preference.csv", newline="", encoding="utf-8") as file:
+        preferences = list(csv.DictReader(file))
+
+    chosen = Counter(category_key(row["Category_ID"]) for row in preferences)
+    popularity_order = sorted((category_id for category_id, _, _ in categories),
+                              key=lambda category_id: (-chosen[category_id], category_id))
+
+    per_user = Counter(row["User_ID"] for row in preferences)
+    histogram = Counter(per_user.get(row["User_ID"], 0) for row in users)
+    counts = np.zeros(min(max(histogram) + 1, len(categories) + 1))
+    for count, users_with_count in histogram.items():
+        counts[min(count, len(categories))] += users_with_count
+
+    names = [row["Name"].split(" ", 1) for row in users]
+    return SourceData(
+        categories=categories,
+        popularity_order=popularity_order,
+        preference_counts=counts / counts.sum(),
+        first_names=sorted({name[0] for name in names}),
+        last_names=sorted({name[-1] for name in names}),
+    )
+
+
+def zipf_weights(count: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _sampler(rng: np.random.Generator, weights: np.ndarray):
+    """Draw positions with probability `weights`; the CDF is computed once, not per draw."""
+    cdf = np.cumsum(weights)
+    last = len(weights) - 1
+
+    def sample(count: int) -> np.ndarray:
+        return np.minimum(np.searchsorted(cdf, rng.random(count), side="right"), last)
+
+    return sample
+
+
+# ---------------------------------------------------------
+# Generators
+# ---------------------------------------------------------
+
+def generate_user_ids(rng: np.random.Generator, count: int) -> List[str]:
+    """`count` distinct IDs in User.generate_user_id's format (XX-XXXXXXX), in sorted order."""
+    # Prefixes 10-99 times numbers 1000000-9999999
+    values = np.sort(rng.choice(90 * 9000000, size=count, replace=False))
+    return [f"{10 + value // 9000000}-{1000000 + value % 9000000}" for value in values.tolist()]
+
+
+def sample_categories(rng: np.random.Generator, weights: np.ndarray, counts: np.ndarray) -> List[np.ndarray]:
+    """
+    For each entry of `counts`, that many distinct category positions drawn with
+    probability proportional to `weights` (Gumbel top-k).
+    """
+    keys = np.log(weights) + rng.gumbel(size=(len(counts), len(weights)))
+    order = np.argsort(-keys, axis=1)
+    return [row[:count] for row, count in zip(order, counts.tolist())]
+
+
+def build_vocabulary(rng: np.random.Generator, categories: List[Tuple[int, str, str]]) -> np.ndarray:
+    """Words of the category descriptions, then generated words, VOCABULARY_SIZE in all."""
+    words = []
+    for _, _, description in categories:
+        for word in re.findall(r"[a-z]{3,}", description.lower()):
+            if word not in words:
+                words.append(word)
+    seen = set(words)
+    while len(words) < VOCABULARY_SIZE:
+        word = "".join(rng.choice(_SYLLABLES, size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return np.array(words, dtype=object)
+
+
+class ArticleGenerator:
+    def __init__(self, rng: np.random.Generator, source: SourceData, category_weights: np.ndarray):
+        self.rng = rng
+        self.source = source
+        self.category_ids = source.popularity_order
+        self.sample_category = _sampler(rng, category_weights)
+        self.vocabulary = build_vocabulary(rng, source.categories)
+        self.sample_word = _sampler(rng, zipf_weights(len(self.vocabulary), WORD_ZIPF_EXPONENT))
+        slugs = {category_id: re.sub(r"[^a-z]+", "-", name.lower()).strip("-")
+                 for category_id, name, _ in source.categories}
+        self.slugs = slugs
+        self.category_words = {
+            category_id: np.array(re.findall(r"[a-z]{3,}", description.lower()), dtype=object)
+            for category_id, _, description in source.categories
+        }
+        # Recent articles per category, copied to make syndicated near-duplicates
+        self.recent = {category_id: [] for category_id in self.category_ids}
+
+    def _words(self, count: int, category_id: int) -> List[str]:
+        words = self.vocabulary[self.sample_word(count)]
+        local = self.category_words[category_id]
+        if len(local):
+            mask = self.rng.random(count) < CATEGORY_WORD_SHARE
+            words[mask] = local[self.rng.integers(0, len(local), size=int(mask.sum()))]
+        return words.tolist()
+
+    def _author(self) -> str:
+        first = self.source.first_names[self.rng.integers(len(self.source.first_names))]
+        last = self.source.last_names[self.rng.integers(len(self.source.last_names))]
+        return f"{first} {last}"
+
+    def generate(self, number: int) -> tuple:
+        """
+        The article row (Title, Content, Category_ID, URL, Authors, URL_Hash, Content_Hash,
+        Published_At) for `number`.
+        """
+        category_id = self.category_ids[int(self.sample_category(1)[0])]
+        recent = self.recent[category_id]
+
+        if recent and self.rng.random() < DUPLICATE_RATE:
+            title, body = recent[self.rng.integers(len(recent))]
+            body = list(body)
+            edits = self.rng.random(len(body)) < DUPLICATE_EDIT_RATE
+            replacements = iter(self._words(int(edits.sum()), category_id))
+            body = [next(replacements) if edited else word for word, edited in zip(body, edits.tolist())]
+        else:
+            length = int(np.clip(self.rng.lognormal(np.log(MEDIAN_BODY_WORDS), BODY_WORDS_SIGMA),
+                                 MIN_BODY_WORDS, MAX_BODY_WORDS))
+            title = " ".join(self._words(int(self.rng.integers(5, 15)), category_id)).capitalize()
+            body = self._words(length, category_id)
+            recent.append((title, body))
+            if len(recent) > 50:
+                recent.pop(0)
+
+        content = " ".join(body).capitalize() + "."
+        slug = "-".join(title.lower().split()[:6])
+        url = f"https://{OUTLETS[number % len(OUTLETS)]}/{self.slugs[category_id]}/{number}-{slug}"
+        authors = ", ".join(self._author() for _ in range(1 if self.rng.random() < 0.8 else 2))
+        jitter = PUBLISHED_JITTER * (2 * self.rng.random() - 1)
+        published = PUBLISHED_START + PUBLISHED_INTERVAL * number + jitter
+        # The text form SQLAlchemy stores DateTime columns in, so SQL comparisons agree
+        published_at = published.strftime("%Y-%m-%d %H:%M:%S.%f")
+        return title, content, category_id, url, authors, url_hash(url), content_hash(content), published_at
+
+
+# ---------------------------------------------------------
+# Writing
+# ---------------------------------------------------------
+
+def _report(table: str, done: int, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"{table}: {done} rows ({done / elapsed if elapsed else 0:,.0f} rows/s)")
+
+
+def _drop_secondary_indexes(connection: sqlite3.Connection, tables: Tuple[str, ...]) -> List[str]:
+    """Drop the declared indexes of `tables` and return their CREATE statements."""
+    placeholders = ", ".join("?" for _ in tables)
+    indexes = connection.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({placeholders})", tables
+    ).fetchall()
+    with connection:
+        for name, _ in indexes:
+            connection.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def write_users(connection: sqlite3.Connection, rng: np.random.Generator, source: SourceData,
+                category_weights: np.ndarray, count: int) -> int:
+    """Insert `count` users and their preferences; returns the number of preferences."""
+    user_ids = generate_user_ids(rng, count)
+    category_ids = source.popularity_order
+    preferences = 0
+    started = time.perf_counter()
+
+    for start in range(0, count, CHUNK_SIZE):
+        chunk_ids = user_ids[start:start + CHUNK_SIZE]
+        firsts = rng.integers(len(source.first_names), size=len(chunk_ids)).tolist()
+        lasts = rng.integers(len(source.last_names), size=len(chunk_ids)).tolist()
+        users = []
+        for number, (user_id, first, last) in enumerate(zip(chunk_ids, firsts, lasts), start):
+            first, last = source.first_names[first], source.last_names[last]
+            email_name = re.sub(r"[^a-z]", "", f"{first[0]}{last}".lower())
+            users.append((user_id, f"{first} {last}", f"{email_name}{number}@example.com"))
+
+        counts = rng.choice(len(source.preference_counts), size=len(chunk_ids), p=source.preference_counts)
+        rows = [(user_id, str(category_ids[position]))
+                for user_id, positions in zip(chunk_ids, sample_categories(rng, category_weights, counts))
+                for position in sorted(positions.tolist())]
+
+        with connection:
+            connection.executemany('INSERT INTO "user" (User_ID, Name, Email) VALUES (?, ?, ?)', users)
+            connection.executemany("INSERT INTO user_preference (User_ID, Category_ID) VALUES (?, ?)", rows)
+        preferences += len(rows)
+        _report("user", start + len(chunk_ids), started)
+    print(f"user_preference: {preferences} rows")
+    return preferences
+
+
+def write_articles(connection: sqlite3.Connection, generator: ArticleGenerator, count: int):
+    started = time.perf_counter()
+    for start in range(0, count, CHUNK_SIZE):
+        rows = [generator.generate(number) for number in range(start + 1, min(start + CHUNK_SIZE, count) + 1)]
+        with connection:
+            connection.executemany(
+                "INSERT INTO article (Title, Content, Category_ID, URL, Authors, URL_Hash, Content_Hash, "
+                "Published_At) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        _report("article", start + len(rows), started)
+
+
+def finish_with_app(db_path: Path):
+    """Run the app's startup work: migrations, search indexes and MinHash signatures."""
+    from run import create_app
+    from api.models import db
+
+    started = time.perf_counter()
+    app = create_app({"DATABASE_PATH": db_path, "STORAGE_PROFILE": "bulk_load"})
+    with app.app_context():
+        db.engine.dispose()
+    print(f"Search indexes and article signatures built in {time.perf_counter() - started:,.1f}s")
+
+
+def generate(db_path: Path, users: int, articles: int, seed: int = DEFAULT_SEED,
+             zipf_exponent: float = DEFAULT_ZIPF_EXPONENT, data_dir: Path = DATA_DIR):
+    """
+    Write a synthetic database to `db_path`, which must not exist yet.
+
+    Args:
+        db_path (Path): Database file to create.
+        users (int): Number of users (preferences follow the CSV histogram).
+        articles (int): Number of articles.
+        seed (int): Random seed; the same seed and sizes give the same database.
+        zipf_exponent (float): Skew of category popularity (0 makes it uniform).
+        data_dir (Path): Directory holding the shipped CSVs the distributions come from.
+    """
+    if db_path.exists():
+        raise FileExistsError(f"{db_path} already exists")
+
+    started = time.perf_counter()
+    source = read_source_data(data_dir)
+    category_weights = zipf_weights(len(source.popularity_order), zipf_exponent)
+    # Separate streams, so changing the article count does not change the users
+    user_rng, article_rng = (np.random.default_rng([seed, stream]) for stream in (1, 2))
+
+    connection = connect(db_path)
+    try:
+        index_statements = _drop_secondary_indexes(connection, ("user", "user_preference", "article"))
+        with connection:
+            connection.executemany("INSERT INTO category (Category_ID, Category, Description) VALUES (?, ?, ?)",
+                                   source.categories)
+        write_users(connection, user_rng, source, category_weights, users)
+        write_articles(connection, ArticleGenerator(article_rng, source, category_weights), articles)
+
+        index_started = time.perf_counter()
+        with connection:
+            for statement in index_statements:
+                connection.execute(statement)
+        print(f"Indexes created in {time.perf_counter() - index_started:,.1f}s")
+        rebuild_category_stats(connection)
+        connection.execute("DROP TABLE IF EXISTS ingest_progress")
+    finally:
+        connection.close()
+
+    finish_with_app(db_path)
+    print(f"Generated {db_path} in {time.perf_counter() - started:,.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic News Aggregator database.")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DATABASE_PATH, help="SQLite database file to create")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"Scale factor: {USERS_PER_SCALE} users and {ARTICLES_PER_SCALE} articles per unit")
+    parser.add_argument("--users", type=int, default=None, help="Number of users (overrides --scale)")
+    parser.add_argument("--articles", type=int, default=None, help="Number of articles (overrides --scale)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Random seed")
+    parser.add_argument("--zipf", type=float, default=DEFAULT_ZIPF_EXPONENT,
+                        help="Zipf exponent of category popularity (0 for uniform)")
+    parser.add_argument("--force", action="store_true", help="Replace the database file if it exists")
+    args = parser.parse_args()
+
+    size = scale_size(args.scale)
+    users = size.users if args.users is None else args.users
+    articles = size.articles if args.articles is None else args.articles
+    if users < 1 or articles < 0:
+        parser.error("--users must be at least 1 and --articles at least 0")
+
+    if args.db.exists():
+        if not args.force:
+            print(f"{args.db} already exists; use --force to replace it")
+            return 1
+        for path in (args.db, args.db.with_name(args.db.name + "-wal"), args.db.with_name(args.db.name + "-shm")):
+            path.unlink(missing_ok=True)
+
+    print(f"Generating {users} users and {articles} articles into {args.db} (seed {args.seed})")
+    generate(args.db, users, articles, args.seed, args.zipf)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
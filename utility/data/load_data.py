@@ -1,15 +1,223 @@
+"""
+Load the CSV files in utility/data into the News Aggregator database.
+
+Each CSV is streamed in fixed-size chunks and upserted with executemany, one
+transaction per chunk, so memory use does not grow with the file size. Progress
+is recorded in the `ingest_progress` table in the same transaction as each chunk:
+an interrupted load resumes after the last committed chunk, and re-running a
+completed load is a no-op unless the file changed. Because rows are upserted,
+loading the same data twice never creates duplicates. When preferences were
+loaded, the `category_stats` counts are recomputed at the end.
+
+Usage (from the project root):
+    python -m utility.data.load_data
+    python -m utility.data.load_data --db data/News_Aggregator.db --chunk-size 50000 user_preference
+    python -m utility.data.load_data --restart
+"""
+import argparse
+import csv
+import re
 import sqlite3
+import time
+from itertools import islice
+from pathlib import Path
+from typing import NamedTuple, Tuple
+
+from utility.config import DEFAULT_DATABASE_PATH, STORAGE_PROFILES
+
+DATA_DIR = Path(__file__).parent
+DEFAULT_DB_PATH = DEFAULT_DATABASE_PATH
+DEFAULT_CHUNK_SIZE = 20000
+
+
+class TableSpec(NamedTuple):
+    csv_file: str
+    table: str
+    columns: Tuple[str, ...]
+    key: Tuple[str, ...]
+
+
+# Tables in load order (parents before children)
+TABLES = {
+    "category": TableSpec("Category.csv", "category", ("Category_ID", "Category", "Description"), ("Category_ID",)),
+    # User.csv also has a Password_hash column, deliberately not loaded: the API has no
+    # authentication, so nothing would use the hashes and storing them only adds exposure
+    "user": TableSpec("User.csv", "user", ("User_ID", "Name", "Email"), ("User_ID",)),
+    "user_preference": TableSpec("User_Preference.csv", "user_preference", ("User_ID", "Category_ID"),
+                                 ("User_ID", "Category_ID")),
+}
+
+PROGRESS_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_progress (
+    source TEXT PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    file_mtime REAL NOT NULL,
+    rows_done INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def category_key(value: str) -> int:
+    """
+    Convert a category code from the CSVs (e.g. 'ART101') to the integer Category_ID
+    used by the database (101). Plain integers are passed through.
+    """
+    match = re.search(r'(\d+)$', value.strip())
+    if not match:
+        raise ValueError(f'Invalid Category_ID: {value!r}')
+    return int(match.group(1))
+
+
+# Per-column conversions applied to CSV values before they are written
+CONVERTERS = {
+    ("category", "Category_ID"): category_key,
+    ("user_preference", "Category_ID"): category_key,
+}
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Open the database with settings suited to a bulk load and make sure the schema exists."""
+    # Create the application tables if this is a fresh database
+    from sqlalchemy import create_engine
+    from api.models import db
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    engine = create_engine(f'sqlite:///{db_path}')
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+    connection = sqlite3.connect(db_path)
+    for statement in STORAGE_PROFILES["bulk_load"].pragmas():
+        connection.execute(statement)
+    connection.execute(PROGRESS_DDL)
+    connection.commit()
+    return connection
+
+
+def _upsert_sql(spec: TableSpec, columns: Tuple[str, ...]) -> str:
+    placeholders = ", ".join("?" for _ in columns)
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    updates = [f'"{name}" = excluded."{name}"' for name in columns if name not in spec.key]
+    conflict = ", ".join(f'"{name}"' for name in spec.key)
+    action = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+    return f'INSERT INTO "{spec.table}" ({column_list}) VALUES ({placeholders}) ON CONFLICT ({conflict}) {action}'
+
+
+def load_table(connection: sqlite3.Connection, spec: TableSpec, data_dir: Path = DATA_DIR,
+               chunk_size: int = DEFAULT_CHUNK_SIZE, restart: bool = False) -> int:
+    """
+    Stream one CSV file into its table, resuming from the last committed chunk.
+
+    Args:
+        connection (sqlite3.Connection): Connection returned by connect().
+        spec (TableSpec): The file and table to load.
+        data_dir (Path): Directory holding the CSV files.
+        chunk_size (int): Rows per executemany/transaction.
+        restart (bool): Ignore saved progress and load the whole file again.
+
+    Returns:
+        int: Number of rows written by this call.
+    """
+    path = data_dir / spec.csv_file
+    stat = path.stat()
+
+    # Only load the CSV columns the table actually has (an older schema may lack some)
+    table_columns = {row[1] for row in connection.execute(f'PRAGMA table_info("{spec.table}")')}
+    skipped = [name for name in spec.columns if name not in table_columns]
+    if skipped:
+        print(f"{spec.table}: table has no column(s) {', '.join(skipped)}; they will not be loaded")
+
+    progress = connection.execute(
+        "SELECT file_size, file_mtime, rows_done, completed FROM ingest_progress WHERE source = ?",
+        (spec.csv_file,)
+    ).fetchone()
+
+    rows_done = 0
+    if progress and not restart and progress[:2] == (stat.st_size, stat.st_mtime):
+        if progress[3]:
+            print(f"{spec.table}: {spec.csv_file} already loaded ({progress[2]} rows), skipping")
+            return 0
+        rows_done = progress[2]
+        print(f"{spec.table}: resuming {spec.csv_file} after row {rows_done}")
+
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        positions = [header.index(name) for name in spec.columns if name in table_columns]
+        columns = tuple(header[position] for position in positions)
+        converters = [CONVERTERS.get((spec.table, name)) for name in columns]
+        sql = _upsert_sql(spec, columns)
+
+        # Skip rows already committed by an earlier run
+        for _ in islice(reader, rows_done):
+            pass
+
+        written = 0
+        started = time.perf_counter()
+        while True:
+            chunk = [
+                tuple(convert(row[position]) if convert else row[position]
+                      for position, convert in zip(positions, converters))
+                for row in islice(reader, chunk_size)
+            ]
+            completed = len(chunk) < chunk_size
+
+            with connection:
+                if chunk:
+                    connection.executemany(sql, chunk)
+                rows_done += len(chunk)
+                connection.execute(
+                    "INSERT INTO ingest_progress (source, file_size, file_mtime, rows_done, completed) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (source) DO UPDATE SET file_size = excluded.file_size, "
+                    "file_mtime = excluded.file_mtime, rows_done = excluded.rows_done, completed = excluded.completed",
+                    (spec.csv_file, stat.st_size, stat.st_mtime, rows_done, int(completed))
+                )
+
+            written += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"{spec.table}: {rows_done} rows ({written / elapsed if elapsed else 0:,.0f} rows/s)")
+
+            if completed:
+                return written
+
+
+def rebuild_category_stats(connection: sqlite3.Connection):
+    """Recompute the per-category preference counts after user_preference changed."""
+    from api.services import REBUILD_CATEGORY_STATS_SQL
+    with connection:
+        for statement in REBUILD_CATEGORY_STATS_SQL:
+            connection.execute(statement)
+    print("category_stats: rebuilt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the News Aggregator CSV files into the database.")
+    parser.add_argument("tables", nargs="*", help=f"Tables to load: {', '.join(TABLES)} (default: all)")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="SQLite database file")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Directory holding the CSV files")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and reload from the start")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.tables if name not in TABLES]
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(unknown)}")
+
+    connection = connect(args.db)
+    total, started = 0, time.perf_counter()
+    try:
+        for name in TABLES:
+            if not args.tables or name in args.tables:
+                written = load_table(connection, TABLES[name], args.data_dir, args.chunk_size, args.restart)
+                total += written
+                if name == "user_preference" and written:
+                    rebuild_category_stats(connection)
+    finally:
+        connection.close()
 
-with open(r"utility\data\News_Aggregator.db.sql", 'r', encoding="utf8") as sql_file:
-    sql_script = sql_file.read()
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
 
-db = sqlite3.connect('Test.db')
-cursor = db.cursor()
-cursor.executescript(sql_script)
-#db.commit()
-#db.close()
-result = cursor.execute('SELECT * from Article LIMIT 10')
-for row in result:
-    print(row)
-db.close()
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Bring a News Aggregator database up to the current schema.
+
+The API applies pending migrations at startup as well; this command does it
+without starting the server, shows which migrations a database has, and checks
+that the hot service queries are planned with indexes.
+
+Usage (from the project root):
+    python -m utility.data.migrate                 # create missing tables, apply pending migrations
+    python -m utility.data.migrate --status        # list migrations without applying anything
+    python -m utility.data.migrate --check-plans   # exit 1 if a hot query would scan a whole table
+    python -m utility.data.migrate --rebuild-search  # rebuild the user name trigram index (after VACUUM)
+    python -m utility.data.migrate --db data/News_Aggregator.db
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from flask import Flask
+
+from api.models import db
+from api.migrations import MIGRATIONS, current_version, upgrade
+from utility.data.load_data import DEFAULT_DB_PATH
+
+
+def create_migration_app(db_path: Path) -> Flask:
+    """A bare app bound to `db_path`, without the API's startup work."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def print_status():
+    version = current_version()
+    print(f"Schema version {version}")
+    for item in MIGRATIONS:
+        state = "applied" if item.version <= version else "pending"
+        print(f"  {item.version:>3}  {state:<8} {item.description}")
+
+
+def check_plans() -> bool:
+    from api.query_plans import check_query_plans
+
+    passed = True
+    for name, plan, ok in check_query_plans():
+        print(f"{'ok  ' if ok else 'SCAN'}  {name}")
+        for detail in plan:
+            print(f"        {detail}")
+        passed = passed and ok
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the News Aggregator database.")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB_PATH, help="SQLite database file")
+    parser.add_argument("--status", action="store_true", help="List migrations and exit")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="Fail if EXPLAIN QUERY PLAN shows a table scan for a hot query")
+    parser.add_argument("--rebuild-search", action="store_true",
+                        help="Rebuild the user name trigram index from the user table")
+    args = parser.parse_args()
+
+    if not args.db.exists() and (args.status or args.check_plans or args.rebuild_search):
+        parser.error(f"database not found: {args.db}")
+
+    with create_migration_app(args.db).app_context():
+        if args.status:
+            print_status()
+            return 0
+        if args.check_plans:
+            return 0 if check_plans() else 1
+        if args.rebuild_search:
+            from api.services import init_user_name_search
+            init_user_name_search(rebuild=True)
+            print("user_name_trigram rebuilt")
+            return 0
+
+        args.db.parent.mkdir(parents=True, exist_ok=True)
+        db.create_all()
+        applied = upgrade()
+        for item in applied:
+            print(f"Applied {item.version}: {item.description}")
+        print(f"Schema version {current_version()}" + ("" if applied else " (already up to date)"))
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
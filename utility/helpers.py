@@ -1 +1,111 @@
 # Utility functions used across the project
+import base64
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+def encode_cursor(value) -> str:
+    """
+    Encode a keyset position (the last primary key of a page) as an opaque cursor.
+
+    Args:
+        value: The primary key value the next page should start after.
+
+    Returns:
+        str: A URL-safe token to hand back to clients as next_cursor.
+    """
+    payload = json.dumps([value], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, expected_type: type):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        token (str): The cursor sent by the client.
+        expected_type (type): The type of the primary key the cursor must hold.
+
+    Returns:
+        The primary key value the next page should start after.
+
+    Raises:
+        ValueError: If the token is malformed or holds the wrong kind of key.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        (value,) = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+    if type(value) is not expected_type:
+        raise ValueError('Invalid cursor')
+    return value
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO 8601 date or date-time, as sent in query strings and payloads.
+
+    Args:
+        value (str): e.g. '2024-05-01', '2024-05-01T12:30:00Z' or '2024-05-01T14:30:00+02:00'.
+
+    Returns:
+        datetime: The instant in UTC, without tzinfo (as Published_At is stored).
+        Values without an offset are taken to be UTC.
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 date or date-time.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f"Invalid timestamp {value!r}: expected an ISO 8601 date or date-time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def format_timestamp(value: datetime) -> str:
+    """Format a naive UTC datetime as ISO 8601 with a 'Z' suffix."""
+    return value.isoformat() + 'Z'
+
+
+# Query parameters that only identify where a click came from, not what was linked
+TRACKING_PARAMS = {'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'ref', 'cmpid', 'ocid'}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize an article URL so the same story always produces the same string.
+
+    The scheme and host are lower-cased (http and https are treated alike, 'www.' is
+    dropped), default ports, fragments, trailing slashes and tracking parameters
+    (utm_*, fbclid, ...) are removed, and the remaining query parameters are sorted.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+
+    path = re.sub(r'/{2,}', '/', parts.path).rstrip('/') or '/'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def url_hash(url: str) -> str:
+    """SHA-256 hex digest of the normalized URL."""
+    return hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 hex digest of the article body with runs of whitespace collapsed."""
+    return hashlib.sha256(' '.join(content.split()).encode('utf-8')).hexdigest()